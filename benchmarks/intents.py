@@ -0,0 +1,331 @@
+"""
+Сравнение полного и экономного (INTENTS_MODE=lean) режимов по памяти и событиям шлюза.
+
+Каждый режим запускается в отдельном процессе, так как режим читается при импорте бота.
+Процесс загружает в кэш одинаковые сервера и обрабатывает одинаковый поток событий шлюза.
+Discord присылает только события запрошенных intents, поэтому события остальных intents
+отбрасываются до обработки, а сервера приходят без участников и статусов, если они не запрошены.
+События разбираются парсерами py-cord и проходят через FununaNun.dispatch, как при работе со шлюзом.
+
+Запуск: python -m benchmarks.intents [--guilds 200] [--members 500] [--events 200000]
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+os.environ.setdefault("LAVALINK_PORT", "2333")
+os.environ.setdefault(
+    "STORAGE_PATH", os.path.join(tempfile.mkdtemp(), "intents.sqlite3")
+)
+
+MODES = ("full", "lean")
+BOT_ID = 1000000000000000001
+SNOWFLAKE_BASE = 1100000000000000000
+TIMESTAMP = "2024-01-01T00:00:00.000000+00:00"
+
+# событие -> (intent, доля в потоке событий)
+EVENTS = {
+    "PRESENCE_UPDATE": ("presences", 0.55),
+    "MESSAGE_CREATE": ("guild_messages", 0.15),
+    "TYPING_START": ("guild_typing", 0.1),
+    "MESSAGE_REACTION_ADD": ("guild_reactions", 0.07),
+    "GUILD_MEMBER_UPDATE": ("members", 0.05),
+    "VOICE_STATE_UPDATE": ("voice_states", 0.08),
+}
+
+
+def _user(user_id: int) -> dict:
+    return {
+        "id": str(user_id),
+        "username": f"user{user_id % 100000}",
+        "discriminator": "0",
+        "global_name": None,
+        "avatar": None,
+        "bot": user_id == BOT_ID,
+    }
+
+
+def _member(user_id: int) -> dict:
+    return {
+        "user": _user(user_id),
+        "roles": [],
+        "joined_at": TIMESTAMP,
+        "deaf": False,
+        "mute": False,
+        "nick": None,
+    }
+
+
+class SyntheticGuild:
+    """Сервер с текстовым и голосовым каналами и заданным количеством участников"""
+
+    def __init__(self, index: int, members: int):
+        self.id = SNOWFLAKE_BASE + index * 100_000
+        self.text_channel_id = self.id + 1
+        self.voice_channel_id = self.id + 2
+        self.member_ids = [self.id + 10 + number for number in range(members)]
+
+    def voice_state(self, user_id: int, channel_id) -> dict:
+        return {
+            "guild_id": str(self.id),
+            "user_id": str(user_id),
+            "channel_id": str(channel_id) if channel_id else None,
+            "session_id": f"session-{user_id}",
+            "deaf": False,
+            "mute": False,
+            "self_deaf": False,
+            "self_mute": False,
+            "self_video": False,
+            "suppress": False,
+            "request_to_speak_timestamp": None,
+            "member": _member(user_id),
+        }
+
+    def data(self, intents) -> dict:
+        """GUILD_CREATE в том виде, в котором Discord присылает его при этих intents"""
+        # в голосовом канале каждый двадцатый участник
+        voice_ids = self.member_ids[::20]
+        if intents.members:
+            member_ids = self.member_ids
+        else:
+            member_ids = voice_ids
+        presences = []
+        if intents.presences:
+            presences = [
+                {
+                    "user": {"id": str(user_id)},
+                    "status": "online",
+                    "activities": [],
+                    "client_status": {"desktop": "online"},
+                }
+                for user_id in self.member_ids[::3]
+            ]
+        return {
+            "id": str(self.id),
+            "name": f"Сервер {self.id}",
+            "owner_id": str(self.member_ids[0]),
+            "roles": [
+                {
+                    "id": str(self.id),
+                    "name": "@everyone",
+                    "permissions": "8",
+                    "position": 0,
+                    "color": 0,
+                    "hoist": False,
+                    "managed": False,
+                    "mentionable": False,
+                }
+            ],
+            "emojis": [],
+            "stickers": [],
+            "features": [],
+            "channels": [
+                {
+                    "id": str(self.text_channel_id),
+                    "type": 0,
+                    "name": "общий",
+                    "position": 0,
+                    "permission_overwrites": [],
+                },
+                {
+                    "id": str(self.voice_channel_id),
+                    "type": 2,
+                    "name": "Голосовой",
+                    "position": 1,
+                    "bitrate": 64000,
+                    "user_limit": 0,
+                    "permission_overwrites": [],
+                },
+            ],
+            "members": [_member(BOT_ID)] + [_member(user_id) for user_id in member_ids],
+            "presences": presences,
+            "voice_states": [
+                self.voice_state(user_id, self.voice_channel_id)
+                for user_id in voice_ids
+            ],
+            "member_count": len(self.member_ids) + 1,
+            "large": len(self.member_ids) > 250,
+        }
+
+    def event(self, name: str, number: int, rng: random.Random) -> dict:
+        user_id = rng.choice(self.member_ids)
+        guild_id = str(self.id)
+        if name == "PRESENCE_UPDATE":
+            return {
+                "user": {"id": str(user_id)},
+                "guild_id": guild_id,
+                "status": rng.choice(("online", "idle", "dnd")),
+                "activities": [],
+                "client_status": {"desktop": "online"},
+            }
+        if name == "MESSAGE_CREATE":
+            return {
+                "id": str(self.id + 50_000 + number),
+                "channel_id": str(self.text_channel_id),
+                "guild_id": guild_id,
+                "author": _user(user_id),
+                "member": _member(user_id),
+                "content": f"сообщение {number}",
+                "timestamp": TIMESTAMP,
+                "edited_timestamp": None,
+                "tts": False,
+                "mention_everyone": False,
+                "mentions": [],
+                "mention_roles": [],
+                "attachments": [],
+                "embeds": [],
+                "pinned": False,
+                "type": 0,
+            }
+        if name == "TYPING_START":
+            return {
+                "channel_id": str(self.text_channel_id),
+                "guild_id": guild_id,
+                "user_id": str(user_id),
+                "timestamp": int(time.time()),
+                "member": _member(user_id),
+            }
+        if name == "MESSAGE_REACTION_ADD":
+            return {
+                "user_id": str(user_id),
+                "channel_id": str(self.text_channel_id),
+                "message_id": str(self.id + 50_000),
+                "guild_id": guild_id,
+                "emoji": {"id": None, "name": "👍"},
+                "member": _member(user_id),
+                "burst": False,
+                "type": 0,
+            }
+        if name == "GUILD_MEMBER_UPDATE":
+            member = _member(user_id)
+            member["guild_id"] = guild_id
+            member["nick"] = f"ник {number}"
+            return member
+        # заход в голосовой канал или выход из него
+        channel = self.voice_channel_id if number % 2 else None
+        return self.voice_state(user_id, channel)
+
+
+def _rss() -> int:
+    import psutil
+
+    return psutil.Process().memory_info().rss
+
+
+async def run_mode(args: argparse.Namespace) -> Dict[str, float]:
+    import discord
+
+    from bot.models import FununaNun
+
+    bot = FununaNun(shard_count=1, shard_ids=[0])
+    state = bot._connection
+    state.user = discord.ClientUser(state=state, data=_user(BOT_ID))
+    intents = bot.intents
+    rng = random.Random(args.seed)
+
+    guilds = [SyntheticGuild(index, args.members) for index in range(args.guilds)]
+    gc.collect()
+    rss_start = _rss()
+    for guild in guilds:
+        state._add_guild(discord.Guild(data=guild.data(intents), state=state))
+    gc.collect()
+    rss_guilds = _rss()
+
+    names = list(EVENTS)
+    weights = [share for _, share in EVENTS.values()]
+    generated = 0
+    received = 0
+    started = time.perf_counter()
+    for number in range(args.events):
+        name = rng.choices(names, weights)[0]
+        generated += 1
+        # Discord не присылает события intents, которые бот не запросил
+        if not getattr(intents, EVENTS[name][0]):
+            continue
+        data = rng.choice(guilds).event(name, number, rng)
+        received += 1
+        bot.dispatch("socket_event_type", name)
+        state.parsers[name](data)
+        if number % 1000 == 0:
+            # даем выполниться задачам слушателей, как между сообщениями шлюза
+            await asyncio.sleep(0)
+    duration = time.perf_counter() - started
+    gc.collect()
+    rss_events = _rss()
+
+    return {
+        "mode": bot.intents_mode,
+        "events_generated": generated,
+        "events_received": received,
+        "processing_seconds": round(duration, 3),
+        "events_per_second": round(received / duration) if duration else 0,
+        "rss_guilds_mb": round((rss_guilds - rss_start) / 2**20, 1),
+        "rss_total_mb": round((rss_events - rss_start) / 2**20, 1),
+        "cached_users": len(state._users),
+        "cached_members": sum(len(guild._members) for guild in state._guilds.values()),
+        "cached_messages": len(state._messages or ()),
+    }
+
+
+def _table(results: List[dict]):
+    rows = (
+        ("events_received", "Событий получено"),
+        ("processing_seconds", "Время обработки, с"),
+        ("events_per_second", "Событий в секунду"),
+        ("rss_guilds_mb", "Память серверов, МБ"),
+        ("rss_total_mb", "Память после событий, МБ"),
+        ("cached_users", "Пользователей в кэше"),
+        ("cached_members", "Участников в кэше"),
+        ("cached_messages", "Сообщений в кэше"),
+    )
+    print(f"{'':<28}" + "".join(f"{result['mode']:>14}" for result in results))
+    for key, title in rows:
+        print(f"{title:<28}" + "".join(f"{result[key]:>14}" for result in results))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--guilds", type=int, default=200)
+    parser.add_argument("--members", type=int, default=500)
+    parser.add_argument("--events", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="Файл для отчета в JSON")
+    args = parser.parse_args()
+
+    if args.mode:
+        # дочерний процесс одного режима
+        print(json.dumps(asyncio.run(run_mode(args))))
+        return
+
+    results = []
+    for mode in MODES:
+        completed = subprocess.run(
+            [sys.executable, "-m", "benchmarks.intents", "--mode", mode]
+            + ["--guilds", str(args.guilds), "--members", str(args.members)]
+            + ["--events", str(args.events), "--seed", str(args.seed)],
+            env={**os.environ, "INTENTS_MODE": mode, "METRICS_ENABLED": "0"},
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+    _table(results)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
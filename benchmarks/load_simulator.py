@@ -0,0 +1,890 @@
+"""
+Нагрузочный прогон модуля музыки без Discord и Lavalink.
+
+В отдельном процессе поднимаются поддельные Lavalink (REST поиска, декодирования и плееров,
+вебсокет с событиями TrackStart и TrackEnd) и REST Discord. Бот работает в текущем процессе
+как обычно, только шлюз Discord заменен: на изменение голосового состояния он сразу отвечает
+событиями голосового состояния и голосового сервера. На каждом из симулированных серверов
+выполняется /play, затем нажимаются кнопки сообщения с текущим треком и вызывается /skip.
+
+В конце выводится отчет в JSON: пропускная способность, p50/p99 времени обработки
+взаимодействий, запросы к REST на один запущенный трек и пиковый RSS процесса бота.
+
+Запуск: python -m benchmarks.load_simulator [--guilds 1000] [--output report.json]
+"""
+
+import argparse
+import asyncio
+import base64
+import collections
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import random
+import re
+import resource
+import tempfile
+import time
+from typing import Counter, Dict, List, Optional, Tuple
+
+os.environ.setdefault("LAVALINK_PORT", "2333")
+os.environ.setdefault(
+    "STORAGE_PATH", os.path.join(tempfile.mkdtemp(), "simulator.sqlite3")
+)
+
+import aiohttp  # noqa: E402
+import discord  # noqa: E402
+import discord.webhook.async_  # noqa: E402
+import wavelink  # noqa: E402
+from aiohttp import web  # noqa: E402
+
+from bot.models import FununaNun  # noqa: E402
+
+LAVALINK_PASSWORD = "simulator"
+BOT_USER = {
+    "id": "1000000000000000001",
+    "username": "fununa-nun",
+    "discriminator": "0",
+    "global_name": None,
+    "avatar": None,
+    "bot": True,
+}
+# у ботов ID приложения совпадает с ID пользователя
+APPLICATION_ID = BOT_USER["id"]
+SNOWFLAKE_BASE = 1100000000000000000
+
+# действия пользователей после /play и их вероятности
+ACTIONS = (
+    ("button", "current_track:play_pause"),
+    ("button", "current_track:volume_up"),
+    ("button", "current_track:volume_down"),
+    ("button", "current_track:shuffle"),
+    ("button", "current_track:next"),
+    ("command", "skip"),
+)
+
+_logger = logging.getLogger("simulator")
+
+
+def _json_response(data) -> web.Response:
+    # discord.py разбирает JSON, только если Content-Type указан без кодировки
+    return web.Response(
+        body=json.dumps(data).encode(), headers={"Content-Type": "application/json"}
+    )
+
+
+def make_track(identifier: str) -> dict:
+    """Трек в формате Lavalink, однозначно определяемый идентификатором"""
+    number = int(identifier, 36) if identifier.isalnum() else len(identifier)
+    return {
+        "encoded": base64.b64encode(identifier.encode()).decode(),
+        "info": {
+            "identifier": identifier,
+            "isSeekable": True,
+            "author": f"Исполнитель {number % 500}",
+            "length": 120_000 + number % 300_000,
+            "isStream": False,
+            "position": 0,
+            "title": f"Трек {identifier}",
+            "uri": f"https://www.youtube.com/watch?v={identifier}",
+            "artworkUrl": f"https://i.ytimg.com/vi/{identifier}/hqdefault.jpg",
+            "isrc": None,
+            "sourceName": "youtube",
+        },
+        "pluginInfo": {},
+        "userData": {},
+    }
+
+
+def decode_track(encoded: str) -> dict:
+    return make_track(base64.b64decode(encoded).decode())
+
+
+class FakeLavalink:
+    """
+    Lavalink v4, который ничего не воспроизводит.
+
+    Трек "играет" track_seconds секунд, после чего в вебсокет отправляется TrackEndEvent
+    """
+
+    def __init__(self, track_seconds: float, playlist_size: int):
+        self.track_seconds = track_seconds
+        self.playlist_size = playlist_size
+        self.calls: Counter[str] = collections.Counter()
+        self.tracks_started = 0
+        self.players: Dict[str, dict] = dict()
+        self.sockets: List[web.WebSocketResponse] = list()
+        self.started_at = time.monotonic()
+
+    def application(self) -> web.Application:
+        app = web.Application(middlewares=[self.count])
+        app.router.add_get("/v4/websocket", self.websocket)
+        app.router.add_get("/v4/info", self.info)
+        app.router.add_get("/v4/stats", self.stats)
+        app.router.add_get("/version", self.version)
+        app.router.add_get("/v4/loadtracks", self.load_tracks)
+        app.router.add_get("/v4/decodetrack", self.decode_track)
+        app.router.add_post("/v4/decodetracks", self.decode_tracks)
+        app.router.add_patch("/v4/sessions/{session}", self.update_session)
+        app.router.add_get("/v4/sessions/{session}/players", self.get_players)
+        app.router.add_patch(
+            "/v4/sessions/{session}/players/{guild}", self.update_player
+        )
+        app.router.add_delete(
+            "/v4/sessions/{session}/players/{guild}", self.destroy_player
+        )
+        app.router.add_get("/_stats", self.report)
+        return app
+
+    @web.middleware
+    async def count(self, request: web.Request, handler):
+        if not request.path.startswith("/_"):
+            route = request.match_info.route.resource
+            self.calls[
+                f"{request.method} {route.canonical if route else request.path}"
+            ] += 1
+        return await handler(request)
+
+    async def websocket(self, request: web.Request) -> web.WebSocketResponse:
+        socket = web.WebSocketResponse()
+        await socket.prepare(request)
+        self.sockets.append(socket)
+        await socket.send_json(
+            {"op": "ready", "resumed": False, "sessionId": "simulator"}
+        )
+        async for _ in socket:
+            pass
+        self.sockets.remove(socket)
+        return socket
+
+    def _send(self, data: dict):
+        for socket in self.sockets:
+            asyncio.create_task(socket.send_json(data))
+
+    def _event(self, guild_id: str, event: str, **fields):
+        self._send({"op": "event", "type": event, "guildId": guild_id, **fields})
+
+    async def info(self, request: web.Request) -> web.Response:
+        return _json_response(
+            {
+                "version": {
+                    "semver": "4.0.0",
+                    "major": 4,
+                    "minor": 0,
+                    "patch": 0,
+                    "preRelease": None,
+                    "build": None,
+                },
+                "buildTime": 0,
+                "git": {"branch": "main", "commit": "simulator", "commitTime": 0},
+                "jvm": "17",
+                "lavaplayer": "2.0.0",
+                "sourceManagers": ["youtube", "yandexmusic"],
+                "filters": ["volume", "equalizer", "timescale"],
+                "plugins": [],
+            }
+        )
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return _json_response(
+            {
+                "players": len(self.players),
+                "playingPlayers": sum(
+                    1 for player in self.players.values() if player["track"]
+                ),
+                "uptime": int((time.monotonic() - self.started_at) * 1000),
+                "memory": {
+                    "free": 1 << 28,
+                    "used": 1 << 28,
+                    "allocated": 1 << 29,
+                    "reservable": 1 << 30,
+                },
+                "cpu": {"cores": 4, "systemLoad": 0.1, "lavalinkLoad": 0.05},
+                "frameStats": None,
+            }
+        )
+
+    async def version(self, request: web.Request) -> web.Response:
+        return web.Response(text="4.0.0")
+
+    async def update_session(self, request: web.Request) -> web.Response:
+        return _json_response(await request.json())
+
+    async def load_tracks(self, request: web.Request) -> web.Response:
+        identifier = request.query.get("identifier", "")
+        video = re.search(r"[?&]v=([\w-]+)", identifier)
+        playlist = re.search(r"[?&]list=([\w-]+)", identifier)
+        if playlist:
+            # рекомендации YouTube Music тоже приходят плейлистом
+            size = self.playlist_size if "/playlist" in identifier else 10
+            name = playlist.group(1)
+            return _json_response(
+                {
+                    "loadType": "playlist",
+                    "data": {
+                        "info": {"name": f"Плейлист {name}", "selectedTrack": -1},
+                        "pluginInfo": {},
+                        "tracks": [
+                            make_track(f"{name[-6:]}{index:05d}")
+                            for index in range(size)
+                        ],
+                    },
+                }
+            )
+        if video:
+            return _json_response(
+                {"loadType": "track", "data": make_track(video.group(1))}
+            )
+        query = identifier.partition(":")[2] or identifier
+        seed = abs(hash(query)) % 10**6
+        return _json_response(
+            {
+                "loadType": "search",
+                "data": [make_track(f"s{seed:06d}{index:02d}") for index in range(5)],
+            }
+        )
+
+    async def decode_track(self, request: web.Request) -> web.Response:
+        return _json_response(decode_track(request.query["encodedTrack"]))
+
+    async def decode_tracks(self, request: web.Request) -> web.Response:
+        return _json_response([decode_track(code) for code in await request.json()])
+
+    async def get_players(self, request: web.Request) -> web.Response:
+        return _json_response(
+            [self._player_json(guild, player) for guild, player in self.players.items()]
+        )
+
+    @staticmethod
+    def _player_json(guild_id: str, player: dict) -> dict:
+        return {
+            "guildId": guild_id,
+            "track": player["track"],
+            "volume": player["volume"],
+            "paused": player["paused"],
+            "state": {
+                "time": int(time.time() * 1000),
+                "position": 0,
+                "connected": True,
+                "ping": 1,
+            },
+            "voice": player["voice"],
+            "filters": player["filters"],
+        }
+
+    def _schedule_end(self, guild_id: str, player: dict):
+        loop = asyncio.get_running_loop()
+        player["ends_at"] = loop.time() + player["remaining"]
+        player["timer"] = loop.call_later(
+            player["remaining"], self._end, guild_id, "finished"
+        )
+
+    def _cancel_end(self, player: dict):
+        if player["timer"] is not None:
+            player["timer"].cancel()
+            player["timer"] = None
+            player["remaining"] = max(
+                player["ends_at"] - asyncio.get_running_loop().time(), 0
+            )
+
+    def _end(self, guild_id: str, reason: str):
+        player = self.players.get(guild_id)
+        if player is None or player["track"] is None:
+            return
+        self._cancel_end(player)
+        self._event(guild_id, "TrackEndEvent", track=player["track"], reason=reason)
+        player["track"] = None
+
+    async def update_player(self, request: web.Request) -> web.Response:
+        guild_id = request.match_info["guild"]
+        body = await request.json()
+        no_replace = request.query.get("noReplace", "false").lower() == "true"
+        player = self.players.setdefault(
+            guild_id,
+            {
+                "track": None,
+                "paused": False,
+                "volume": 100,
+                "voice": {},
+                "filters": {},
+                "timer": None,
+                "ends_at": 0.0,
+                "remaining": self.track_seconds,
+            },
+        )
+        player["voice"] = body.get("voice", player["voice"])
+        player["volume"] = body.get("volume", player["volume"])
+        player["filters"] = body.get("filters", player["filters"])
+
+        track = body.get("track")
+        if track is not None and "encoded" in track:
+            if track["encoded"] is None:
+                self._end(guild_id, "stopped")
+            elif not (no_replace and player["track"]):
+                self._end(guild_id, "replaced")
+                player["track"] = decode_track(track["encoded"])
+                player["track"]["userData"] = track.get("userData") or {}
+                player["remaining"] = self.track_seconds
+                player["paused"] = body.get("paused", player["paused"])
+                self.tracks_started += 1
+                self._event(guild_id, "TrackStartEvent", track=player["track"])
+                if not player["paused"]:
+                    self._schedule_end(guild_id, player)
+        elif "paused" in body and body["paused"] != player["paused"]:
+            player["paused"] = body["paused"]
+            if player["paused"]:
+                self._cancel_end(player)
+            elif player["track"] is not None:
+                self._schedule_end(guild_id, player)
+
+        return _json_response(self._player_json(guild_id, player))
+
+    async def destroy_player(self, request: web.Request) -> web.Response:
+        player = self.players.pop(request.match_info["guild"], None)
+        if player is not None:
+            self._cancel_end(player)
+        return web.Response(status=204)
+
+    async def report(self, request: web.Request) -> web.Response:
+        return _json_response(
+            {"calls": dict(self.calls), "tracks_started": self.tracks_started}
+        )
+
+
+class FakeDiscord:
+    """REST Discord: отвечает на создание и редактирование сообщений и на ответы на взаимодействия"""
+
+    def __init__(self):
+        self.calls: Counter[str] = collections.Counter()
+        self._ids = itertools.count(SNOWFLAKE_BASE + 10**15)
+
+    def application(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/_stats", self.report)
+        app.router.add_route("*", "/api/v10/{path:.*}", self.handle)
+        return app
+
+    @staticmethod
+    def _route(path: str) -> str:
+        route = re.sub(r"/\d+", "/{id}", "/" + path)
+        return re.sub(
+            r"^/(interactions|webhooks)/\{id\}/[^/]+", r"/\1/{id}/{token}", route
+        )
+
+    def _message(self, message_id: str, channel_id: str, body: dict) -> dict:
+        return {
+            "id": message_id,
+            "channel_id": channel_id,
+            "type": 0,
+            "author": BOT_USER,
+            "content": body.get("content") or "",
+            "timestamp": "2024-01-01T00:00:00.000000+00:00",
+            "edited_timestamp": None,
+            "tts": False,
+            "mention_everyone": False,
+            "mentions": [],
+            "mention_roles": [],
+            "attachments": [],
+            "embeds": body.get("embeds") or [],
+            "components": body.get("components") or [],
+            "pinned": False,
+            "flags": body.get("flags") or 0,
+        }
+
+    async def handle(self, request: web.Request) -> web.Response:
+        path = request.match_info["path"]
+        self.calls[f"{request.method} {self._route(path)}"] += 1
+        if path == "users/@me":
+            return _json_response(BOT_USER)
+        if (
+            request.method == "DELETE"
+            or path.endswith("/callback")
+            or path.endswith("/voice-status")
+        ):
+            return web.Response(status=204)
+
+        body = dict()
+        if request.content_type == "application/json":
+            body = await request.json()
+        elif request.content_type.startswith("multipart/"):
+            form = await request.post()
+            body = json.loads(form.get("payload_json") or "{}")
+        channel = re.search(r"channels/(\d+)", path)
+        message = re.search(r"messages/(\d+)", path)
+        return _json_response(
+            self._message(
+                message.group(1) if message else str(next(self._ids)),
+                channel.group(1) if channel else "1",
+                body,
+            )
+        )
+
+    async def report(self, request: web.Request) -> web.Response:
+        return _json_response({"calls": dict(self.calls)})
+
+
+async def _serve_fakes(connection, track_seconds: float, playlist_size: int):
+    ports = []
+    for fake in (FakeLavalink(track_seconds, playlist_size), FakeDiscord()):
+        runner = web.AppRunner(fake.application(), access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        ports.append(site._server.sockets[0].getsockname()[1])
+    connection.send(ports)
+    # процесс завершается родителем
+    await asyncio.Event().wait()
+
+
+def run_fakes(connection, track_seconds: float, playlist_size: int):
+    asyncio.run(_serve_fakes(connection, track_seconds, playlist_size))
+
+
+class FakeGateway:
+    """
+    Шлюз Discord, который не подключается к Discord.
+
+    Запрос на вход в голосовой канал сразу подтверждается событиями VOICE_STATE_UPDATE
+    и VOICE_SERVER_UPDATE, как это сделал бы Discord
+    """
+
+    def __init__(self, state):
+        self.state = state
+
+    def __call__(self, *args, **kwargs) -> "FakeGateway":
+        return self
+
+    async def voice_state(
+        self, guild_id: int, channel_id: Optional[int], self_mute=False, self_deaf=False
+    ):
+        data = {
+            "guild_id": str(guild_id),
+            "channel_id": str(channel_id) if channel_id else None,
+            "user_id": BOT_USER["id"],
+            "session_id": f"voice-{guild_id}",
+            "deaf": False,
+            "mute": False,
+            "self_deaf": self_deaf,
+            "self_mute": self_mute,
+            "self_video": False,
+            "suppress": False,
+            "request_to_speak_timestamp": None,
+        }
+        asyncio.get_running_loop().call_soon(self._deliver, data)
+
+    def _deliver(self, data: dict):
+        self.state.parse_voice_state_update(data)
+        if data["channel_id"]:
+            self.state.parse_voice_server_update(
+                {
+                    "guild_id": data["guild_id"],
+                    "token": "simulator",
+                    "endpoint": "voice.simulator.invalid:443",
+                }
+            )
+
+
+class SimulatedGuild:
+    __slots__ = ("index", "id", "text_channel_id", "voice_channel_id", "user_id")
+
+    def __init__(self, index: int):
+        self.index = index
+        self.id = SNOWFLAKE_BASE + index * 10
+        self.text_channel_id = self.id + 1
+        self.voice_channel_id = self.id + 2
+        self.user_id = self.id + 3
+
+    def _member(self, user_id: int) -> dict:
+        return {
+            "user": {
+                "id": str(user_id),
+                "username": f"user{self.index}",
+                "discriminator": "0",
+                "global_name": None,
+                "avatar": None,
+            },
+            "roles": [],
+            "joined_at": "2024-01-01T00:00:00.000000+00:00",
+            "deaf": False,
+            "mute": False,
+            "permissions": "8",
+        }
+
+    def data(self) -> dict:
+        bot_member = self._member(int(BOT_USER["id"]))
+        bot_member["user"] = BOT_USER
+        return {
+            "id": str(self.id),
+            "name": f"Сервер {self.index}",
+            "owner_id": str(self.user_id),
+            "roles": [
+                {
+                    "id": str(self.id),
+                    "name": "@everyone",
+                    "permissions": "8",
+                    "position": 0,
+                    "color": 0,
+                    "hoist": False,
+                    "managed": False,
+                    "mentionable": False,
+                }
+            ],
+            "emojis": [],
+            "stickers": [],
+            "features": [],
+            "channels": [
+                {
+                    "id": str(self.text_channel_id),
+                    "type": 0,
+                    "name": "музыка",
+                    "position": 0,
+                    "permission_overwrites": [],
+                },
+                {
+                    "id": str(self.voice_channel_id),
+                    "type": 2,
+                    "name": "Голосовой",
+                    "position": 1,
+                    "bitrate": 64000,
+                    "user_limit": 0,
+                    "permission_overwrites": [],
+                },
+            ],
+            "members": [bot_member, self._member(self.user_id)],
+            "voice_states": [
+                {
+                    "user_id": str(self.user_id),
+                    "channel_id": str(self.voice_channel_id),
+                    "session_id": f"user-{self.id}",
+                    "deaf": False,
+                    "mute": False,
+                    "self_deaf": False,
+                    "self_mute": False,
+                    "self_video": False,
+                    "suppress": False,
+                    "request_to_speak_timestamp": None,
+                }
+            ],
+            "member_count": 2,
+            "large": False,
+        }
+
+    def interaction(self, interaction_id: int, interaction_type: int, data: dict):
+        return {
+            "id": str(interaction_id),
+            "application_id": APPLICATION_ID,
+            "type": interaction_type,
+            "token": f"token-{interaction_id}",
+            "version": 1,
+            "guild_id": str(self.id),
+            "channel_id": str(self.text_channel_id),
+            "member": self._member(self.user_id),
+            "app_permissions": "8",
+            "locale": "ru",
+            "guild_locale": "ru",
+            "data": data,
+        }
+
+
+def percentiles(values: List[float]) -> dict:
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+
+    def pick(fraction: float) -> float:
+        return round(values[min(int(len(values) * fraction), len(values) - 1)], 2)
+
+    return {
+        "count": len(values),
+        "p50_ms": pick(0.5),
+        "p99_ms": pick(0.99),
+        "max_ms": round(values[-1], 2),
+    }
+
+
+class Simulator:
+    """Отправляет боту взаимодействия от имени пользователей и замеряет время их обработки"""
+
+    def __init__(self, bot: FununaNun, args: argparse.Namespace):
+        self.bot = bot
+        self.args = args
+        self.music = bot.get_cog("Music")
+        self.latencies: Dict[str, List[float]] = collections.defaultdict(list)
+        self.failures: Counter[str] = collections.Counter()
+        self._pending: Dict[int, Tuple[str, float, asyncio.Future]] = dict()
+        self._ids = itertools.count(SNOWFLAKE_BASE + 10**16)
+        self._commands = {
+            command.name: command for command in bot.pending_application_commands
+        }
+        bot.add_listener(self.on_application_command_completion)
+        bot.add_listener(self.on_application_command_error)
+        self._instrument_views()
+
+    def _instrument_views(self):
+        """Замеряет обработку нажатий кнопок до завершения их callback"""
+        scheduled_task = discord.ui.View._scheduled_task
+        finish = self._finish
+
+        async def timed_task(view, item, interaction):
+            try:
+                await scheduled_task(view, item, interaction)
+            finally:
+                finish(interaction.id)
+
+        discord.ui.View._scheduled_task = timed_task
+
+    async def on_application_command_completion(self, ctx: discord.ApplicationContext):
+        self._finish(ctx.interaction.id)
+
+    async def on_application_command_error(
+        self, ctx: discord.ApplicationContext, error: discord.DiscordException
+    ):
+        _logger.warning(
+            f"/{ctx.command.qualified_name} failed: {getattr(error, 'original', error)!r}"
+        )
+        self._finish(ctx.interaction.id, failed=True)
+
+    def _finish(self, interaction_id: int, failed: bool = False):
+        pending = self._pending.pop(interaction_id, None)
+        if pending is None:
+            return
+        kind, started, future = pending
+        if failed:
+            self.failures[kind] += 1
+        else:
+            self.latencies[kind].append((time.perf_counter() - started) * 1000)
+        future.set_result(None)
+
+    async def _dispatch(self, kind: str, data: dict):
+        interaction_id = int(data["id"])
+        future = asyncio.get_running_loop().create_future()
+        self._pending[interaction_id] = (kind, time.perf_counter(), future)
+        self.bot._connection.parse_interaction_create(data)
+        try:
+            await asyncio.wait_for(future, timeout=self.args.timeout)
+        except asyncio.TimeoutError:
+            self._pending.pop(interaction_id, None)
+            self.failures[kind] += 1
+
+    async def command(self, guild: SimulatedGuild, name: str, **options):
+        command = self._commands[name]
+        data = {
+            "id": str(command.id),
+            "name": name,
+            "type": 1,
+            "options": [
+                {
+                    "name": key,
+                    "type": 5 if isinstance(value, bool) else 3,
+                    "value": value,
+                }
+                for key, value in options.items()
+            ],
+        }
+        await self._dispatch(f"/{name}", guild.interaction(next(self._ids), 2, data))
+
+    async def button(self, guild: SimulatedGuild, custom_id: str):
+        session = self.music.sessions.get(guild.id)
+        if session is None or session.announce_message is None:
+            self.failures[custom_id] += 1
+            return
+        message_id = session.announce_message.id
+        data = guild.interaction(
+            next(self._ids), 3, {"custom_id": custom_id, "component_type": 2}
+        )
+        data["message"] = FakeDiscord()._message(
+            str(message_id), str(guild.text_channel_id), {}
+        )
+        await self._dispatch(custom_id, data)
+
+    def _controls_ready(self, guild: SimulatedGuild) -> bool:
+        session = self.music.sessions.get(guild.id)
+        if session is None or session.announce_message is None:
+            return False
+        key = (2, session.announce_message.id, "current_track:next")
+        return key in self.bot._connection._view_store._views
+
+    async def wait_for_controls(self, guild: SimulatedGuild) -> bool:
+        """Ждет, пока у сообщения с текущим треком появятся кнопки"""
+        deadline = time.monotonic() + self.args.timeout
+        while time.monotonic() < deadline:
+            if self._controls_ready(guild):
+                return True
+            await asyncio.sleep(0.05)
+        self.failures["controls"] += 1
+        return False
+
+    async def run_guild(self, guild: SimulatedGuild, rng: random.Random):
+        await asyncio.sleep(rng.uniform(0, self.args.ramp))
+        if rng.random() < self.args.playlist_ratio:
+            query = f"https://www.youtube.com/playlist?list=PL{guild.index:08d}"
+        else:
+            query = f"https://www.youtube.com/watch?v=v{guild.index:09d}"
+        actions = [
+            asyncio.create_task(
+                self.command(guild, "play", query=query, provider="ytsearch")
+            )
+        ]
+        if await self.wait_for_controls(guild):
+            for _ in range(self.args.actions):
+                await asyncio.sleep(rng.uniform(0, 2 * self.args.think))
+                kind, name = rng.choice(ACTIONS)
+                if kind == "button":
+                    action = self.button(guild, name)
+                else:
+                    action = self.command(guild, name)
+                actions.append(asyncio.create_task(action))
+        await asyncio.gather(*actions)
+        await self.command(guild, "stop")
+        player = self.bot.get_guild(guild.id).voice_client
+        if player is not None:
+            await player.disconnect()
+
+
+async def _fetch_report(port: int) -> dict:
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f"http://127.0.0.1:{port}/_stats") as response:
+            return await response.json()
+
+
+def _use_fake_discord(port: int):
+    base = f"http://127.0.0.1:{port}/api/v10"
+    discord.http.Route.base = property(lambda route: base)
+    discord.webhook.async_.Route.base = property(lambda route: base)
+
+
+async def simulate(args: argparse.Namespace, lavalink_port: int, discord_port: int):
+    _use_fake_discord(discord_port)
+    os.environ["LAVALINK_NODES"] = f"{LAVALINK_PASSWORD}@127.0.0.1:{lavalink_port}"
+
+    bot = FununaNun(shard_count=1, shard_ids=[0])
+    bot.load_modules()
+    await bot.login("simulator")
+    bot._bind_command_ids(
+        {
+            bot._command_key(command): next_id
+            for next_id, command in enumerate(
+                bot.pending_application_commands, start=SNOWFLAKE_BASE + 10**14
+            )
+        }
+    )
+    bot._connection._get_websocket = FakeGateway(bot._connection)
+    guilds = [SimulatedGuild(index) for index in range(args.guilds)]
+    for guild in guilds:
+        bot._connection._add_guild(
+            discord.Guild(data=guild.data(), state=bot._connection)
+        )
+
+    bot.watchdog.start()
+    await bot.node_pool.connect()
+    while not bot.node_pool.connected_nodes:
+        await asyncio.sleep(0.05)
+
+    simulator = Simulator(bot, args)
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(simulator.run_guild(guild, random.Random(rng.random())) for guild in guilds)
+    )
+    duration = time.perf_counter() - started
+
+    lavalink = await _fetch_report(lavalink_port)
+    discord_api = await _fetch_report(discord_port)
+    await wavelink.Pool.close()
+    await bot.close()
+    # отложенные удаления сообщений и прочие задачи бота больше не нужны
+    remaining = asyncio.all_tasks() - {asyncio.current_task()}
+    for task in remaining:
+        task.cancel()
+    await asyncio.gather(*remaining, return_exceptions=True)
+
+    tracks = lavalink["tracks_started"]
+    all_latencies = list(itertools.chain.from_iterable(simulator.latencies.values()))
+    discord_calls = sum(discord_api["calls"].values())
+    lavalink_calls = sum(lavalink["calls"].values())
+    return {
+        "guilds": args.guilds,
+        "duration_seconds": round(duration, 2),
+        "interactions": len(all_latencies),
+        "failures": dict(simulator.failures),
+        "throughput_per_second": round(len(all_latencies) / duration, 2),
+        "latency": {
+            "all": percentiles(all_latencies),
+            **{
+                kind: percentiles(values)
+                for kind, values in sorted(simulator.latencies.items())
+            },
+        },
+        "tracks_started": tracks,
+        "rest": {
+            "discord_calls": discord_calls,
+            "lavalink_calls": lavalink_calls,
+            "discord_per_track": round(discord_calls / tracks, 2) if tracks else None,
+            "lavalink_per_track": round(lavalink_calls / tracks, 2) if tracks else None,
+            "discord_routes": dict(discord_api["calls"].items()),
+            "lavalink_routes": dict(lavalink["calls"].items()),
+        },
+        "loop": {
+            "max_lag_ms": round(bot.watchdog.max_lag * 1000, 2),
+            "stalls": bot.watchdog.stalls,
+        },
+        # ru_maxrss в Linux указывается в килобайтах
+        "peak_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--guilds", type=int, default=1000)
+    parser.add_argument(
+        "--actions", type=int, default=5, help="Действий на сервере после /play"
+    )
+    parser.add_argument(
+        "--think", type=float, default=1, help="Средняя пауза между действиями"
+    )
+    parser.add_argument(
+        "--ramp", type=float, default=10, help="За сколько секунд стартуют все серверы"
+    )
+    parser.add_argument("--track-seconds", type=float, default=5)
+    parser.add_argument("--playlist-ratio", type=float, default=0.1)
+    parser.add_argument("--playlist-size", type=int, default=120)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Файл для отчета, по умолчанию stdout")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    # поддельные серверы работают в отдельном процессе, чтобы не делить с ботом цикл событий и память
+    context = multiprocessing.get_context("fork")
+    parent_connection, child_connection = context.Pipe()
+    fakes = context.Process(
+        target=run_fakes,
+        args=(child_connection, args.track_seconds, args.playlist_size),
+        daemon=True,
+    )
+    fakes.start()
+    try:
+        lavalink_port, discord_port = parent_connection.recv()
+        report = asyncio.run(simulate(args, lavalink_port, discord_port))
+    finally:
+        fakes.terminate()
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
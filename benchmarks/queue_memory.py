@@ -0,0 +1,88 @@
+"""
+Сравнение памяти, занимаемой очередью из Playable и очередью из CompactTrack.
+
+Запуск: python -m benchmarks.queue_memory [--tracks 10000]
+"""
+
+import argparse
+import base64
+import gc
+import os
+import random
+import tracemalloc
+
+os.environ.setdefault("LAVALINK_PORT", "2333")
+
+import wavelink  # noqa: E402
+
+from bot.models.queue import TrackedQueue  # noqa: E402
+
+
+def make_payload(index: int, extras: dict) -> dict:
+    """Трек в том виде, в котором его возвращает Lavalink с плагином LavaSrc"""
+    identifier = f"{index:011d}"
+    return {
+        "encoded": base64.b64encode(random.randbytes(220)).decode(),
+        "info": {
+            "identifier": identifier,
+            "isSeekable": True,
+            "author": f"Исполнитель {index % 500}",
+            "length": random.randint(120_000, 420_000),
+            "isStream": False,
+            "position": 0,
+            "title": f"Название трека номер {index}",
+            "uri": f"https://music.yandex.ru/album/{index // 12}/track/{identifier}",
+            "artworkUrl": f"https://avatars.yandex.net/get-music-content/{identifier}/400x400",
+            "isrc": f"RUA{index:09d}",
+            "sourceName": "yandexmusic",
+        },
+        "pluginInfo": {
+            "albumName": f"Альбом {index // 12}",
+            "albumUrl": f"https://music.yandex.ru/album/{index // 12}",
+            "artistUrl": f"https://music.yandex.ru/artist/{index % 500}",
+            "artistArtworkUrl": f"https://avatars.yandex.net/get-music-content/artist/{index % 500}",
+            "previewUrl": f"https://music.yandex.ru/preview/{identifier}.mp3",
+            "isPreview": False,
+        },
+        "userData": extras,
+    }
+
+
+def measure(tracks: int, compact: bool) -> int:
+    random.seed(0)
+    extras = {
+        "requester": 335464992079872000,
+        "requester_name": "user",
+        "requester_avatar": "https://cdn.discordapp.com/embed/avatars/0.png",
+    }
+    gc.collect()
+    tracemalloc.start()
+    queue = TrackedQueue(compact=compact)
+    for index in range(tracks):
+        queue.put(wavelink.Playable(make_payload(index, extras)))
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del queue
+    return current
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tracks", type=int, default=10_000)
+    args = parser.parse_args()
+
+    playable = measure(args.tracks, compact=False)
+    compact = measure(args.tracks, compact=True)
+    print(f"Треков в очереди: {args.tracks}")
+    print(
+        f"Playable:     {playable / 2**20:8.2f} МБ ({playable / args.tracks:.0f} Б на трек)"
+    )
+    print(
+        f"CompactTrack: {compact / 2**20:8.2f} МБ ({compact / args.tracks:.0f} Б на трек)"
+    )
+    print(f"Экономия:     {(1 - compact / playable) * 100:8.1f}%")
+
+
+if __name__ == "__main__":
+    main()
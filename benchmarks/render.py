@@ -0,0 +1,308 @@
+"""
+Замеры отрисовки эмбедов и кнопок на очередях разного размера.
+
+Для каждого случая выводятся медианное время одной отрисовки и пик выделенной за нее памяти.
+Базовые значения сохраняются в benchmarks/baselines.json, проверка падает,
+если случай стал медленнее или тяжелее базового больше чем на допуск.
+
+Запуск:
+    python -m benchmarks.render                # только вывод
+    python -m benchmarks.render --update       # сохранить базовые значения
+    python -m benchmarks.render --check        # сравнить с базовыми значениями
+"""
+
+import argparse
+import asyncio
+import gc
+import inspect
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+os.environ.setdefault("LAVALINK_PORT", "2333")
+
+import wavelink  # noqa: E402
+
+from benchmarks.queue_memory import make_payload  # noqa: E402
+from bot.models.queue import TrackedQueue  # noqa: E402
+from bot.views.current_track import CurrentTrack  # noqa: E402
+from bot.views.queue_pages import QueuePages  # noqa: E402
+from utils import (  # noqa: E402
+    convert_word_from_number,
+    seconds_to_duration,
+    seconds_to_time_string,
+)
+
+BASELINES_PATH = os.path.join(os.path.dirname(__file__), "baselines.json")
+DEFAULT_SIZES = (10, 100, 1_000, 10_000, 50_000)
+DEFAULT_TOLERANCE = 0.25
+# сколько вызовов быстрых функций делается за один замер
+CALLS_PER_ROUND = 1000
+
+
+class FakeRequesters:
+    async def resolve(self, guild, user_id):
+        return None
+
+
+class FakeClient:
+    def __init__(self):
+        self.requesters = FakeRequesters()
+
+
+class FakePlayer:
+    """Плеер с очередью и историей из Playable, без подключения к Discord и Lavalink"""
+
+    def __init__(self, size: int):
+        random.seed(size)
+        extras = {
+            "requester": 335464992079872000,
+            "requester_name": "user",
+            "requester_avatar": "https://cdn.discordapp.com/embed/avatars/0.png",
+        }
+        self.queue = TrackedQueue()
+        for index in range(size):
+            self.queue.put(wavelink.Playable(make_payload(index, extras)))
+            self.queue.history.put(
+                wavelink.Playable(make_payload(size + index, extras))
+            )
+        self.current = wavelink.Playable(make_payload(size * 2, extras))
+        self.queue.history.put(self.current)
+        self.autoplay = wavelink.AutoPlayMode.partial
+        self.paused = False
+        self.volume = 100
+        self.client = FakeClient()
+        self.guild = None
+
+
+class Case:
+    """
+    Замеряемая операция.
+
+    ``setup`` получает плеер и возвращает функцию без аргументов (обычную или корутину),
+    время и память которой замеряются
+    """
+
+    def __init__(self, name: str, setup: Callable, sized: bool = True):
+        self.name = name
+        self.setup = setup
+        self.sized = sized
+
+
+def _queue_page(number: Callable[[QueuePages], int]):
+    def setup(player: FakePlayer):
+        def run():
+            pages = QueuePages(player)
+            return pages[number(pages)]
+
+        return run
+
+    return setup
+
+
+def _queue_update(player: FakePlayer):
+    pages = QueuePages(player)
+    pages[0]
+    track = player.queue[-1]
+
+    def run():
+        # изменение в конце очереди не должно заставлять перерисовывать первую страницу
+        player.queue.put(track)
+        player.queue.delete(len(player.queue) - 1)
+        pages.refresh()
+        return pages[0]
+
+    return run
+
+
+def _current_track_render(player: FakePlayer):
+    view = CurrentTrack(player)
+    return view.render
+
+
+def _current_track_embed(player: FakePlayer):
+    view = CurrentTrack(player)
+    return view.generate_embed
+
+
+def _current_track_buttons(player: FakePlayer):
+    view = CurrentTrack(player)
+
+    def run():
+        view.clear_items()
+        view.setup_buttons()
+
+    return run
+
+
+def _durations(player: FakePlayer):
+    def run():
+        for seconds in range(0, CALLS_PER_ROUND * 37, 37):
+            seconds_to_duration(seconds)
+
+    return run
+
+
+def _time_strings(player: FakePlayer):
+    def run():
+        for seconds in range(0, CALLS_PER_ROUND * 3671, 3671):
+            seconds_to_time_string(seconds)
+
+    return run
+
+
+def _word_forms(player: FakePlayer):
+    def run():
+        for number in range(CALLS_PER_ROUND):
+            convert_word_from_number("minutes", number)
+
+    return run
+
+
+CASES = [
+    Case("queue_page_first", _queue_page(lambda pages: 0)),
+    Case("queue_page_last", _queue_page(lambda pages: len(pages) - 1)),
+    Case("queue_update", _queue_update),
+    Case("current_track_render", _current_track_render),
+    Case("current_track_embed", _current_track_embed),
+    Case("current_track_buttons", _current_track_buttons),
+    Case(f"seconds_to_duration_x{CALLS_PER_ROUND}", _durations, sized=False),
+    Case(f"seconds_to_time_string_x{CALLS_PER_ROUND}", _time_strings, sized=False),
+    Case(f"convert_word_from_number_x{CALLS_PER_ROUND}", _word_forms, sized=False),
+]
+
+
+async def _call(function: Callable):
+    if inspect.iscoroutinefunction(function):
+        return await function()
+    return function()
+
+
+async def measure(function: Callable, rounds: int) -> Dict[str, float]:
+    """
+    Замеряет операцию
+
+    :param function: Операция
+    :param rounds: Количество замеров времени
+
+    :return: Медианное время в микросекундах и пик памяти в байтах за один вызов
+    """
+    for _ in range(3):
+        await _call(function)
+
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        await _call(function)
+        timings.append(time.perf_counter() - started)
+
+    # память замеряется отдельно, чтобы tracemalloc не искажал время
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    result = await _call(function)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+
+    return {
+        "time_us": round(statistics.median(timings) * 1_000_000, 1),
+        "alloc_bytes": max(peak - before, 0),
+    }
+
+
+async def run(sizes: List[int], rounds: int, only: Optional[str]) -> Dict[str, dict]:
+    results = dict()
+    players: Dict[int, FakePlayer] = dict()
+    for case in CASES:
+        if only and only not in case.name:
+            continue
+        for size in sizes if case.sized else [0]:
+            player = players.get(size)
+            if player is None:
+                player = players[size] = FakePlayer(size)
+            key = f"{case.name}[{size}]" if case.sized else case.name
+            results[key] = await measure(case.setup(player), rounds)
+            print(
+                f"{key:<44} {results[key]['time_us']:>12.1f} мкс "
+                f"{results[key]['alloc_bytes'] / 1024:>10.1f} КБ"
+            )
+    return results
+
+
+def check(results: Dict[str, dict], baselines: Dict[str, dict], tolerance: float):
+    """
+    Сравнивает результаты с базовыми значениями
+
+    :return: Список описаний регрессий
+    """
+    regressions = []
+    for key, result in results.items():
+        baseline = baselines.get(key)
+        if baseline is None:
+            continue
+        for metric in ("time_us", "alloc_bytes"):
+            if baseline[metric] and result[metric] > baseline[metric] * (1 + tolerance):
+                regressions.append(
+                    f"{key} {metric}: {result[metric]} > {baseline[metric]} "
+                    f"(+{(result[metric] / baseline[metric] - 1) * 100:.0f}%)"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--sizes",
+        type=lambda value: [int(size) for size in value.split(",")],
+        default=list(DEFAULT_SIZES),
+        help="Размеры очереди через запятую",
+    )
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--only", help="Запустить только случаи с этой подстрокой")
+    parser.add_argument("--baselines", default=BASELINES_PATH)
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help="Допустимое ухудшение относительно базового значения, 0.25 = 25%%",
+    )
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--update", action="store_true")
+    mode.add_argument("--check", action="store_true")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.sizes, args.rounds, args.only))
+
+    if args.update:
+        baselines = dict()
+        if os.path.exists(args.baselines):
+            with open(args.baselines) as file:
+                baselines = json.load(file)
+        baselines.update(results)
+        with open(args.baselines, "w") as file:
+            json.dump(baselines, file, indent=2, sort_keys=True)
+        print(f"Базовые значения сохранены в {args.baselines}")
+    elif args.check:
+        if not os.path.exists(args.baselines):
+            sys.exit("Нет базовых значений, сначала запустите с --update")
+        with open(args.baselines) as file:
+            baselines = json.load(file)
+        regressions = check(results, baselines, args.tolerance)
+        if regressions:
+            print("Регрессии:")
+            print("\n".join(regressions))
+            sys.exit(1)
+        print("Регрессий нет")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Запуск бота в несколько процессов на одном сервере: python -m bot.cluster
+
+Шарды делятся на непрерывные диапазоны между CLUSTER_WORKERS процессами, у каждого процесса
+свои подключения к Discord и Lavalink. Упавший процесс перезапускается
+"""
+
+import asyncio
+import logging
+import os
+import signal
+import sys
+import time
+from typing import Dict, List
+
+import aiohttp
+
+from bot.models.cluster import CLUSTER_HEALTH_DIR, SHARD_COUNT, split_shards
+
+CLUSTER_WORKERS = int(os.environ.get("CLUSTER_WORKERS", os.cpu_count() or 1))
+CLUSTER_RESTART_DELAY = float(os.environ.get("CLUSTER_RESTART_DELAY", 5))
+CLUSTER_MAX_RESTART_DELAY = float(os.environ.get("CLUSTER_MAX_RESTART_DELAY", 120))
+# процесс, проработавший дольше этого времени, считается стабильным и задержка сбрасывается
+CLUSTER_STABLE_AFTER = 60
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 9310))
+
+_logger = logging.getLogger("cluster")
+
+
+async def fetch_shard_count(token: str) -> int:
+    """Рекомендованное Discord количество шардов"""
+    async with aiohttp.ClientSession() as session:
+        async with session.get(
+            "https://discord.com/api/v10/gateway/bot",
+            headers={"Authorization": f"Bot {token}"},
+        ) as response:
+            response.raise_for_status()
+            return (await response.json())["shards"]
+
+
+class Worker:
+    """Процесс бота с частью шардов"""
+
+    def __init__(self, cluster_id: int, shard_ids: List[int], shard_count: int):
+        self.cluster_id = cluster_id
+        self.shard_ids = shard_ids
+        self.shard_count = shard_count
+        self.process = None
+        self.restarts = 0
+
+    def environment(self) -> Dict[str, str]:
+        environment = dict(os.environ)
+        environment.update(
+            CLUSTER_ID=str(self.cluster_id),
+            SHARD_COUNT=str(self.shard_count),
+            SHARD_IDS=f"{self.shard_ids[0]}-{self.shard_ids[-1]}",
+            METRICS_PORT=str(METRICS_PORT + self.cluster_id),
+        )
+        return environment
+
+    async def run(self, stopping: asyncio.Event):
+        """Запускает процесс и перезапускает его при падении, пока кластер не остановлен"""
+        delay = CLUSTER_RESTART_DELAY
+        while not stopping.is_set():
+            started = time.monotonic()
+            self.process = await asyncio.create_subprocess_exec(
+                sys.executable, "-m", "bot", env=self.environment()
+            )
+            _logger.info(
+                f"Worker {self.cluster_id} started with pid {self.process.pid}, "
+                f"shards {self.shard_ids[0]}-{self.shard_ids[-1]}"
+            )
+            code = await self.process.wait()
+            if stopping.is_set():
+                break
+            if time.monotonic() - started > CLUSTER_STABLE_AFTER:
+                delay = CLUSTER_RESTART_DELAY
+            self.restarts += 1
+            _logger.error(
+                f"Worker {self.cluster_id} exited with code {code}, restarting in {delay:.0f}s"
+            )
+            try:
+                await asyncio.wait_for(stopping.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            delay = min(delay * 2, CLUSTER_MAX_RESTART_DELAY)
+
+    def terminate(self):
+        if self.process is not None and self.process.returncode is None:
+            self.process.terminate()
+
+
+async def main():
+    shard_count = SHARD_COUNT or await fetch_shard_count(os.environ["DISCORD_TOKEN"])
+    workers = [
+        Worker(cluster_id, shard_ids, shard_count)
+        for cluster_id, shard_ids in enumerate(
+            split_shards(shard_count, CLUSTER_WORKERS)
+        )
+    ]
+    _logger.info(f"Starting {len(workers)} workers for {shard_count} shards")
+
+    # файлы состояния от прошлого запуска могут содержать процессы, которых больше нет
+    os.makedirs(CLUSTER_HEALTH_DIR, exist_ok=True)
+    for filename in os.listdir(CLUSTER_HEALTH_DIR):
+        if filename.startswith("worker-"):
+            os.remove(os.path.join(CLUSTER_HEALTH_DIR, filename))
+
+    stopping = asyncio.Event()
+
+    def stop():
+        _logger.info("Stopping cluster")
+        stopping.set()
+        for worker in workers:
+            worker.terminate()
+
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signal_number, stop)
+
+    await asyncio.gather(*(worker.run(stopping) for worker in workers))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
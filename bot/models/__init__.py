@@ -1,3 +1,19 @@
 from .bot import FununaNun
+from .search import SearchCache
+from .autocomplete import QueryAutocomplete
+from .queue import TrackedQueue, CompactTrack
+from .player import FununaPlayer
+from .nodes import NodePool
+from .breaker import CircuitBreaker
+from .session import GuildSession
+from .requesters import Requester, RequesterCache
+from .voice_status import VoiceStatusManager
+from .storage import Storage
+from .player_state import PlayerStateStore
+from .deletions import DeletionScheduler
+from .cluster import parse_shard_ids, split_shards
+from .sampler import StatusSampler
+from .metrics import BotMetrics, MetricsRegistry
+from .watchdog import LoopWatchdog
 from .errors import *
 from .basic_cog import BasicCog
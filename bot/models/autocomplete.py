@@ -0,0 +1,247 @@
+import asyncio
+import bisect
+import logging
+import os
+from typing import Dict, List, Tuple
+
+import discord
+import wavelink
+import yarl
+
+from .errors import NodeUnavailable
+from .metrics import metrics
+from .search import SearchCache, normalize_query
+
+AUTOCOMPLETE_INDEX_SIZE = int(os.environ.get("AUTOCOMPLETE_INDEX_SIZE", 2000))
+AUTOCOMPLETE_LIMIT = int(os.environ.get("AUTOCOMPLETE_LIMIT", 10))
+AUTOCOMPLETE_MIN_LENGTH = int(os.environ.get("AUTOCOMPLETE_MIN_LENGTH", 3))
+AUTOCOMPLETE_DEBOUNCE = float(os.environ.get("AUTOCOMPLETE_DEBOUNCE", 0.4))
+AUTOCOMPLETE_CONCURRENCY = int(os.environ.get("AUTOCOMPLETE_CONCURRENCY", 4))
+# Discord ждет ответ на автодополнение 3 секунды, часть времени уходит на задержку и сеть
+AUTOCOMPLETE_SEARCH_TIMEOUT = float(os.environ.get("AUTOCOMPLETE_SEARCH_TIMEOUT", 1.8))
+# сколько найденных треков добавлять в индекс
+AUTOCOMPLETE_TRACKS = 5
+# длина названия и значения варианта ограничена Discord
+_CHOICE_LENGTH = 100
+
+metrics.counter("autocomplete_requests_total", "Autocomplete requests by outcome")
+
+
+class PrefixIndex:
+    """
+    Индекс вариантов автодополнения по префиксу.
+
+    Ключи хранятся в отсортированном списке, поиск префикса выполняется бинарным поиском.
+    При переполнении вытесняются варианты, которые дольше всех не добавлялись и не выбирались
+    """
+
+    def __init__(self, maxsize: int = AUTOCOMPLETE_INDEX_SIZE):
+        self.maxsize = maxsize
+        self._keys: List[str] = list()
+        # ключ -> (название варианта, значение, отметка последнего использования)
+        self._entries: Dict[str, Tuple[str, str, int]] = dict()
+        self._clock = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, key: str, name: str, value: str):
+        if not key:
+            return
+        self._clock += 1
+        if key not in self._entries:
+            bisect.insort(self._keys, key)
+        self._entries[key] = (name, value, self._clock)
+        if len(self._entries) > self.maxsize:
+            self._evict()
+
+    def _evict(self):
+        # удаляем сразу десятую часть, чтобы не пересобирать список на каждое добавление
+        stale = sorted(self._entries, key=lambda key: self._entries[key][2])
+        for key in stale[: max(len(stale) - self.maxsize, self.maxsize // 10)]:
+            del self._entries[key]
+        self._keys = sorted(self._entries)
+
+    def search(self, prefix: str, limit: int) -> List[Tuple[str, str]]:
+        """
+        Варианты, ключ которых начинается с префикса, сначала недавние
+
+        :param prefix: Нормализованный префикс
+        :param limit: Максимальное количество вариантов
+
+        :return: Список пар (название, значение)
+        """
+        start = bisect.bisect_left(self._keys, prefix)
+        matches = []
+        # просматриваем ограниченное число ключей, чтобы короткий префикс не обходил весь индекс
+        for key in self._keys[start : start + limit * 5]:
+            if not key.startswith(prefix):
+                break
+            matches.append(self._entries[key])
+        matches.sort(key=lambda entry: entry[2], reverse=True)
+        unique = dict()
+        for name, value, _ in matches:
+            unique.setdefault(value, name)
+        return [(name, value) for value, name in unique.items()][:limit]
+
+
+def _choice_text(text: str) -> str:
+    return text if len(text) <= _CHOICE_LENGTH else text[: _CHOICE_LENGTH - 1] + "…"
+
+
+def _track_choice(track: wavelink.Playable) -> Tuple[str, str]:
+    """Вариант для найденного трека: выбор ссылки сразу добавляет трек без выбора из списка"""
+    name = _choice_text(f"{track.author} - {track.title}")
+    value = track.uri if track.uri and len(track.uri) <= _CHOICE_LENGTH else name
+    return name, value
+
+
+class QueryAutocomplete:
+    """
+    Автодополнение запроса /play.
+
+    Отвечает из памяти: по префиксу ищутся недавние успешные запросы и названия найденных треков
+    отдельно для каждого провайдера. Если вариантов мало, после паузы в наборе выполняется поиск
+    через SearchCache с ограничением на количество одновременных поисков, найденные треки
+    попадают в индекс, а результат поиска в кэш, поэтому повторные нажатия клавиш ничего не стоят
+    """
+
+    def __init__(
+        self,
+        search_cache: SearchCache,
+        limit: int = AUTOCOMPLETE_LIMIT,
+        debounce: float = AUTOCOMPLETE_DEBOUNCE,
+        concurrency: int = AUTOCOMPLETE_CONCURRENCY,
+    ):
+        self.search_cache = search_cache
+        self.limit = limit
+        self.debounce = debounce
+        self._indexes: Dict[str, PrefixIndex] = dict()
+        self._semaphore = asyncio.Semaphore(concurrency)
+        # последний набранный пользователем текст, по нему определяется, что набор продолжился
+        self._typing: Dict[int, str] = dict()
+        self._logger = logging.getLogger("autocomplete")
+
+    def _index(self, provider: str) -> PrefixIndex:
+        index = self._indexes.get(provider)
+        if index is None:
+            index = self._indexes[provider] = PrefixIndex()
+        return index
+
+    def remember(
+        self,
+        provider: str,
+        query: str,
+        result: wavelink.Search,
+        confirmed: bool = True,
+    ):
+        """
+        Добавляет в индекс найденные треки и, если запрос выполнен через /play, сам запрос
+
+        :param provider: Провайдер поиска
+        :param query: Запрос пользователя
+        :param result: Результат поиска
+        :param confirmed: Выполнен ли запрос пользователем, а не поиском автодополнения
+        """
+        if not result:
+            return
+        index = self._index(provider)
+        query = query.strip()
+        # значение варианта не может быть длиннее 100 символов, иначе Discord отклонит весь ответ
+        remember_query = confirmed and len(query) <= _CHOICE_LENGTH
+        if isinstance(result, wavelink.Playlist):
+            if remember_query:
+                index.add(
+                    normalize_query(result.name), _choice_text(result.name), query
+                )
+            return
+        for track in result[:AUTOCOMPLETE_TRACKS]:
+            name, value = _track_choice(track)
+            index.add(normalize_query(f"{track.author} {track.title}"), name, value)
+            index.add(normalize_query(track.title), name, value)
+        if remember_query and not yarl.URL(query).host:
+            index.add(normalize_query(query), _choice_text(query), query)
+
+    def lookup(self, provider: str, text: str) -> List[discord.OptionChoice]:
+        """Варианты из памяти без обращения к Lavalink"""
+        return [
+            discord.OptionChoice(name, value)
+            for name, value in self._index(provider).search(
+                normalize_query(text), self.limit
+            )
+        ]
+
+    async def suggest(
+        self, text: str, provider: str, user_id: int
+    ) -> List[discord.OptionChoice]:
+        """
+        Варианты автодополнения для набранного текста
+
+        :param text: Набранный текст
+        :param provider: Провайдер поиска
+        :param user_id: ID пользователя, по нему отслеживается продолжение набора
+
+        :return: Список вариантов
+        """
+        choices = self.lookup(provider, text)
+        if (
+            len(choices) >= self.limit
+            or len(text.strip()) < AUTOCOMPLETE_MIN_LENGTH
+            or yarl.URL(text.strip()).host
+        ):
+            metrics.inc("autocomplete_requests_total", outcome="memory")
+            return choices
+
+        self._typing[user_id] = text
+        await asyncio.sleep(self.debounce)
+        if self._typing.get(user_id) != text:
+            # пользователь продолжил набор, поиск выполнится для следующего текста
+            metrics.inc("autocomplete_requests_total", outcome="debounced")
+            return choices
+        self._typing.pop(user_id, None)
+
+        if self._semaphore.locked():
+            metrics.inc("autocomplete_requests_total", outcome="busy")
+            return choices
+        async with self._semaphore:
+            try:
+                result = await asyncio.wait_for(
+                    self.search_cache.search(text, provider),
+                    timeout=AUTOCOMPLETE_SEARCH_TIMEOUT,
+                )
+            except asyncio.TimeoutError:
+                # поиск продолжается в SearchCache, его результат пригодится следующему запросу
+                metrics.inc("autocomplete_requests_total", outcome="timeout")
+                return choices
+            except (
+                wavelink.LavalinkException,
+                wavelink.NodeException,
+                NodeUnavailable,
+            ) as e:
+                self._logger.warning(f"Autocomplete search for {text!r} failed: {e!r}")
+                metrics.inc("autocomplete_requests_total", outcome="error")
+                return choices
+
+        metrics.inc("autocomplete_requests_total", outcome="remote")
+        if not result:
+            return choices
+        if isinstance(result, wavelink.Playlist):
+            if len(text.strip()) > _CHOICE_LENGTH:
+                return choices
+            remote = [discord.OptionChoice(_choice_text(result.name), text.strip())]
+        else:
+            # названия треков попадают в индекс, чтобы следующие нажатия клавиш обошлись без поиска
+            self.remember(provider, text, result, confirmed=False)
+            remote = [
+                discord.OptionChoice(*_track_choice(track))
+                for track in result[: self.limit]
+            ]
+        values = {choice.value for choice in remote}
+        return (remote + [choice for choice in choices if choice.value not in values])[
+            : self.limit
+        ]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            provider: len(index) for provider, index in sorted(self._indexes.items())
+        }
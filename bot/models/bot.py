@@ -1,20 +1,33 @@
+import asyncio
+import collections
+import hashlib
+import json
 import logging
 import os
+import time
 import traceback
+import typing
 
 import discord
-import wavelink
 from discord import ApplicationContext, DiscordException
 from discord.ext import commands
 
 from bot.models import errors
+from bot.models.autocomplete import QueryAutocomplete
+from bot.models.cluster import CLUSTER_ID, SHARD_COUNT, SHARD_IDS
+from bot.models.deletions import DeletionScheduler
+from bot.models.metrics import BotMetrics, metrics
+from bot.models.nodes import NodePool
+from bot.models.player_state import PlayerStateStore
+from bot.models.requesters import RequesterCache
+from bot.models.sampler import StatusSampler
+from bot.models.search import SearchCache
+from bot.models.storage import Storage
+from bot.models.voice_status import VoiceStatusManager
+from bot.models.watchdog import LoopWatchdog
 from bot.views import TracebackShowButton
 from utils import respond_or_followup
 
-LAVALINK_HOST = os.environ.get("LAVALINK_HOST")
-LAVALINK_PORT = int(os.environ.get("LAVALINK_PORT"))
-LAVALINK_PASSWORD = os.environ.get("LAVALINK_PASSWORD")
-
 logging.basicConfig(
     level=logging.INFO,
     format="{asctime} [{name}] [{levelname:<8}]: {message}",
@@ -23,9 +36,32 @@ logging.basicConfig(
 )
 
 
-class FununaNun(commands.Bot):
+INTENTS_MODE = os.environ.get("INTENTS_MODE", "full").lower()
+# через сколько секунд повторить запуск, если синхронизация команд или подключение к нодам упали
+STARTUP_RETRY_DELAY = float(os.environ.get("STARTUP_RETRY_DELAY", 30))
+# сколько on_ready ждет нод перед восстановлением плееров
+NODE_READY_TIMEOUT = float(os.environ.get("NODE_READY_TIMEOUT", 60))
+
+
+def lean_intents() -> discord.Intents:
+    """Только то, что нужно музыке и /status: серверы и голосовые состояния"""
+    return discord.Intents(guilds=True, voice_states=True)
+
+
+class FununaNun(commands.AutoShardedBot):
     def __init__(self, **options):
-        intents = discord.Intents.all()
+        if INTENTS_MODE == "lean":
+            intents = lean_intents()
+            # кэшируются только участники голосовых каналов и сам бот
+            options.setdefault(
+                "member_cache_flags", discord.MemberCacheFlags.from_intents(intents)
+            )
+            options.setdefault("chunk_guilds_at_startup", False)
+        else:
+            intents = discord.Intents.all()
+        # без SHARD_COUNT количество шардов берется из рекомендации Discord
+        options.setdefault("shard_count", SHARD_COUNT)
+        options.setdefault("shard_ids", SHARD_IDS)
         super().__init__(
             command_prefix="!",
             intents=intents,
@@ -35,28 +71,215 @@ class FununaNun(commands.Bot):
         self.owner_id = 335464992079872000
         self.__logger = logging.getLogger("bot")
         self.VERSION = "0.1.3"
+        self.node_pool = NodePool(self)
+        self.search_cache = SearchCache(self.node_pool.search)
+        self.autocomplete = QueryAutocomplete(self.search_cache)
+        self.requesters = RequesterCache(self)
+        self.voice_status = VoiceStatusManager(self)
+        self.storage = Storage()
+        self.player_state = PlayerStateStore(self, self.storage)
+        self.deletions = DeletionScheduler(self, self.storage)
+        self.sampler = StatusSampler(self)
+        self.metrics = BotMetrics(self)
+        self.watchdog = LoopWatchdog()
+        self.started_at = time.perf_counter()
+        self.intents_mode = "lean" if INTENTS_MODE == "lean" else "full"
+        self.gateway_events: typing.Counter[str] = collections.Counter()
+        self._startup_done = False
+        self._startup_running = False
+        self._ready_logged = False
 
-    async def on_connect(self):
-        self.__logger.debug("Start loading modules")
-        for filename in os.listdir("./bot/modules"):
+    def dispatch(self, event_name: str, *args, **kwargs):
+        # считаем события шлюза здесь, а не слушателем, чтобы не создавать задачу на каждое событие
+        if event_name == "socket_event_type":
+            self.gateway_events[args[0]] += 1
+            metrics.inc("gateway_events_total", type=args[0])
+        super().dispatch(event_name, *args, **kwargs)
+
+    def load_modules(self):
+        """Загружает модули из bot/modules. Повторные вызовы ничего не делают"""
+        if self.extensions:
+            return
+        started = time.perf_counter()
+        for filename in sorted(os.listdir("./bot/modules")):
             if filename.endswith(".py"):
                 self.load_extension(f"bot.modules.{filename[:-3]}")
-        self.__logger.debug("Setup hook completed")
+        self.__logger.info(
+            f"Loaded {len(self.extensions)} modules in {time.perf_counter() - started:.2f}s"
+        )
+
+    async def on_connect(self):
+        if self._startup_done:
+            self.__logger.info("Reconnected to gateway, startup already done")
+            return
+        if self._startup_running:
+            return
+        self._startup_running = True
+        try:
+            while not await self._startup():
+                await asyncio.sleep(STARTUP_RETRY_DELAY)
+        finally:
+            self._startup_running = False
+
+    async def _startup(self) -> bool:
+        """
+        Выполняет этапы запуска. Все этапы можно повторять, поэтому при ошибке запуск повторяется целиком
+
+        :return: True, если все этапы завершились успешно
+        """
+        self.watchdog.start()
+        self.load_modules()
+        started = time.perf_counter()
+        # дожидаемся всех этапов, чтобы повторный запуск не шел параллельно с еще идущим этапом
+        results = await asyncio.gather(
+            self.register_commands_cached(),
+            self.connect_node(),
+            self.metrics.start(),
+            return_exceptions=True,
+        )
+        failed = [result for result in results if isinstance(result, BaseException)]
+        for error in failed:
+            self.__logger.error(
+                f"Startup phase failed, retrying in {STARTUP_RETRY_DELAY:.0f}s",
+                exc_info=error,
+            )
+        if failed:
+            return False
+        self._startup_done = True
+        self.__logger.info(
+            f"Startup phases finished in {time.perf_counter() - started:.2f}s"
+        )
+        self.sampler.start()
+        if self.is_ready():
+            # on_ready не дождался нод и отложил восстановление плееров
+            await self.player_state.restore()
+        return True
+
+    @staticmethod
+    def _command_key(command: discord.ApplicationCommand) -> str:
+        return f"{command.type}:{command.name}"
+
+    def _commands_signature(self) -> str:
+        """Хэш описаний всех команд, по которому видно, нужно ли синхронизировать их с Discord"""
+        signatures = sorted(
+            json.dumps(command.to_dict(), sort_keys=True, default=str)
+            for command in self.pending_application_commands
+        )
+        signatures.append(str(self.user.id if self.user else None))
+        return hashlib.sha256("\n".join(signatures).encode()).hexdigest()
+
+    def _bind_command_ids(self, ids: dict) -> bool:
+        """Назначает командам сохраненные ID, как это делает sync_commands после регистрации"""
+        commands_ids = dict()
+        for command in self.pending_application_commands:
+            command_id = ids.get(self._command_key(command))
+            if command.guild_ids is not None or command_id is None:
+                return False
+            commands_ids[command_id] = command
+        for command_id, command in commands_ids.items():
+            command.id = command_id
+            self._application_commands[command_id] = command
+        return True
+
+    async def register_commands_cached(self):
+        """
+        Синхронизирует команды с Discord, только если их описания изменились с прошлой синхронизации.
+
+        В кластере синхронизирует только процесс 0, остальные процессы берут ID уже
+        зарегистрированных команд, чтобы при развертывании не было синхронизации на каждый процесс
+        """
+        started = time.perf_counter()
+        signature = self._commands_signature()
+        saved = await self.storage.get_value("application_commands")
+        if (
+            saved
+            and saved["signature"] == signature
+            and self._bind_command_ids(saved["ids"])
+        ):
+            self.__logger.info(
+                f"Commands unchanged, sync skipped ({time.perf_counter() - started:.2f}s)"
+            )
+            return
+
+        if CLUSTER_ID:
+            await self._bind_registered_commands()
+            self.__logger.info(
+                f"Commands bound to IDs registered by worker 0 ({time.perf_counter() - started:.2f}s)"
+            )
+            return
+
         await self.sync_commands()
-        await self.connect_node()
+        await self.storage.set_value(
+            "application_commands",
+            {
+                "signature": signature,
+                "ids": {
+                    self._command_key(command): command.id
+                    for command in self.pending_application_commands
+                    if command.id is not None
+                },
+            },
+        )
+        self.__logger.info(f"Commands synced in {time.perf_counter() - started:.2f}s")
+
+    async def _bind_registered_commands(self):
+        """
+        Назначает командам ID команд, уже зарегистрированных в Discord, не синхронизируя их
+
+        :raise RuntimeError: Если какой-то команды еще нет в Discord, процесс 0 ее еще не синхронизировал
+        """
+        registered = await self.http.get_global_commands(self.application_id)
+        ids = {
+            f"{command['type']}:{command['name']}": int(command["id"])
+            for command in registered
+        }
+        if not self._bind_command_ids(ids):
+            raise RuntimeError("Commands are not registered by cluster worker 0 yet")
+
+    async def on_unknown_application_command(self, interaction: discord.Interaction):
+        # сохраненные ID устарели, при следующем запуске команды будут синхронизированы заново
+        self.__logger.warning(
+            f"Unknown application command {interaction.data.get('name')}, resetting saved command IDs"
+        )
+        await self.storage.set_value("application_commands", None)
 
     async def connect_node(self):
         self.__logger.info("Connecting to Lavalink...")
-        node = wavelink.Node(
-            uri=f"http://{LAVALINK_HOST}:{LAVALINK_PORT}", password=LAVALINK_PASSWORD
+        started = time.perf_counter()
+        await self.node_pool.connect()
+        self.__logger.info(
+            f"Connected to Lavalink in {time.perf_counter() - started:.2f}s"
         )
-        await wavelink.Pool.connect(nodes=[node], client=self)
-        self.__logger.info("Connected to Lavalink!")
 
     async def on_ready(self):
         self.__logger.info(f'Logged in as "{self.user.name}" with ID {self.user.id}')
         activity = discord.CustomActivity(name="Слушаем музыку вместе")
         await self.change_presence(status=discord.Status.idle, activity=activity)
+        await self.deletions.start()
+        try:
+            await asyncio.wait_for(
+                self.node_pool.ready.wait(), timeout=NODE_READY_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            self.__logger.warning(
+                f"Lavalink is not ready after {NODE_READY_TIMEOUT:.0f}s, "
+                f"player restore postponed until startup finishes"
+            )
+        else:
+            await self.player_state.restore()
+        if not self._ready_logged:
+            self._ready_logged = True
+            self.__logger.info(
+                f"Ready in {time.perf_counter() - self.started_at:.2f}s since start"
+            )
+
+    async def close(self):
+        await self.player_state.close()
+        await self.deletions.close()
+        await self.metrics.close()
+        self.watchdog.stop()
+        await super().close()
+        await self.storage.close()
 
     async def on_application_command_error(
         self, ctx: ApplicationContext, exception: DiscordException
@@ -71,6 +294,13 @@ class FununaNun(commands.Bot):
                             color=discord.Color.red(),
                         )
                         return await respond_or_followup(ctx, embed, ephemeral=True)
+                    if isinstance(exception.original, errors.NodeUnavailable):
+                        embed = discord.Embed(
+                            title="Ошибка",
+                            description="Сервер музыки сейчас не отвечает, попробуйте позже",
+                            color=discord.Color.red(),
+                        )
+                        return await respond_or_followup(ctx, embed, ephemeral=True)
                 else:
                     embed = discord.Embed(
                         title="Ошибка при выполнении команды",
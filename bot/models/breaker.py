@@ -0,0 +1,147 @@
+import os
+import time
+from typing import Dict, Optional
+
+NODE_BREAKER_FAILURES = int(os.environ.get("NODE_BREAKER_FAILURES", 3))
+NODE_BREAKER_COOLDOWN = float(os.environ.get("NODE_BREAKER_COOLDOWN", 30))
+NODE_TIMEOUT_MIN = float(os.environ.get("NODE_TIMEOUT_MIN", 2))
+NODE_TIMEOUT_MAX = float(os.environ.get("NODE_TIMEOUT_MAX", 10))
+# загрузка по ссылке может вернуть большой плейлист, поэтому ее таймаут отдельный и больше
+NODE_LOAD_TIMEOUT_MIN = float(os.environ.get("NODE_LOAD_TIMEOUT_MIN", 10))
+NODE_LOAD_TIMEOUT_MAX = float(os.environ.get("NODE_LOAD_TIMEOUT_MAX", 30))
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+
+
+class AdaptiveTimeout:
+    """
+    Таймаут, подстраивающийся под задержку ноды.
+
+    Как для повторной передачи в TCP: хранится сглаженная задержка и ее разброс,
+    таймаут равен задержке плюс четыре разброса, но не выходит за границы.
+    Пока замеров нет, используется верхняя граница
+    """
+
+    def __init__(
+        self, minimum: float = NODE_TIMEOUT_MIN, maximum: float = NODE_TIMEOUT_MAX
+    ):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency: Optional[float] = None
+        self._deviation = 0.0
+
+    @property
+    def timeout(self) -> float:
+        if self.latency is None:
+            return self.maximum
+        return min(max(self.latency + 4 * self._deviation, self.minimum), self.maximum)
+
+    def observe(self, latency: float):
+        if self.latency is None:
+            self.latency = latency
+            self._deviation = latency / 2
+            return
+        self._deviation = self._deviation * 0.75 + abs(self.latency - latency) * 0.25
+        self.latency = self.latency * 0.875 + latency * 0.125
+
+
+class CircuitBreaker:
+    """
+    Предохранитель ноды.
+
+    После NODE_BREAKER_FAILURES неудачных вызовов подряд размыкается, и вызовы сразу отклоняются.
+    Через NODE_BREAKER_COOLDOWN секунд пропускает один пробный вызов: если он успешен,
+    предохранитель замыкается, если нет, снова размыкается
+    """
+
+    def __init__(
+        self,
+        failures: int = NODE_BREAKER_FAILURES,
+        cooldown: float = NODE_BREAKER_COOLDOWN,
+    ):
+        self.failures_threshold = failures
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self.timeouts: Dict[str, AdaptiveTimeout] = dict()
+
+    def timeout(
+        self,
+        operation: str,
+        maximum: float = NODE_TIMEOUT_MAX,
+        minimum: float = None,
+    ) -> float:
+        adaptive = self.timeouts.get(operation)
+        if adaptive is None:
+            if minimum is None:
+                minimum = min(NODE_TIMEOUT_MIN, maximum)
+            adaptive = self.timeouts[operation] = AdaptiveTimeout(minimum, maximum)
+        return adaptive.timeout
+
+    def current_timeout(
+        self, operation: str, maximum: float = NODE_TIMEOUT_MAX
+    ) -> float:
+        """
+        Таймаут, который получит следующий вызов. В отличие от timeout, ничего не создает
+
+        :param operation: Название вызова
+        :param maximum: Верхняя граница, с которой начнется вызов, если замеров еще нет
+
+        :return: Таймаут в секундах
+        """
+        adaptive = self.timeouts.get(operation)
+        return maximum if adaptive is None else adaptive.timeout
+
+    @property
+    def available(self) -> bool:
+        """Можно ли сейчас отправить вызов на ноду, не меняя состояние предохранителя"""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            return time.monotonic() - self.opened_at >= self.cooldown
+        return not self._probing
+
+    def allow(self) -> bool:
+        """
+        Проверяет, можно ли выполнить вызов. Если время ожидания прошло, переводит в пробный режим
+
+        :return: True, если вызов можно выполнить
+        """
+        if not self.available:
+            return False
+        if self.state != CLOSED:
+            self.state = HALF_OPEN
+            self._probing = True
+        return True
+
+    def success(self, operation: str, latency: float):
+        self.timeouts[operation].observe(latency)
+        self.failures = 0
+        self.state = CLOSED
+        self._probing = False
+
+    def failure(self) -> bool:
+        """
+        Отмечает неудачный вызов
+
+        :return: True, если предохранитель разомкнулся
+        """
+        self._probing = False
+        self.failures += 1
+        if self.state == HALF_OPEN or (
+            self.state == CLOSED and self.failures >= self.failures_threshold
+        ):
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+            self.trips += 1
+            return True
+        return False
+
+    def release(self):
+        """Завершает пробный вызов, который не показал состояние ноды"""
+        self._probing = False
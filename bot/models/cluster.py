@@ -0,0 +1,82 @@
+import glob
+import json
+import os
+import time
+from typing import List, Optional
+
+
+def parse_shard_ids(value: Optional[str]) -> Optional[List[int]]:
+    """
+    Разбирает список шардов вида ``0,1,2`` или ``0-3``
+
+    :param value: Строка из переменной окружения
+
+    :return: Список номеров шардов или None, если строка пустая
+    """
+    if not value:
+        return None
+    shard_ids = []
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start, _, end = part.partition("-")
+        shard_ids.extend(range(int(start), int(end or start) + 1))
+    return shard_ids
+
+
+def split_shards(shard_count: int, workers: int) -> List[List[int]]:
+    """
+    Делит шарды на непрерывные диапазоны для процессов кластера
+
+    :param shard_count: Общее количество шардов
+    :param workers: Количество процессов
+
+    :return: Список шардов для каждого процесса
+    """
+    workers = max(min(workers, shard_count), 1)
+    size, rest = divmod(shard_count, workers)
+    ranges = []
+    start = 0
+    for index in range(workers):
+        end = start + size + (1 if index < rest else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+SHARD_COUNT = int(os.environ["SHARD_COUNT"]) if os.environ.get("SHARD_COUNT") else None
+SHARD_IDS = parse_shard_ids(os.environ.get("SHARD_IDS"))
+CLUSTER_ID = int(os.environ["CLUSTER_ID"]) if os.environ.get("CLUSTER_ID") else None
+CLUSTER_HEALTH_DIR = os.environ.get("CLUSTER_HEALTH_DIR", "data/cluster")
+# через сколько секунд без обновления процесс считается зависшим
+CLUSTER_HEALTH_STALE = float(os.environ.get("CLUSTER_HEALTH_STALE", 60))
+
+
+def write_health(health: dict, directory: str = CLUSTER_HEALTH_DIR):
+    """Атомарно записывает состояние процесса кластера в файл"""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"worker-{health['cluster_id']}.json")
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w") as file:
+        json.dump(health, file)
+    os.replace(temporary_path, path)
+
+
+def read_health(directory: str = CLUSTER_HEALTH_DIR) -> List[dict]:
+    """
+    Читает состояния всех процессов кластера
+
+    :return: Список состояний, у зависших процессов ``stale`` равно True
+    """
+    workers = []
+    now = time.time()
+    for path in sorted(glob.glob(os.path.join(directory, "worker-*.json"))):
+        try:
+            with open(path) as file:
+                health = json.load(file)
+        except (OSError, ValueError):
+            continue
+        health["stale"] = now - health.get("updated_at", 0) > CLUSTER_HEALTH_STALE
+        workers.append(health)
+    return workers
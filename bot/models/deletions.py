@@ -0,0 +1,381 @@
+import asyncio
+import collections
+import heapq
+import itertools
+import logging
+import os
+import sqlite3
+import time
+from typing import Deque, Dict, List, Optional, Tuple
+
+import discord
+from discord import Route
+from discord.ext import tasks
+
+from .cluster import CLUSTER_ID
+from .metrics import metrics
+from .storage import Storage
+
+DELETION_FLUSH_INTERVAL = float(os.environ.get("DELETION_FLUSH_INTERVAL", 5))
+DELETION_CONCURRENCY = int(os.environ.get("DELETION_CONCURRENCY", 5))
+DELETION_RETRIES = int(os.environ.get("DELETION_RETRIES", 3))
+DELETION_RETRY_DELAY = float(os.environ.get("DELETION_RETRY_DELAY", 30))
+# токен взаимодействия действует 15 минут, берем с запасом
+INTERACTION_TOKEN_TTL = 14 * 60
+# массовое удаление принимает от 2 до 100 сообщений не старше 14 дней
+_BULK_LIMIT = 100
+_BULK_MAX_AGE = 14 * 24 * 60 * 60 - 60 * 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pending_deletions (
+    key TEXT PRIMARY KEY,
+    deadline REAL NOT NULL,
+    channel_id INTEGER,
+    message_id INTEGER,
+    guild_id INTEGER,
+    application_id INTEGER,
+    token TEXT,
+    token_expires REAL
+);
+"""
+
+metrics.counter("message_deletions_total", "Scheduled message deletions by outcome")
+
+
+class PendingDeletion:
+    """
+    Сообщение, которое нужно удалить.
+
+    Если сообщение отправлено через взаимодействие и токен еще действует, оно удаляется через
+    вебхук взаимодействия, так удаляются и скрытые сообщения. Иначе удаляется через канал.
+    Без ``message_id`` удаляется первоначальный ответ на взаимодействие
+    """
+
+    __slots__ = (
+        "deadline",
+        "channel_id",
+        "message_id",
+        "guild_id",
+        "application_id",
+        "token",
+        "token_expires",
+        "attempts",
+    )
+
+    def __init__(
+        self,
+        deadline: float,
+        channel_id: Optional[int],
+        message_id: Optional[int],
+        guild_id: Optional[int] = None,
+        application_id: Optional[int] = None,
+        token: Optional[str] = None,
+        token_expires: Optional[float] = None,
+    ):
+        self.deadline = deadline
+        self.channel_id = channel_id
+        self.message_id = message_id
+        self.guild_id = guild_id
+        self.application_id = application_id
+        self.token = token
+        self.token_expires = token_expires
+        self.attempts = 0
+
+    @property
+    def key(self) -> str:
+        if self.message_id:
+            return f"{self.channel_id}:{self.message_id}"
+        return f"{self.application_id}:{self.token}"
+
+    @property
+    def via_webhook(self) -> bool:
+        return bool(self.token) and time.time() < self.token_expires
+
+    @property
+    def group(self) -> str:
+        """Удаления одной группы идут последовательно и попадают в одно ограничение частоты Discord"""
+        if self.via_webhook:
+            return f"webhook:{self.token}"
+        return f"channel:{self.channel_id}"
+
+    def to_row(self) -> tuple:
+        return (
+            self.key,
+            self.deadline,
+            self.channel_id,
+            self.message_id,
+            self.guild_id,
+            self.application_id,
+            self.token,
+            self.token_expires,
+        )
+
+
+class DeletionScheduler:
+    """
+    Единый планировщик удаления временных сообщений.
+
+    Сроки хранятся в куче, а ожидание ближайшего срока — один таймер цикла событий,
+    поэтому обработчикам команд не нужно ждать удаления своих сообщений.
+    Наступившие удаления раскладываются по каналам: каждый канал обрабатывается последовательно,
+    чтобы занятое ограничение частоты одного канала не задерживало остальные,
+    а несколько сообщений одного канала по возможности удаляются одним запросом.
+    Ожидающие удаления раз в DELETION_FLUSH_INTERVAL секунд записываются в SQLite
+    и после перезапуска выполняются, даже если срок уже прошел
+    """
+
+    def __init__(self, bot: discord.Bot, storage: Storage):
+        self.bot = bot
+        self.storage = storage
+        self.deleted = 0
+        self.failed = 0
+        self._heap: List[Tuple[float, int, PendingDeletion]] = list()
+        self._counter = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._due: Dict[str, Deque[PendingDeletion]] = dict()
+        self._workers: Dict[str, asyncio.Task] = dict()
+        self._semaphore = asyncio.Semaphore(DELETION_CONCURRENCY)
+        # изменения, которые еще не записаны в SQLite
+        self._unsaved: Dict[str, PendingDeletion] = dict()
+        self._saved = set()
+        self._writing = set()
+        self._finished = set()
+        self._ready = False
+        self._logger = logging.getLogger("deletions")
+
+    def __len__(self) -> int:
+        return len(self._heap) + sum(len(queue) for queue in self._due.values())
+
+    def schedule(
+        self,
+        delay: float,
+        channel_id: Optional[int],
+        message_id: Optional[int] = None,
+        guild_id: Optional[int] = None,
+        interaction: discord.Interaction = None,
+    ):
+        """
+        Планирует удаление сообщения
+
+        :param delay: Через сколько секунд удалить сообщение
+        :param channel_id: ID канала
+        :param message_id: ID сообщения, без него удаляется первоначальный ответ на взаимодействие
+        :param guild_id: ID сервера, по нему после перезапуска выбирается процесс кластера
+        :param interaction: Взаимодействие, через вебхук которого отправлено сообщение
+        """
+        now = time.time()
+        deletion = PendingDeletion(now + delay, channel_id, message_id, guild_id)
+        if interaction is not None:
+            deletion.application_id = interaction.application_id
+            deletion.token = interaction.token
+            deletion.token_expires = now + INTERACTION_TOKEN_TTL
+        self._push(deletion)
+        self._unsaved[deletion.key] = deletion
+
+    def _push(self, deletion: PendingDeletion):
+        heapq.heappush(self._heap, (deletion.deadline, next(self._counter), deletion))
+        if self._heap[0][2] is deletion:
+            self._arm()
+
+    def _arm(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._heap:
+            delay = max(self._heap[0][0] - time.time(), 0)
+            self._timer = asyncio.get_running_loop().call_later(delay, self._fire)
+
+    def _fire(self):
+        self._timer = None
+        now = time.time()
+        while self._heap and self._heap[0][0] <= now:
+            _, _, deletion = heapq.heappop(self._heap)
+            group = deletion.group
+            self._due.setdefault(group, collections.deque()).append(deletion)
+            if group not in self._workers:
+                self._workers[group] = asyncio.create_task(self._drain(group))
+        self._arm()
+
+    async def _drain(self, group: str):
+        queue = self._due[group]
+        try:
+            while queue:
+                async with self._semaphore:
+                    batch = self._take_batch(queue)
+                    await self._delete(batch)
+        finally:
+            del self._workers[group]
+            if not queue:
+                del self._due[group]
+
+    def _take_batch(self, queue: Deque[PendingDeletion]) -> List[PendingDeletion]:
+        """Забирает из очереди канала сообщения, которые можно удалить одним запросом"""
+        first = queue.popleft()
+        if first.via_webhook or not self._can_bulk_delete(first):
+            return [first]
+        batch = [first]
+        while queue and len(batch) < _BULK_LIMIT and self._can_bulk_delete(queue[0]):
+            batch.append(queue.popleft())
+        return batch
+
+    def _can_bulk_delete(self, deletion: PendingDeletion) -> bool:
+        if not deletion.message_id or deletion.via_webhook:
+            return False
+        age = (
+            time.time() - discord.utils.snowflake_time(deletion.message_id).timestamp()
+        )
+        if age > _BULK_MAX_AGE:
+            return False
+        channel = self.bot.get_channel(deletion.channel_id)
+        if not isinstance(channel, discord.abc.GuildChannel):
+            return False
+        return channel.permissions_for(channel.guild.me).manage_messages
+
+    async def _delete(self, batch: List[PendingDeletion]):
+        deletion = batch[0]
+        try:
+            if len(batch) > 1:
+                await self.bot.http.delete_messages(
+                    deletion.channel_id, [item.message_id for item in batch]
+                )
+            elif deletion.via_webhook and deletion.message_id:
+                await self.bot.http.request(
+                    Route(
+                        "DELETE",
+                        "/webhooks/{webhook_id}/{webhook_token}/messages/{message_id}",
+                        webhook_id=deletion.application_id,
+                        webhook_token=deletion.token,
+                        message_id=deletion.message_id,
+                    )
+                )
+            elif deletion.via_webhook:
+                await self.bot.http.delete_original_interaction_response(
+                    deletion.application_id, deletion.token
+                )
+            elif deletion.message_id:
+                await self.bot.http.delete_message(
+                    deletion.channel_id, deletion.message_id
+                )
+            else:
+                # токен истек, а ID первоначального ответа неизвестен
+                self._finish(batch, "expired")
+                return
+        except (discord.NotFound, discord.Forbidden) as e:
+            # сообщение уже удалено или у бота больше нет доступа к каналу
+            self._finish(batch, "not_found" if e.status == 404 else "forbidden")
+            return
+        except (discord.HTTPException, OSError, asyncio.TimeoutError) as e:
+            self._retry(batch, e)
+            return
+        self.deleted += len(batch)
+        self._finish(batch, "deleted")
+
+    def _retry(self, batch: List[PendingDeletion], error: Exception):
+        for deletion in batch:
+            deletion.attempts += 1
+            if deletion.attempts >= DELETION_RETRIES:
+                self._logger.warning(
+                    f"Giving up deleting {deletion.key} after {deletion.attempts} attempts: {error!r}"
+                )
+                self.failed += 1
+                self._finish([deletion], "failed")
+                continue
+            deletion.deadline = time.time() + DELETION_RETRY_DELAY
+            self._push(deletion)
+            # новый срок тоже нужно сохранить
+            self._unsaved[deletion.key] = deletion
+
+    def _finish(self, batch: List[PendingDeletion], outcome: str):
+        metrics.inc("message_deletions_total", len(batch), outcome=outcome)
+        for deletion in batch:
+            key = deletion.key
+            self._unsaved.pop(key, None)
+            if key in self._saved or key in self._writing:
+                self._finished.add(key)
+
+    @staticmethod
+    def _write(
+        connection: sqlite3.Connection, rows: List[tuple], removed: List[str]
+    ) -> None:
+        with connection:
+            if removed:
+                connection.executemany(
+                    "DELETE FROM pending_deletions WHERE key = ?",
+                    [(key,) for key in removed],
+                )
+            if rows:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO pending_deletions VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+
+    async def flush(self):
+        """Записывает в SQLite новые удаления и убирает выполненные"""
+        if not self._ready or not (self._unsaved or self._finished):
+            return
+        unsaved, self._unsaved = self._unsaved, dict()
+        removed, self._finished = list(self._finished), set()
+        # удаления, выполненные во время записи, нужно будет убрать следующей записью
+        self._writing = set(unsaved)
+        try:
+            await self.storage.run(
+                self._write,
+                [deletion.to_row() for deletion in unsaved.values()],
+                removed,
+            )
+        finally:
+            self._writing = set()
+        self._saved.update(unsaved)
+        self._saved.difference_update(removed)
+
+    @tasks.loop(seconds=DELETION_FLUSH_INTERVAL)
+    async def flusher(self):
+        await self.flush()
+
+    @flusher.error
+    async def flusher_error(self, error: BaseException):
+        self._logger.exception("Failed to save pending deletions", exc_info=error)
+
+    async def start(self):
+        """
+        Загружает удаления, оставшиеся с прошлого запуска, и начинает сохранять новые.
+        Вызывается один раз, когда кэш серверов уже заполнен
+        """
+        if self._ready:
+            return
+        self._ready = True
+        await self.storage.executescript(SCHEMA)
+        rows = await self.storage.fetchall(
+            "SELECT deadline, channel_id, message_id, guild_id, application_id, token, "
+            "token_expires FROM pending_deletions"
+        )
+        restored = 0
+        for row in rows:
+            deletion = PendingDeletion(*row)
+            # удаления серверов других процессов кластера оставляем им,
+            # а личные сообщения приходят в шард 0 и принадлежат процессу 0
+            if deletion.guild_id:
+                if self.bot.get_guild(deletion.guild_id) is None:
+                    continue
+            elif CLUSTER_ID:
+                continue
+            if deletion.key in self._unsaved:
+                continue
+            self._saved.add(deletion.key)
+            self._push(deletion)
+            restored += 1
+        if restored:
+            self._logger.info(f"Restored {restored} pending message deletion(s)")
+        if not self.flusher.is_running():
+            self.flusher.start()
+
+    async def close(self):
+        """Останавливает таймер и сохраняет удаления, которые не успели выполниться"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for worker in list(self._workers.values()):
+            worker.cancel()
+        if self.flusher.is_running():
+            self.flusher.cancel()
+        await self.flush()
@@ -8,3 +8,7 @@ class MemberNotInVoice(FununaNunException):
 
 class BotNotInVoice(FununaNunException):
     pass
+
+
+class NodeUnavailable(FununaNunException):
+    pass
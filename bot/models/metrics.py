@@ -0,0 +1,285 @@
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+import discord
+import wavelink
+from aiohttp import web
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1").lower() in ("1", "true", "yes")
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 9310))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+LabelValues = Tuple[Tuple[str, str], ...]
+
+_logger = logging.getLogger("metrics")
+
+
+def _labels(labels: dict) -> LabelValues:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: LabelValues, extra: Iterable[Tuple[str, str]] = ()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (key, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in pairs
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values: Dict[LabelValues, float] = dict()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _labels(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in self._values.items():
+            yield f"{self.name}{_format_labels(labels)} {value}"
+
+
+class Gauge:
+    """Значение, которое вычисляется функцией в момент запроса метрик"""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        collect: Callable[[], Dict[LabelValues, float]],
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.collect = collect
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} gauge"
+        for labels, value in self.collect().items():
+            yield f"{self.name}{_format_labels(labels)} {value}"
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        # для каждого набора меток: счетчики по корзинам, сумма и количество
+        self._values: Dict[LabelValues, list] = dict()
+
+    def observe(self, value: float, **labels):
+        key = _labels(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[0][index] += 1
+        state[1] += value
+        state[2] += 1
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, (buckets, total, count) in self._values.items():
+            for bound, bucket_count in zip(self.buckets, buckets):
+                yield f"{self.name}_bucket{_format_labels(labels, [('le', str(bound))])} {bucket_count}"
+            yield f"{self.name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}"
+            yield f"{self.name}_sum{_format_labels(labels)} {total}"
+            yield f"{self.name}_count{_format_labels(labels)} {count}"
+
+
+class MetricsRegistry:
+    """
+    Набор метрик в формате Prometheus.
+
+    Если метрики выключены, замеры ничего не делают, чтобы не тратить время на инструментирование
+    """
+
+    def __init__(self, enabled: bool = METRICS_ENABLED, prefix: str = "fununa"):
+        self.enabled = enabled
+        self.prefix = prefix
+        self._metrics: Dict[str, object] = dict()
+
+    def _get(self, factory, name: str, *args):
+        name = f"{self.prefix}_{name}"
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = factory(name, *args)
+        return metric
+
+    def counter(self, name: str, documentation: str = "") -> Counter:
+        return self._get(Counter, name, documentation)
+
+    def histogram(self, name: str, documentation: str = "") -> Histogram:
+        return self._get(Histogram, name, documentation)
+
+    def gauge(
+        self,
+        name: str,
+        documentation: str,
+        collect: Callable[[], Dict[LabelValues, float]],
+    ) -> Gauge:
+        return self._get(Gauge, name, documentation, collect)
+
+    def observe(self, name: str, value: float, **labels):
+        if self.enabled:
+            self.histogram(name).observe(value, **labels)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        if self.enabled:
+            self.counter(name).inc(amount, **labels)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Замеряет время выполнения блока и записывает его в гистограмму"""
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.histogram(name).observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+metrics.histogram("command_duration_seconds", "Slash command handling time")
+metrics.counter("commands_total", "Slash commands handled")
+metrics.histogram("discord_rest_duration_seconds", "Discord REST request time")
+metrics.counter("discord_rest_requests_total", "Discord REST requests")
+metrics.histogram("lavalink_search_duration_seconds", "Lavalink search time")
+metrics.histogram("lavalink_stats_duration_seconds", "Lavalink stats request time")
+metrics.histogram("track_event_duration_seconds", "Track event handling time")
+metrics.counter("gateway_events_total", "Gateway events received by type")
+
+
+class BotMetrics:
+    """
+    Инструментирование бота и HTTP-сервер, отдающий метрики по адресу /metrics.
+
+    Задержки команд считаются по событиям application_command, запросы к REST Discord
+    замеряются оберткой над HTTPClient.request и группируются по шаблону пути
+    """
+
+    def __init__(self, bot: discord.Bot, registry: MetricsRegistry = metrics):
+        self.bot = bot
+        self.registry = registry
+        self._started: Dict[int, float] = dict()
+        self._runner: Optional[web.AppRunner] = None
+        if not registry.enabled:
+            return
+
+        registry.gauge(
+            "lavalink_players",
+            "Players connected to each Lavalink node",
+            self._collect_players,
+        )
+        bot.add_listener(self.on_application_command)
+        bot.add_listener(self.on_application_command_completion)
+        bot.add_listener(self.on_application_command_error)
+        self._wrap_http()
+
+    @staticmethod
+    def _collect_players() -> Dict[LabelValues, float]:
+        return {
+            _labels({"node": node.identifier}): len(node.players)
+            for node in wavelink.Pool.nodes.values()
+        }
+
+    def _wrap_http(self):
+        http = self.bot.http
+        request = http.request
+        registry = self.registry
+
+        async def timed_request(route: discord.http.Route, **kwargs):
+            started = time.perf_counter()
+            status = "ok"
+            try:
+                return await request(route, **kwargs)
+            except discord.HTTPException as e:
+                status = str(e.status)
+                raise
+            except Exception:
+                status = "error"
+                raise
+            finally:
+                labels = {"method": route.method, "route": route.path, "status": status}
+                registry.observe(
+                    "discord_rest_duration_seconds",
+                    time.perf_counter() - started,
+                    **labels,
+                )
+                registry.inc("discord_rest_requests_total", **labels)
+
+        http.request = timed_request
+
+    async def on_application_command(self, ctx: discord.ApplicationContext):
+        self._started[ctx.interaction.id] = time.perf_counter()
+
+    def _finish(self, ctx: discord.ApplicationContext, status: str):
+        started = self._started.pop(ctx.interaction.id, None)
+        if started is None:
+            return
+        name = ctx.command.qualified_name if ctx.command else "unknown"
+        self.registry.observe(
+            "command_duration_seconds", time.perf_counter() - started, command=name
+        )
+        self.registry.inc("commands_total", command=name, status=status)
+
+    async def on_application_command_completion(self, ctx: discord.ApplicationContext):
+        self._finish(ctx, "ok")
+
+    async def on_application_command_error(
+        self, ctx: discord.ApplicationContext, error: discord.DiscordException
+    ):
+        self._finish(ctx, "error")
+
+    async def _handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(
+            text=self.registry.render(), content_type="text/plain", charset="utf-8"
+        )
+
+    async def start(self, host: str = METRICS_HOST, port: int = METRICS_PORT):
+        """Запускает HTTP-сервер с метриками, если метрики включены"""
+        if not self.registry.enabled or self._runner is not None:
+            return
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle_metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, host, port).start()
+        except OSError as e:
+            _logger.error(f"Failed to start metrics server on {host}:{port}: {e}")
+            return
+        _logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,496 @@
+import asyncio
+import logging
+import os
+import time
+import urllib.parse
+from typing import Awaitable, Callable, Dict, List, Optional, TypeVar
+
+import aiohttp
+import discord
+import wavelink
+import yarl
+from discord.ext import tasks
+
+from .breaker import (
+    HALF_OPEN,
+    NODE_LOAD_TIMEOUT_MAX,
+    NODE_LOAD_TIMEOUT_MIN,
+    NODE_TIMEOUT_MAX,
+    OPEN,
+    CircuitBreaker,
+)
+from .errors import NodeUnavailable
+from .metrics import _labels, metrics
+from .player import FununaPlayer
+
+NODE_HEALTH_INTERVAL = float(os.environ.get("NODE_HEALTH_INTERVAL", 15))
+NODE_STATS_TIMEOUT = float(os.environ.get("NODE_STATS_TIMEOUT", 3))
+NODE_FAILOVER_GRACE = float(os.environ.get("NODE_FAILOVER_GRACE", 10))
+# на сколько разных нод пробовать отправить поиск, прежде чем сдаться
+NODE_SEARCH_ATTEMPTS = int(os.environ.get("NODE_SEARCH_ATTEMPTS", 2))
+
+_BREAKER_STATES = {"closed": 0, HALF_OPEN: 1, OPEN: 2}
+
+T = TypeVar("T")
+
+metrics.histogram("lavalink_call_duration_seconds", "Lavalink node call time")
+metrics.counter("lavalink_call_failures_total", "Failed Lavalink node calls")
+metrics.counter("lavalink_breaker_trips_total", "Node circuit breaker trips")
+
+
+def parse_nodes_config() -> List[wavelink.Node]:
+    """
+    Собирает список нод из переменных окружения.
+
+    LAVALINK_NODES - список нод через запятую в формате ``[пароль@]хост:порт``,
+    если пароль не указан, используется LAVALINK_PASSWORD.
+    Если LAVALINK_NODES не задан, используется одна нода из LAVALINK_HOST и LAVALINK_PORT
+
+    :return: Список нод
+    """
+    default_password = os.environ.get("LAVALINK_PASSWORD")
+    raw_nodes = os.environ.get("LAVALINK_NODES")
+    if not raw_nodes:
+        raw_nodes = (
+            f"{os.environ.get('LAVALINK_HOST')}:{int(os.environ.get('LAVALINK_PORT'))}"
+        )
+
+    nodes = []
+    for entry in raw_nodes.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        password, _, address = entry.rpartition("@")
+        nodes.append(
+            wavelink.Node(
+                identifier=address,
+                uri=f"http://{address}",
+                password=password or default_password,
+            )
+        )
+    return nodes
+
+
+def node_penalty(node: wavelink.Node, stats: Optional[wavelink.StatsResponsePayload]):
+    """
+    Считает штраф ноды так же, как это делают клиенты Lavalink: учитываются плееры,
+    загрузка CPU и потерянные кадры. Чем меньше штраф, тем свободнее нода
+
+    :param node: Нода
+    :param stats: Последняя статистика ноды, если она есть
+
+    :return: Штраф ноды
+    """
+    # плееры, созданные после последнего опроса статистики, тоже учитываем
+    players = max(len(node.players), stats.players if stats else 0)
+    if not stats:
+        return players
+    cpu_penalty = 1.05 ** (100 * stats.cpu.system_load) * 10 - 10
+    frames_penalty = 0
+    if stats.frames:
+        deficit = max(stats.frames.deficit, 0) / 3000
+        nulled = max(stats.frames.nulled, 0) / 3000
+        frames_penalty = (1.03 ** (500 * deficit) * 600 - 600) + (
+            1.03 ** (500 * nulled) * 300 - 300
+        ) * 2
+    return players + cpu_penalty + frames_penalty
+
+
+def _search_result(response: dict) -> wavelink.Search:
+    """Разбирает ответ loadtracks так же, как wavelink.Pool.fetch_tracks"""
+    load_type = response["loadType"]
+    if load_type == "track":
+        return [wavelink.Playable(data=response["data"])]
+    if load_type == "search":
+        return [wavelink.Playable(data=data) for data in response["data"]]
+    if load_type == "playlist":
+        return wavelink.Playlist(data=response["data"])
+    if load_type == "error":
+        raise wavelink.LavalinkLoadException(data=response["data"])
+    return []
+
+
+class NodePool:
+    """
+    Набор нод Lavalink с выбором наименее нагруженной ноды для новых плееров
+    и переносом плееров с отключившейся ноды на рабочую.
+
+    Вызовы нод проходят через предохранитель ноды с таймаутом, подстроенным под ее задержку:
+    нода, которая перестала отвечать, сразу отклоняет вызовы, поиск уходит на другие ноды,
+    а плееры с нее переносятся перед следующей командой
+    """
+
+    def __init__(self, bot: discord.Bot):
+        self.bot = bot
+        self.stats: Dict[str, wavelink.StatsResponsePayload] = dict()
+        self.breakers: Dict[str, CircuitBreaker] = dict()
+        self.failovers = 0
+        # устанавливается после первого подключения к нодам
+        self.ready = asyncio.Event()
+        self._down_since: Dict[str, float] = dict()
+        self._logger = logging.getLogger("nodes")
+        bot.add_listener(self.on_wavelink_node_closed)
+        metrics.gauge(
+            "lavalink_breaker_state",
+            "Node circuit breaker state: 0 closed, 1 half open, 2 open",
+            self._collect_breakers,
+        )
+
+    async def connect(self):
+        if wavelink.Pool.nodes:
+            return
+        nodes = parse_nodes_config()
+        self._logger.info(f"Connecting to {len(nodes)} Lavalink node(s)...")
+        await wavelink.Pool.connect(nodes=nodes, client=self.bot)
+        if not wavelink.Pool.nodes:
+            # wavelink только пишет ошибки подключения в лог, а запуск должен повториться
+            raise NodeUnavailable("Failed to connect to any Lavalink node")
+        await self.refresh_stats()
+        self.ready.set()
+        if not self.monitor.is_running():
+            self.monitor.start()
+
+    @property
+    def connected_nodes(self) -> List[wavelink.Node]:
+        return [
+            node
+            for node in wavelink.Pool.nodes.values()
+            if node.status is wavelink.NodeStatus.CONNECTED
+        ]
+
+    def penalty(self, node: wavelink.Node) -> float:
+        return node_penalty(node, self.stats.get(node.identifier))
+
+    def breaker(self, node: wavelink.Node) -> CircuitBreaker:
+        breaker = self.breakers.get(node.identifier)
+        if breaker is None:
+            breaker = self.breakers[node.identifier] = CircuitBreaker()
+        return breaker
+
+    def _collect_breakers(self) -> Dict[tuple, float]:
+        return {
+            _labels({"node": identifier}): _BREAKER_STATES[breaker.state]
+            for identifier, breaker in self.breakers.items()
+        }
+
+    def healthy_nodes(self, exclude: wavelink.Node = None) -> List[wavelink.Node]:
+        """
+        Подключенные ноды, предохранитель которых пропускает вызовы, от свободных к загруженным
+
+        :param exclude: Нода, которую не нужно выбирать
+
+        :raise wavelink.InvalidNodeException: Если нет подключенных нод
+        :raise NodeUnavailable: Если предохранители всех подключенных нод разомкнуты
+        :return: Список нод
+        """
+        nodes = [node for node in self.connected_nodes if node != exclude]
+        if not nodes:
+            raise wavelink.InvalidNodeException("No connected Lavalink nodes available")
+        healthy = [node for node in nodes if self.breaker(node).available]
+        if not healthy:
+            raise NodeUnavailable("Circuit breakers of all Lavalink nodes are open")
+        return sorted(healthy, key=self.penalty)
+
+    def best_node(self, exclude: wavelink.Node = None) -> wavelink.Node:
+        """
+        Возвращает наименее нагруженную подключенную ноду с замкнутым предохранителем
+
+        :param exclude: Нода, которую не нужно выбирать
+
+        :raise wavelink.InvalidNodeException: Если нет подключенных нод
+        :raise NodeUnavailable: Если предохранители всех подключенных нод разомкнуты
+        :return: wavelink.Node
+        """
+        return self.healthy_nodes(exclude)[0]
+
+    async def call(
+        self,
+        node: wavelink.Node,
+        operation: str,
+        call: Callable[[], Awaitable[T]],
+        max_timeout: float = NODE_TIMEOUT_MAX,
+        min_timeout: float = None,
+        trip_on_timeout: bool = True,
+    ) -> T:
+        """
+        Выполняет вызов ноды через ее предохранитель
+
+        :param node: Нода
+        :param operation: Название вызова, для каждого таймаут подстраивается отдельно
+        :param call: Функция, создающая корутину вызова
+        :param max_timeout: Верхняя граница таймаута
+        :param min_timeout: Нижняя граница таймаута, по умолчанию NODE_TIMEOUT_MIN
+        :param trip_on_timeout: Считать ли таймаут неудачей ноды. Поиск и загрузка ждут
+            внешний сервис, и их таймаут не говорит о том, что сама нода неисправна
+
+        :raise NodeUnavailable: Если предохранитель разомкнут, нода не ответила за таймаут
+            или недоступна
+        :raise wavelink.LavalinkException: Если Lavalink отклонил запрос
+        :return: Результат вызова
+        """
+        breaker = self.breaker(node)
+        labels = {"node": node.identifier, "operation": operation}
+        if not breaker.allow():
+            metrics.inc("lavalink_call_failures_total", reason="open", **labels)
+            raise NodeUnavailable(f"Circuit breaker of node {node.identifier} is open")
+
+        timeout = breaker.timeout(operation, max_timeout, min_timeout)
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(call(), timeout=timeout)
+        except asyncio.TimeoutError:
+            if trip_on_timeout:
+                self._call_failed(node, breaker, "timeout", labels)
+            else:
+                metrics.inc("lavalink_call_failures_total", reason="timeout", **labels)
+                breaker.release()
+            raise NodeUnavailable(
+                f"Node {node.identifier} did not answer {operation} in {timeout:.1f}s"
+            )
+        except (wavelink.NodeException, aiohttp.ClientError) as e:
+            self._call_failed(node, breaker, "error", labels)
+            raise NodeUnavailable(f"Node {node.identifier} failed {operation}") from e
+        except wavelink.LavalinkException as e:
+            # ошибки 4xx относятся к запросу, а не к ноде
+            if e.status is None or e.status >= 500:
+                self._call_failed(node, breaker, "error", labels)
+            else:
+                breaker.release()
+            raise
+        except BaseException:
+            breaker.release()
+            raise
+
+        latency = time.perf_counter() - started
+        breaker.success(operation, latency)
+        metrics.observe("lavalink_call_duration_seconds", latency, **labels)
+        return result
+
+    def _call_failed(
+        self, node: wavelink.Node, breaker: CircuitBreaker, reason: str, labels: dict
+    ):
+        metrics.inc("lavalink_call_failures_total", reason=reason, **labels)
+        if breaker.failure():
+            metrics.inc("lavalink_breaker_trips_total", node=node.identifier)
+            self._logger.warning(
+                f"Circuit breaker of node {node.identifier} opened after "
+                f"{breaker.failures} failure(s)"
+            )
+
+    async def search(self, query: str, source: str = "ytsearch") -> wavelink.Search:
+        """
+        Ищет треки, как wavelink.Playable.search, но на ноде с замкнутым предохранителем.
+        Если нода не ответила, поиск повторяется на следующей
+
+        :param query: Запрос или ссылка
+        :param source: Провайдер поиска
+
+        :raise NodeUnavailable: Если ни одна нода не ответила
+        :return: Список треков или плейлист
+        """
+        if yarl.URL(query).host:
+            term, operation = query, "load"
+            min_timeout, max_timeout = NODE_LOAD_TIMEOUT_MIN, NODE_LOAD_TIMEOUT_MAX
+        else:
+            term, operation = query, "search"
+            min_timeout, max_timeout = None, NODE_TIMEOUT_MAX
+            if source:
+                term = f"{source.removesuffix(':')}:{query}"
+        encoded = urllib.parse.quote(term)
+
+        error = None
+        for node in self.healthy_nodes()[:NODE_SEARCH_ATTEMPTS]:
+            try:
+                response = await self.call(
+                    node,
+                    operation,
+                    lambda: node._fetch_tracks(encoded),
+                    max_timeout=max_timeout,
+                    min_timeout=min_timeout,
+                    trip_on_timeout=False,
+                )
+            except NodeUnavailable as e:
+                error = e
+                continue
+            return _search_result(response)
+        raise error
+
+    async def _ensure_healthy(self, player: wavelink.Player):
+        """Переносит плеер на другую ноду, если предохранитель его ноды разомкнут"""
+        if self.breaker(player.node).available:
+            return
+        try:
+            target = self.best_node(exclude=player.node)
+        except (wavelink.InvalidNodeException, NodeUnavailable):
+            # переносить некуда, вызов будет отклонен предохранителем
+            return
+        await self.move_player(player, target)
+
+    async def play(self, player: wavelink.Player, track: wavelink.Playable, **kwargs):
+        """Вызывает player.play через предохранитель ноды плеера"""
+        await self._ensure_healthy(player)
+        return await self.call(
+            player.node, "play", lambda: player.play(track, **kwargs)
+        )
+
+    async def set_filters(self, player: wavelink.Player, *args, **kwargs):
+        """Вызывает player.set_filters через предохранитель ноды плеера"""
+        await self._ensure_healthy(player)
+        return await self.call(
+            player.node, "filters", lambda: player.set_filters(*args, **kwargs)
+        )
+
+    async def skip(self, player: wavelink.Player, *, force: bool = True):
+        """Вызывает player.skip через предохранитель ноды плеера"""
+        await self._ensure_healthy(player)
+        return await self.call(player.node, "skip", lambda: player.skip(force=force))
+
+    async def stop(self, player: wavelink.Player, *, force: bool = True):
+        """Вызывает player.stop через предохранитель ноды плеера"""
+        await self._ensure_healthy(player)
+        return await self.call(player.node, "skip", lambda: player.stop(force=force))
+
+    async def pause(self, player: wavelink.Player, value: bool):
+        """Вызывает player.pause через предохранитель ноды плеера"""
+        await self._ensure_healthy(player)
+        return await self.call(player.node, "pause", lambda: player.pause(value))
+
+    async def seek(self, player: wavelink.Player, position: int = 0):
+        """Вызывает player.seek через предохранитель ноды плеера"""
+        await self._ensure_healthy(player)
+        return await self.call(player.node, "seek", lambda: player.seek(position))
+
+    async def set_volume(self, player: wavelink.Player, value: int):
+        """Вызывает player.set_volume через предохранитель ноды плеера"""
+        await self._ensure_healthy(player)
+        return await self.call(player.node, "volume", lambda: player.set_volume(value))
+
+    def create_player(self) -> FununaPlayer:
+        """Плеер для передачи в ``cls`` при подключении к голосовому каналу, размещенный на лучшей ноде"""
+        return FununaPlayer(nodes=[self.best_node()])
+
+    async def _fetch_node_stats(self, node: wavelink.Node):
+        try:
+            with metrics.timer("lavalink_stats_duration_seconds", node=node.identifier):
+                self.stats[node.identifier] = await self.call(
+                    node, "stats", node.fetch_stats, max_timeout=NODE_STATS_TIMEOUT
+                )
+        except (NodeUnavailable, wavelink.LavalinkException) as e:
+            self._logger.warning(
+                f"Failed to fetch stats of node {node.identifier}: {e!r}"
+            )
+
+    async def refresh_stats(self):
+        """Одновременно обновляет статистику всех подключенных нод"""
+        await asyncio.gather(
+            *(self._fetch_node_stats(node) for node in self.connected_nodes)
+        )
+
+    @tasks.loop(seconds=NODE_HEALTH_INTERVAL)
+    async def monitor(self):
+        """Обновляет статистику нод и переносит плееры с нод, которые не вернулись за отведенное время"""
+        await self.refresh_stats()
+        now = time.monotonic()
+        for node in wavelink.Pool.nodes.values():
+            if node.status is wavelink.NodeStatus.CONNECTED:
+                self._down_since.pop(node.identifier, None)
+                continue
+            down_since = self._down_since.setdefault(node.identifier, now)
+            if now - down_since >= NODE_FAILOVER_GRACE:
+                await self.evacuate(node)
+
+    @monitor.error
+    async def monitor_error(self, error: BaseException):
+        self._logger.exception("Node monitor failed", exc_info=error)
+
+    async def on_wavelink_node_closed(
+        self, node: wavelink.Node, disconnected: List[wavelink.Player]
+    ):
+        self._logger.warning(
+            f"Node {node.identifier} closed, {len(disconnected)} player(s) disconnected"
+        )
+        for player in disconnected:
+            await self.recover(player, node)
+
+    async def recover(self, player: wavelink.Player, node: wavelink.Node):
+        """
+        Возвращает плеер, который wavelink отключил при закрытии ноды, и переносит его на рабочую ноду.
+
+        Node.close уничтожает плееры до события wavelink_node_closed: они удаляются из
+        bot.voice_clients и со своей ноды, но очередь, текущий трек и данные голосового
+        подключения остаются в объекте плеера. Бот при этом остается в голосовом канале
+
+        :param player: Отключенный плеер
+        :param node: Закрытая нода
+        """
+        guild = player.guild
+        try:
+            target = self.best_node(exclude=node)
+        except (wavelink.InvalidNodeException, NodeUnavailable):
+            self._logger.error(
+                f"No healthy node to recover player {guild.id} from {node.identifier}"
+            )
+            # без плеера бот не должен оставаться в голосовом канале
+            await guild.change_voice_state(channel=None)
+            return
+        self.bot._connection._add_voice_client(guild.id, player)
+        player._connected = True
+        try:
+            await self.move_player(player, target)
+        except (wavelink.LavalinkException, wavelink.NodeException) as e:
+            self._logger.error(
+                f"Failed to recover player {guild.id} on {target.identifier}: {e!r}"
+            )
+            await player.disconnect()
+
+    async def evacuate(self, node: wavelink.Node):
+        """Переносит все плееры этой ноды на рабочие ноды"""
+        players = [
+            player
+            for player in self.bot.voice_clients
+            if isinstance(player, wavelink.Player) and player.node == node
+        ]
+        for player in players:
+            try:
+                target = self.best_node(exclude=node)
+            except (wavelink.InvalidNodeException, NodeUnavailable):
+                self._logger.error(
+                    f"No healthy node to move player {player.guild.id} from {node.identifier}"
+                )
+                return
+            try:
+                await self.move_player(player, target)
+            except (wavelink.LavalinkException, wavelink.NodeException) as e:
+                self._logger.error(
+                    f"Failed to move player {player.guild.id} to {target.identifier}: {e!r}"
+                )
+
+    async def move_player(self, player: wavelink.Player, node: wavelink.Node):
+        """
+        Переносит плеер на другую ноду, сохраняя очередь, текущий трек, позицию, громкость и фильтры
+
+        :param player: Плеер
+        :param node: Нода, на которую нужно перенести плеер
+        """
+        # wavelink 3.2 не умеет менять ноду плеера, поэтому переносим вручную
+        guild_id = player.guild.id
+        current = player.current
+        position = player.position if current else 0
+        old_node = player.node
+
+        old_node._players.pop(guild_id, None)
+        player._node = node
+        node._players[guild_id] = player
+
+        await player._dispatch_voice_update()
+        if current:
+            await player.play(
+                current,
+                start=position,
+                paused=player.paused,
+                add_history=False,
+            )
+        self.failovers += 1
+        self._logger.info(
+            f"Moved player {guild_id} from {old_node.identifier} to {node.identifier}"
+        )
@@ -0,0 +1,61 @@
+import logging
+import os
+
+import wavelink
+
+from .queue import QUEUE_COMPACT, TrackedQueue
+
+# сколько рекомендаций держать наготове, не больше AUTOPLAY_PREFETCH_LIMIT
+AUTOPLAY_PREFETCH_LIMIT = 10
+AUTOPLAY_PREFETCH_DEPTH = min(
+    max(int(os.environ.get("AUTOPLAY_PREFETCH_DEPTH", 3)), 1), AUTOPLAY_PREFETCH_LIMIT
+)
+
+_logger = logging.getLogger("player")
+
+
+class FununaPlayer(wavelink.Player):
+    """Плеер wavelink с очередями, отслеживающими свои изменения, и заранее подготовленными рекомендациями"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.queue = TrackedQueue(compact=QUEUE_COMPACT)
+        self.auto_queue = TrackedQueue()
+        self.prefetch_depth = AUTOPLAY_PREFETCH_DEPTH
+        # wavelink берет трек из auto_queue, только если в ней больше _auto_cutoff + 1 треков,
+        # иначе при смене трека заново запрашивает рекомендации
+        self._auto_cutoff = self.prefetch_depth - 2
+
+    async def prefetch(self):
+        """
+        Пока играет трек, заранее запрашивает рекомендации автовоспроизведения,
+        чтобы при смене трека не ждать ответа провайдера
+        """
+        if (
+            self.autoplay is not wavelink.AutoPlayMode.enabled
+            or not self.current
+            or len(self.queue) >= self.prefetch_depth
+            or len(self.auto_queue) >= self.prefetch_depth
+            or self._auto_lock.locked()
+        ):
+            return
+        async with self._auto_lock:
+            # пока ждали блокировку, трек мог закончиться
+            if not self.current or len(self.auto_queue) >= self.prefetch_depth:
+                return
+            try:
+                await self._do_recommendation()
+            except Exception:
+                _logger.exception(
+                    f"Failed to prefetch recommendations for {self.guild.id}"
+                )
+            # _do_recommendation запускает таймер бездействия, но трек еще играет.
+            # Задача таймера еще не начала выполняться, и ее обратный вызов упал бы на CancelledError
+            if self._inactivity_task is not None:
+                self._inactivity_task.remove_done_callback(
+                    self._inactivity_task_callback
+                )
+            self._inactivity_cancel()
+        _logger.debug(
+            f"Prefetched recommendations for {self.guild.id}, {len(self.auto_queue)} ready"
+        )
@@ -0,0 +1,240 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Tuple
+
+import discord
+import wavelink
+from discord.ext import tasks
+
+from utils import count_listeners
+
+from .storage import Storage
+
+PLAYER_STATE_INTERVAL = float(os.environ.get("PLAYER_STATE_INTERVAL", 10))
+PLAYER_STATE_HISTORY = int(os.environ.get("PLAYER_STATE_HISTORY", 50))
+PLAYER_STATE_MAX_AGE = float(os.environ.get("PLAYER_STATE_MAX_AGE", 60 * 60))
+PLAYER_RESTORE_CONCURRENCY = int(os.environ.get("PLAYER_RESTORE_CONCURRENCY", 10))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS player_state (
+    guild_id INTEGER PRIMARY KEY,
+    channel_id INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    position INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+def _dump_track(track: wavelink.Playable) -> dict:
+    return {**track.raw_data, "userData": dict(track.extras)}
+
+
+def _load_track(data: dict) -> wavelink.Playable:
+    return wavelink.Playable(data)
+
+
+class PlayerStateStore:
+    """
+    Сохранение состояния плееров на диск и восстановление после перезапуска.
+
+    Раз в PLAYER_STATE_INTERVAL секунд состояние каждого плеера сравнивается с последним сохраненным.
+    Полный снимок (очередь, история, громкость, фильтры, режимы) записывается только если он изменился,
+    для остальных плееров одним пакетом обновляется только позиция трека
+    """
+
+    def __init__(self, bot: discord.Bot, storage: Storage):
+        self.bot = bot
+        self.storage = storage
+        self.snapshots = 0
+        self.restored = 0
+        self._fingerprints: Dict[int, tuple] = dict()
+        self._ready = False
+        self._logger = logging.getLogger("player_state")
+
+    @staticmethod
+    def _fingerprint(player: wavelink.Player) -> tuple:
+        """Дешевый отпечаток состояния плеера без сериализации треков"""
+        return (
+            player.channel.id,
+            getattr(player.queue, "version", None),
+            getattr(player.queue.history, "version", None),
+            id(player.current),
+            player.paused,
+            player.volume,
+            player.autoplay,
+            player.queue.mode,
+            json.dumps(player.filters(), sort_keys=True),
+        )
+
+    @staticmethod
+    def _snapshot(player: wavelink.Player) -> dict:
+        history = list(player.queue.history)[-PLAYER_STATE_HISTORY:]
+        return {
+            "current": _dump_track(player.current) if player.current else None,
+            "queue": [_dump_track(track) for track in player.queue],
+            "history": [_dump_track(track) for track in history],
+            "paused": player.paused,
+            "volume": player.volume,
+            "autoplay": player.autoplay.value,
+            "mode": player.queue.mode.value,
+            "filters": player.filters(),
+        }
+
+    @staticmethod
+    def _write(
+        connection,
+        snapshots: List[Tuple[int, int, dict, int]],
+        positions: List[Tuple[int, int]],
+        removed: List[int],
+    ):
+        # сериализация больших очередей тоже выполняется в потоке хранилища
+        now = time.time()
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO player_state (guild_id, channel_id, state, position, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (guild_id, channel_id, json.dumps(state), position, now)
+                    for guild_id, channel_id, state, position in snapshots
+                ],
+            )
+            connection.executemany(
+                "UPDATE player_state SET position = ?, updated_at = ? WHERE guild_id = ?",
+                [(position, now, guild_id) for guild_id, position in positions],
+            )
+            connection.executemany(
+                "DELETE FROM player_state WHERE guild_id = ?",
+                [(guild_id,) for guild_id in removed],
+            )
+
+    async def save(self):
+        """Записывает изменения состояния всех плееров одним пакетом"""
+        snapshots = []
+        positions = []
+        active = set()
+        for player in self.bot.voice_clients:
+            if not isinstance(player, wavelink.Player) or not player.channel:
+                continue
+            guild_id = player.guild.id
+            active.add(guild_id)
+            fingerprint = self._fingerprint(player)
+            if self._fingerprints.get(guild_id) != fingerprint:
+                self._fingerprints[guild_id] = fingerprint
+                snapshots.append(
+                    (
+                        guild_id,
+                        player.channel.id,
+                        self._snapshot(player),
+                        player.position,
+                    )
+                )
+            elif player.playing:
+                positions.append((guild_id, player.position))
+        removed = [
+            guild_id for guild_id in self._fingerprints if guild_id not in active
+        ]
+        for guild_id in removed:
+            del self._fingerprints[guild_id]
+
+        if snapshots or positions or removed:
+            await self.storage.run(self._write, snapshots, positions, removed)
+            self.snapshots += len(snapshots)
+
+    @tasks.loop(seconds=PLAYER_STATE_INTERVAL)
+    async def saver(self):
+        await self.save()
+
+    @saver.error
+    async def saver_error(self, error: BaseException):
+        self._logger.exception("Failed to save player state", exc_info=error)
+
+    async def restore(self):
+        """
+        Восстанавливает сохраненные плееры и начинает периодически сохранять состояние.
+        Вызывается один раз, когда кэш серверов уже заполнен и ноды подключены
+        """
+        if self._ready:
+            return
+        self._ready = True
+        await self.storage.executescript(SCHEMA)
+        rows = await self.storage.fetchall(
+            "SELECT guild_id, channel_id, state, position, updated_at FROM player_state"
+        )
+        # берем только серверы этого процесса, остальные принадлежат другим процессам кластера
+        rows = [row for row in rows if self.bot.get_guild(row[0]) is not None]
+        # записи, которые не удастся восстановить, удалит первое сохранение
+        for guild_id, *_ in rows:
+            self._fingerprints[guild_id] = ()
+
+        started = time.perf_counter()
+        semaphore = asyncio.Semaphore(PLAYER_RESTORE_CONCURRENCY)
+        results = await asyncio.gather(
+            *(self._restore_player(semaphore, *row) for row in rows),
+            return_exceptions=True,
+        )
+        for row, result in zip(rows, results):
+            if isinstance(result, BaseException):
+                self._logger.error(
+                    f"Failed to restore player {row[0]}: {result!r}", exc_info=result
+                )
+        self.restored = sum(result is True for result in results)
+        if rows:
+            self._logger.info(
+                f"Restored {self.restored}/{len(rows)} players in {time.perf_counter() - started:.2f}s"
+            )
+        self.saver.start()
+
+    async def _restore_player(
+        self,
+        semaphore: asyncio.Semaphore,
+        guild_id: int,
+        channel_id: int,
+        raw_state: str,
+        position: int,
+        updated_at: float,
+    ) -> bool:
+        if time.time() - updated_at > PLAYER_STATE_MAX_AGE:
+            return False
+        guild = self.bot.get_guild(guild_id)
+        channel = guild.get_channel(channel_id) if guild else None
+        if (
+            channel is None
+            or guild.voice_client is not None
+            or count_listeners(channel, self.bot.user.id) == 0
+        ):
+            return False
+
+        state = await asyncio.to_thread(json.loads, raw_state)
+        async with semaphore:
+            player: wavelink.Player = await channel.connect(
+                cls=self.bot.node_pool.create_player()
+            )
+        player.autoplay = wavelink.AutoPlayMode(state["autoplay"])
+        player.queue.mode = wavelink.QueueMode(state["mode"])
+        player.queue.put([_load_track(track) for track in state["queue"]])
+        player.queue.history.put([_load_track(track) for track in state["history"]])
+
+        self.bot.dispatch("player_restored", player)
+        if state["current"]:
+            await self.bot.node_pool.play(
+                player,
+                _load_track(state["current"]),
+                start=position,
+                volume=state["volume"],
+                paused=state["paused"],
+                filters=wavelink.Filters(data=state["filters"]),
+                add_history=False,
+            )
+        else:
+            await self.bot.node_pool.set_volume(player, state["volume"])
+        return True
+
+    async def close(self):
+        """Останавливает периодическое сохранение и записывает последнее состояние"""
+        if self.saver.is_running():
+            self.saver.cancel()
+            await self.save()
@@ -0,0 +1,223 @@
+import asyncio
+import os
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+import wavelink
+
+QUEUE_COMPACT = os.environ.get("QUEUE_COMPACT", "0").lower() in ("1", "true", "yes")
+
+# одинаковые extras (например, у всех треков одного плейлиста) хранятся в одном словаре
+_EXTRAS_INTERN_LIMIT = 4096
+_interned_extras: Dict[tuple, dict] = dict()
+
+
+def _intern_extras(extras: dict) -> dict:
+    key = tuple(sorted(extras.items(), key=lambda item: item[0]))
+    try:
+        return _interned_extras.setdefault(key, extras)
+    except TypeError:
+        # в extras есть нехэшируемые значения
+        return extras
+    finally:
+        if len(_interned_extras) > _EXTRAS_INTERN_LIMIT:
+            _interned_extras.clear()
+
+
+class CompactTrack:
+    """
+    Компактная запись трека в очереди: закодированный трек Lavalink и поля для отображения.
+
+    В Playable обратно превращается только перед воспроизведением
+    """
+
+    __slots__ = (
+        "encoded",
+        "identifier",
+        "title",
+        "author",
+        "length",
+        "uri",
+        "artwork",
+        "source",
+        "is_stream",
+        "is_seekable",
+        "extras",
+    )
+
+    def __init__(self, track: wavelink.Playable):
+        self.encoded = track.encoded
+        self.identifier = track.identifier
+        self.title = track.title
+        self.author = track.author
+        self.length = track.length
+        self.uri = track.uri
+        self.artwork = track.artwork
+        self.source = track.source
+        self.is_stream = track.is_stream
+        self.is_seekable = track.is_seekable
+        self.extras = _intern_extras(dict(track.extras))
+
+    @property
+    def raw_data(self) -> dict:
+        """Данные трека в формате Lavalink, достаточные для воспроизведения"""
+        return {
+            "encoded": self.encoded,
+            "info": {
+                "identifier": self.identifier,
+                "isSeekable": self.is_seekable,
+                "author": self.author,
+                "length": self.length,
+                "isStream": self.is_stream,
+                "position": 0,
+                "title": self.title,
+                "uri": self.uri,
+                "artworkUrl": self.artwork,
+                "isrc": None,
+                "sourceName": self.source,
+            },
+            "pluginInfo": {},
+            "userData": dict(self.extras),
+        }
+
+    def decode(self) -> wavelink.Playable:
+        return wavelink.Playable(self.raw_data)
+
+    def __eq__(self, other: object) -> bool:
+        # как и у Playable, треки равны при совпадении кода или идентификатора
+        if isinstance(other, (CompactTrack, wavelink.Playable)):
+            return self.encoded == other.encoded or self.identifier == other.identifier
+        return NotImplemented
+
+    def __str__(self) -> str:
+        return self.title
+
+
+def _decode(track):
+    return track.decode() if isinstance(track, CompactTrack) else track
+
+
+class TrackedQueue(wavelink.Queue):
+    """
+    Очередь wavelink, которая ведет счетчик изменений.
+
+    После каждого изменения увеличивается ``version`` и запоминается индекс, начиная с которого
+    изменилась очередь, чтобы отображение могло перерисовать только затронутую часть.
+    В компактном режиме треки хранятся как CompactTrack, а get и get_at возвращают Playable
+    """
+
+    # сколько последних изменений помнить для changed_from
+    CHANGES_HISTORY = 64
+
+    def __init__(self, *, history: bool = True, compact: bool = False):
+        super().__init__(history=False)
+        self.compact = compact
+        self._history = (
+            TrackedQueue(history=False, compact=compact) if history else None
+        )
+        self.version = 0
+        self._changes: Deque[Tuple[int, int]] = deque(maxlen=self.CHANGES_HISTORY)
+        self._changed = asyncio.Event()
+
+    def _touch(self, index: int = 0):
+        self.version += 1
+        self._changes.append((self.version, index))
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def changed_from(self, version: int) -> int:
+        """
+        Возвращает наименьший индекс, измененный после указанной версии
+
+        :param version: Версия очереди, которую видел потребитель
+
+        :return: Индекс первого измененного трека
+        """
+        if version >= self.version:
+            return len(self)
+        if not self._changes or self._changes[0][0] > version + 1:
+            # изменения старше сохраненной истории, считаем что изменилось все
+            return 0
+        return min(index for change, index in self._changes if change > version)
+
+    async def wait_for_change(self, version: int):
+        """Ждет, пока версия очереди не станет больше указанной"""
+        while self.version <= version:
+            await self._changed.wait()
+
+    @staticmethod
+    def _check_compatibility(item: object) -> bool:
+        if not isinstance(item, (wavelink.Playable, CompactTrack)):
+            raise TypeError("This queue is restricted to Playable objects.")
+        return True
+
+    def _pack(self, item):
+        """В компактном режиме заменяет Playable на CompactTrack"""
+        if not self.compact:
+            return item
+        if isinstance(item, wavelink.Playable):
+            return CompactTrack(item)
+        if isinstance(item, (list, wavelink.Playlist)):
+            return [self._pack(track) for track in item]
+        return item
+
+    def get(self) -> wavelink.Playable:
+        track = super().get()
+        self._touch(0)
+        return _decode(track)
+
+    def get_at(self, index: int, /) -> wavelink.Playable:
+        track = super().get_at(index)
+        self._touch(index)
+        return _decode(track)
+
+    def put_at(self, index: int, value: wavelink.Playable, /) -> None:
+        super().put_at(index, self._pack(value))
+        self._touch(index)
+
+    def put(self, item, /, *, atomic: bool = True) -> int:
+        index = len(self)
+        added = super().put(self._pack(item), atomic=atomic)
+        self._touch(index)
+        return added
+
+    async def put_wait(self, item, /, *, atomic: bool = True) -> int:
+        index = len(self)
+        added = await super().put_wait(self._pack(item), atomic=atomic)
+        self._touch(index)
+        return added
+
+    def __setitem__(self, index, value: wavelink.Playable, /) -> None:
+        super().__setitem__(index, self._pack(value))
+        self._touch(index if isinstance(index, int) and index >= 0 else 0)
+
+    def __delitem__(self, index, /) -> None:
+        super().__delitem__(index)
+        if isinstance(index, slice):
+            index = index.start
+        self._touch(index if isinstance(index, int) and index >= 0 else 0)
+
+    def delete(self, index: int, /) -> None:
+        super().delete(index)
+        self._touch(max(index, 0))
+
+    def swap(self, first: int, second: int, /) -> None:
+        super().swap(first, second)
+        self._touch(max(min(first, second), 0))
+
+    def shuffle(self) -> None:
+        super().shuffle()
+        self._touch(0)
+
+    def clear(self) -> None:
+        super().clear()
+        self._touch(0)
+
+    def remove(self, item: wavelink.Playable, /, count: Optional[int] = 1) -> int:
+        removed = super().remove(item, count=count)
+        self._touch(0)
+        return removed
+
+    def reset(self) -> None:
+        super().reset()
+        self._touch(0)
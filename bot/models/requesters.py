@@ -0,0 +1,100 @@
+import os
+from typing import Optional
+
+import discord
+
+from utils import TTLCache
+
+REQUESTER_CACHE_SIZE = int(os.environ.get("REQUESTER_CACHE_SIZE", 2048))
+REQUESTER_CACHE_TTL = float(os.environ.get("REQUESTER_CACHE_TTL", 60 * 60))
+
+
+class Requester:
+    """Имя и аватар пользователя, запросившего трек"""
+
+    __slots__ = ("id", "name", "avatar_url")
+
+    def __init__(self, id: int, name: str, avatar_url: str):
+        self.id = id
+        self.name = name
+        self.avatar_url = avatar_url
+
+    @classmethod
+    def from_user(cls, user: discord.abc.User) -> "Requester":
+        return cls(user.id, user.name, user.display_avatar.url)
+
+    @classmethod
+    def from_extras(cls, extras: dict) -> Optional["Requester"]:
+        if not extras.get("requester_name"):
+            return None
+        return cls(
+            extras["requester"],
+            extras["requester_name"],
+            extras.get("requester_avatar"),
+        )
+
+    def to_extras(self) -> dict:
+        return {
+            "requester": self.id,
+            "requester_name": self.name,
+            "requester_avatar": self.avatar_url,
+        }
+
+
+class RequesterCache:
+    """
+    Поиск информации о пользователях, запросивших треки.
+    Сначала проверяется кэш участников сервера, затем собственный кэш, и только потом REST
+    """
+
+    def __init__(
+        self,
+        bot: discord.Bot,
+        maxsize: int = REQUESTER_CACHE_SIZE,
+        ttl: float = REQUESTER_CACHE_TTL,
+    ):
+        self.bot = bot
+        self._users = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.fetches = 0
+
+    def extras_for(self, user: discord.abc.User) -> dict:
+        """
+        Возвращает extras трека с информацией о пользователе, чтобы при отрисовке не нужно было его искать
+
+        :param user: Пользователь, добавивший трек
+
+        :return: Словарь для Playable.extras
+        """
+        requester = Requester.from_user(user)
+        self._users.set(user.id, requester)
+        return requester.to_extras()
+
+    async def resolve(
+        self, guild: Optional[discord.Guild], user_id: int
+    ) -> Optional[Requester]:
+        """
+        Возвращает информацию о пользователе по ID
+
+        :param guild: Сервер, в кэше участников которого нужно искать пользователя
+        :param user_id: ID пользователя
+
+        :return: Requester или None, если пользователь не найден
+        """
+        member = guild.get_member(user_id) if guild else None
+        if member:
+            return Requester.from_user(member)
+
+        requester = self._users.get(user_id)
+        if requester:
+            return requester
+
+        user = self.bot.get_user(user_id)
+        if user is None:
+            try:
+                self.fetches += 1
+                user = await self.bot.fetch_user(user_id)
+            except discord.NotFound:
+                return None
+        requester = Requester.from_user(user)
+        self._users.set(user_id, requester)
+        return requester
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+from typing import List, Optional
+
+import discord
+import psutil
+from discord.ext import tasks
+
+from .cluster import CLUSTER_ID, read_health, write_health
+
+STATUS_SAMPLE_INTERVAL = float(os.environ.get("STATUS_SAMPLE_INTERVAL", 15))
+
+
+class HostSnapshot:
+    """Показатели сервера, на котором запущен бот"""
+
+    __slots__ = (
+        "hostname",
+        "cpu_percent",
+        "load_average",
+        "ram_total",
+        "ram_free",
+        "process_memory",
+        "boot_time",
+        "sampled_at",
+    )
+
+    def __init__(self):
+        memory = psutil.virtual_memory()
+        self.hostname = socket.gethostname()
+        self.cpu_percent = psutil.cpu_percent()
+        self.load_average = psutil.getloadavg()
+        self.ram_total = memory.total
+        self.ram_free = memory.available
+        self.process_memory = psutil.Process().memory_info().rss
+        self.boot_time = psutil.boot_time()
+        self.sampled_at = time.time()
+
+    @property
+    def ram_used(self) -> int:
+        return self.ram_total - self.ram_free
+
+
+class StatusSampler:
+    """
+    Фоновый сбор статистики для /status.
+
+    Показатели сервера собираются в отдельном потоке, статистику нод одновременно и с ограничением
+    времени собирает NodePool.monitor, а /status только отображает последние снимки
+    """
+
+    def __init__(self, bot: discord.Bot):
+        self.bot = bot
+        self.host: Optional[HostSnapshot] = None
+        # состояния всех процессов кластера, если бот запущен через bot.cluster
+        self.cluster: List[dict] = list()
+        self._logger = logging.getLogger("sampler")
+
+    def start(self):
+        if not self.sample.is_running():
+            self.sample.start()
+
+    @tasks.loop(seconds=STATUS_SAMPLE_INTERVAL)
+    async def sample(self):
+        self.host = await asyncio.to_thread(HostSnapshot)
+        if CLUSTER_ID is not None:
+            self.cluster = await asyncio.to_thread(
+                self._exchange_health, self._health()
+            )
+
+    def _health(self) -> dict:
+        return {
+            "cluster_id": CLUSTER_ID,
+            "pid": os.getpid(),
+            "shards": sorted(self.bot.shards) if self.bot.shards else [0],
+            "guilds": len(self.bot.guilds),
+            "players": len(self.bot.voice_clients),
+            "latency": self.bot.latency,
+            "memory": self.host.process_memory,
+            "uptime": self.bot_uptime,
+            "updated_at": time.time(),
+        }
+
+    @staticmethod
+    def _exchange_health(health: dict) -> List[dict]:
+        write_health(health)
+        return read_health()
+
+    @sample.error
+    async def sample_error(self, error: BaseException):
+        self._logger.exception("Status sampler failed", exc_info=error)
+
+    @property
+    def bot_uptime(self) -> float:
+        return time.perf_counter() - self.bot.started_at
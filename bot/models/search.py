@@ -0,0 +1,341 @@
+import asyncio
+import copy
+import logging
+import os
+import re
+import sys
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import wavelink
+import yarl
+
+from utils import TTLCache
+
+from .errors import NodeUnavailable
+from .metrics import metrics
+
+SEARCH_CACHE_SIZE = int(os.environ.get("SEARCH_CACHE_SIZE", 512))
+SEARCH_CACHE_TTL = float(os.environ.get("SEARCH_CACHE_TTL", 15 * 60))
+SEARCH_CACHE_MEMORY = int(os.environ.get("SEARCH_CACHE_MEMORY", 32 * 1024 * 1024))
+
+# провайдер "auto" ищет во всех провайдерах из AUTO_SEARCH_PROVIDERS одновременно
+AUTO_SOURCE = "auto"
+AUTO_SEARCH_PROVIDERS = [
+    provider.strip()
+    for provider in os.environ.get("AUTO_SEARCH_PROVIDERS", "ymsearch,ytsearch").split(
+        ","
+    )
+    if provider.strip()
+]
+AUTO_SEARCH_TIMEOUT = float(os.environ.get("AUTO_SEARCH_TIMEOUT", 5))
+# таймауты отдельных провайдеров в формате ``провайдер=секунды``, через запятую
+AUTO_SEARCH_TIMEOUTS = {
+    provider.strip(): float(timeout)
+    for provider, _, timeout in (
+        entry.partition("=")
+        for entry in os.environ.get("AUTO_SEARCH_TIMEOUTS", "").split(",")
+        if "=" in entry
+    )
+}
+# сколько разных треков достаточно, чтобы не ждать остальных провайдеров
+AUTO_SEARCH_ENOUGH = int(os.environ.get("AUTO_SEARCH_ENOUGH", 5))
+# треки с одинаковыми названием и автором считаются одним, если длительность отличается не больше этого
+DUPLICATE_DURATION_TOLERANCE = 3000
+
+# Примерный размер объекта Playable без учета строк из ответа Lavalink
+_TRACK_OVERHEAD = 2048
+
+_WHITESPACE = re.compile(r"\s+")
+_BRACKETS = re.compile(r"[(\[][^)\]]*[)\]]")
+_FEATURING = re.compile(r"\s(feat\.?|ft\.?|featuring)\s.*$")
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_AUTHOR_SUFFIXES = (" - topic", "vevo", " official")
+
+metrics.histogram(
+    "search_provider_duration_seconds", "Search time of each provider in auto search"
+)
+metrics.counter(
+    "search_provider_wins_total", "Auto searches where the provider answered first"
+)
+metrics.counter(
+    "search_provider_timeouts_total", "Auto searches where the provider timed out"
+)
+
+
+def normalize_query(query: str) -> str:
+    """
+    Приводит запрос к виду, по которому он хранится в кэше.
+    Ссылки не меняются, так как идентификаторы в них чувствительны к регистру
+
+    :param query: Запрос пользователя
+
+    :return: Нормализованный запрос
+    """
+    query = query.strip()
+    if yarl.URL(query).host:
+        return query
+    return _WHITESPACE.sub(" ", query).casefold()
+
+
+def _normalize_text(text: str) -> str:
+    text = _BRACKETS.sub(" ", text.casefold())
+    text = _FEATURING.sub("", text)
+    return _WHITESPACE.sub(" ", _PUNCTUATION.sub(" ", text)).strip()
+
+
+def _normalize_author(author: str) -> str:
+    author = author.casefold().strip()
+    for suffix in _AUTHOR_SUFFIXES:
+        author = author.removesuffix(suffix)
+    return _normalize_text(author)
+
+
+class TrackMerger:
+    """
+    Объединяет результаты разных провайдеров без повторов.
+
+    Трек считается повтором, если совпадает ISRC, или если совпадают нормализованные
+    название и автор, а длительность отличается не больше DUPLICATE_DURATION_TOLERANCE
+    """
+
+    def __init__(self):
+        self.tracks: List[wavelink.Playable] = list()
+        self._isrc = set()
+        # (название, автор) -> длительности добавленных треков
+        self._durations: Dict[Tuple[str, str], List[int]] = dict()
+
+    def __len__(self) -> int:
+        return len(self.tracks)
+
+    def add(self, track: wavelink.Playable) -> bool:
+        """
+        Добавляет трек, если его еще нет
+
+        :return: True, если трек добавлен
+        """
+        if track.isrc and track.isrc in self._isrc:
+            return False
+        key = (_normalize_text(track.title), _normalize_author(track.author))
+        durations = self._durations.setdefault(key, [])
+        if any(
+            abs(track.length - length) <= DUPLICATE_DURATION_TOLERANCE
+            for length in durations
+        ):
+            return False
+        durations.append(track.length)
+        if track.isrc:
+            self._isrc.add(track.isrc)
+        self.tracks.append(track)
+        return True
+
+    def extend(self, tracks: List[wavelink.Playable]):
+        for track in tracks:
+            self.add(track)
+
+
+def _track_size(track: wavelink.Playable) -> int:
+    info = track.raw_data["info"]
+    return (
+        _TRACK_OVERHEAD
+        + sys.getsizeof(track.encoded)
+        + sum(sys.getsizeof(value) for value in info.values())
+    )
+
+
+def _result_size(result: wavelink.Search) -> int:
+    tracks = result.tracks if isinstance(result, wavelink.Playlist) else result
+    return sum(_track_size(track) for track in tracks)
+
+
+def _copy_result(result: wavelink.Search) -> wavelink.Search:
+    """Возвращает копию результата, чтобы extras треков не разделялись между серверами"""
+    if isinstance(result, wavelink.Playlist):
+        playlist = copy.copy(result)
+        playlist.tracks = [
+            wavelink.Playable(track.raw_data, playlist=track.playlist)
+            for track in result.tracks
+        ]
+        return playlist
+    return [wavelink.Playable(track.raw_data) for track in result]
+
+
+class SearchCache:
+    """
+    Кэш результатов поиска Lavalink.
+
+    Одинаковые запросы, выполняющиеся одновременно, разделяют один запрос к Lavalink.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str, str], Awaitable[wavelink.Search]] = None,
+        maxsize: int = SEARCH_CACHE_SIZE,
+        ttl: float = SEARCH_CACHE_TTL,
+        max_memory: int = SEARCH_CACHE_MEMORY,
+    ):
+        self._cache = TTLCache(
+            maxsize=maxsize, ttl=ttl, max_memory=max_memory, sizeof=_result_size
+        )
+        self._in_flight: Dict[Tuple[str, str], asyncio.Future] = dict()
+        # функция поиска, по умолчанию поиск wavelink на ноде, которую выберет wavelink.Pool
+        self._search = fetch or wavelink.Playable.search
+        self.shared = 0
+        self.auto = AutoSearch(self)
+        self._logger = logging.getLogger("search_cache")
+
+    async def search(self, query: str, source: str) -> wavelink.Search:
+        """
+        Ищет треки через кэш, обращаясь к Lavalink только при промахе
+
+        :param query: Запрос
+        :param source: Провайдер поиска, например ytsearch
+
+        :return: Список треков или плейлист
+        """
+        if source == AUTO_SOURCE:
+            return await self.auto.search(query)
+        key = (source, normalize_query(query))
+        result = self._cache.get(key)
+        if result is not None:
+            return _copy_result(result)
+
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.shared += 1
+        else:
+            future = asyncio.ensure_future(self._fetch(key, query, source))
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        # shield, чтобы отмена одного ожидающего не отменяла запрос для остальных
+        result = await asyncio.shield(future)
+        return _copy_result(result)
+
+    async def _fetch(self, key: Tuple[str, str], query: str, source: str):
+        with metrics.timer("lavalink_search_duration_seconds", source=source):
+            result = await self._search(query, source=source)
+        # пустые результаты не кэшируем, они часто бывают временными
+        if result:
+            self._cache.set(key, result)
+        self._logger.debug(f"Cache miss for {key}, cached {bool(result)}")
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        stats = self._cache.stats()
+        stats["shared"] = self.shared
+        stats["in_flight"] = len(self._in_flight)
+        return stats
+
+
+class AutoSearch:
+    """
+    Поиск сразу во всех провайдерах.
+
+    Провайдеры опрашиваются одновременно через SearchCache, у каждого свой таймаут.
+    Как только набирается AUTO_SEARCH_ENOUGH разных треков, остальные провайдеры не ждем:
+    их запросы продолжаются в SearchCache и попадут в кэш. Первым в результате идет провайдер,
+    ответивший первым, треки остальных добавляются без повторов
+    """
+
+    def __init__(
+        self,
+        cache: SearchCache,
+        providers: List[str] = None,
+        timeouts: Dict[str, float] = None,
+        enough: int = AUTO_SEARCH_ENOUGH,
+    ):
+        self.cache = cache
+        self.providers = providers or AUTO_SEARCH_PROVIDERS
+        self.timeouts = AUTO_SEARCH_TIMEOUTS if timeouts is None else timeouts
+        self.enough = enough
+        self._stats = {
+            provider: {
+                "requests": 0,
+                "wins": 0,
+                "timeouts": 0,
+                "errors": 0,
+                "latency": None,
+            }
+            for provider in self.providers
+        }
+
+    async def _search_provider(
+        self, query: str, provider: str
+    ) -> Tuple[str, Optional[wavelink.Search]]:
+        stats = self._stats[provider]
+        stats["requests"] += 1
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(
+                self.cache.search(query, provider),
+                timeout=self.timeouts.get(provider, AUTO_SEARCH_TIMEOUT),
+            )
+        except asyncio.TimeoutError:
+            stats["timeouts"] += 1
+            metrics.inc("search_provider_timeouts_total", provider=provider)
+            return provider, None
+        except (wavelink.LavalinkException, wavelink.NodeException, NodeUnavailable):
+            stats["errors"] += 1
+            raise
+        latency = time.perf_counter() - started
+        metrics.observe("search_provider_duration_seconds", latency, provider=provider)
+        # скользящее среднее, чтобы в /status была видна текущая скорость провайдера
+        stats["latency"] = (
+            latency
+            if stats["latency"] is None
+            else stats["latency"] * 0.8 + latency * 0.2
+        )
+        return provider, result
+
+    async def search(self, query: str) -> wavelink.Search:
+        """
+        Ищет треки во всех провайдерах
+
+        :param query: Запрос
+        :raise wavelink.LavalinkException: Если все провайдеры завершились ошибкой
+
+        :return: Объединенный список треков или плейлист
+        """
+        if yarl.URL(query.strip()).host:
+            # ссылка загружается одинаково в любом провайдере
+            return await self.cache.search(query, self.providers[0])
+
+        tasks = [
+            asyncio.ensure_future(self._search_provider(query, provider))
+            for provider in self.providers
+        ]
+        merger = TrackMerger()
+        errors = []
+        winner = None
+        try:
+            for completed in asyncio.as_completed(tasks):
+                try:
+                    provider, result = await completed
+                except (
+                    wavelink.LavalinkException,
+                    wavelink.NodeException,
+                    NodeUnavailable,
+                ) as e:
+                    errors.append(e)
+                    continue
+                if not result:
+                    continue
+                if winner is None:
+                    winner = provider
+                    self._stats[provider]["wins"] += 1
+                    metrics.inc("search_provider_wins_total", provider=provider)
+                if isinstance(result, wavelink.Playlist):
+                    return result
+                merger.extend(result)
+                if len(merger) >= self.enough:
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        if not merger.tracks and len(errors) == len(tasks):
+            raise errors[0]
+        return merger.tracks
+
+    def stats(self) -> Dict[str, dict]:
+        return {provider: dict(stats) for provider, stats in self._stats.items()}
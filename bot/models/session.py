@@ -0,0 +1,71 @@
+import asyncio
+from typing import Coroutine, Optional, Set
+
+import discord
+import wavelink
+
+
+class GuildSession:
+    """
+    Состояние музыкальной сессии сервера: плеер, канал и сообщение с текущим треком, фоновые задачи.
+
+    Сессия создается при подключении бота к голосовому каналу и закрывается при отключении.
+    Сообщение хранится как PartialMessage, чтобы редактировать его без запроса самого сообщения
+    """
+
+    __slots__ = (
+        "guild_id",
+        "announce_channel_id",
+        "announce_message",
+        "player",
+        "updater",
+        "tasks",
+    )
+
+    def __init__(
+        self,
+        guild_id: int,
+        announce_channel_id: int = None,
+        player: wavelink.Player = None,
+    ):
+        self.guild_id = guild_id
+        self.announce_channel_id = announce_channel_id
+        self.announce_message: Optional[discord.PartialMessage] = None
+        self.player: Optional[wavelink.Player] = player
+        # MessageUpdater сообщения с текущим треком
+        self.updater = None
+        self.tasks: Set[asyncio.Task] = set()
+
+    def set_announce_message(self, bot: discord.Bot, message_id: int):
+        # без типа канала discord.py не дает создать PartialMessage
+        channel = bot.get_partial_messageable(
+            self.announce_channel_id, type=discord.ChannelType.text
+        )
+        self.announce_message = channel.get_partial_message(message_id)
+
+    def set_announce_channel(self, channel_id: int):
+        """Меняет канал для сообщений с текущим треком, старое сообщение больше не редактируется"""
+        if self.announce_channel_id == channel_id:
+            return
+        self.announce_channel_id = channel_id
+        self.announce_message = None
+        if self.updater is not None:
+            self.updater.cancel()
+            self.updater = None
+
+    def create_task(self, coro: Coroutine) -> asyncio.Task:
+        """Запускает фоновую задачу, которая будет отменена при закрытии сессии"""
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    def close(self):
+        """Отменяет отложенные обновления сообщения и фоновые задачи"""
+        if self.updater is not None:
+            self.updater.cancel()
+            self.updater = None
+        for task in self.tasks:
+            task.cancel()
+        self.tasks.clear()
+        self.player = None
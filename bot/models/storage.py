@@ -0,0 +1,128 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+STORAGE_PATH = os.environ.get("STORAGE_PATH", "data/fununa-nun.sqlite3")
+# сколько секунд ждать, пока другой процесс кластера закончит запись в тот же файл
+STORAGE_BUSY_TIMEOUT = float(os.environ.get("STORAGE_BUSY_TIMEOUT", 10))
+
+KV_SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class Storage:
+    """
+    Локальное хранилище SQLite.
+
+    Все запросы выполняются в одном отдельном потоке, чтобы не блокировать цикл событий
+    и не делить соединение между потоками.
+
+    Процессы кластера используют один файл: записи плееров и удалений привязаны к серверам,
+    и каждый процесс читает и пишет только свои. WAL позволяет читать во время записи,
+    а одновременные записи ждут друг друга до STORAGE_BUSY_TIMEOUT секунд
+    """
+
+    def __init__(self, path: str = STORAGE_PATH):
+        self.path = path
+        self._connection: Optional[sqlite3.Connection] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="storage")
+        self._logger = logging.getLogger("storage")
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(
+                self.path, timeout=STORAGE_BUSY_TIMEOUT, check_same_thread=False
+            )
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.executescript(KV_SCHEMA)
+            self._logger.info(f"Opened storage {self.path}")
+        return self._connection
+
+    async def run(self, func: Callable[..., Any], *args) -> Any:
+        """
+        Выполняет функцию в потоке хранилища
+
+        :param func: Функция, первым аргументом получающая sqlite3.Connection
+        :param args: Остальные аргументы функции
+
+        :return: Результат функции
+        """
+
+        def call():
+            return func(self._connect(), *args)
+
+        return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+
+    @staticmethod
+    def _execute(
+        connection: sqlite3.Connection, sql: str, parameters: Iterable = ()
+    ) -> None:
+        with connection:
+            connection.execute(sql, parameters)
+
+    @staticmethod
+    def _executemany(
+        connection: sqlite3.Connection, sql: str, parameters: Iterable[Iterable]
+    ) -> None:
+        with connection:
+            connection.executemany(sql, parameters)
+
+    @staticmethod
+    def _executescript(connection: sqlite3.Connection, script: str) -> None:
+        with connection:
+            connection.executescript(script)
+
+    @staticmethod
+    def _fetchall(
+        connection: sqlite3.Connection, sql: str, parameters: Iterable = ()
+    ) -> List[Tuple]:
+        return connection.execute(sql, parameters).fetchall()
+
+    async def execute(self, sql: str, parameters: Iterable = ()):
+        await self.run(self._execute, sql, parameters)
+
+    async def executemany(self, sql: str, parameters: Iterable[Iterable]):
+        await self.run(self._executemany, sql, list(parameters))
+
+    async def executescript(self, script: str):
+        await self.run(self._executescript, script)
+
+    async def fetchall(self, sql: str, parameters: Iterable = ()) -> List[Tuple]:
+        return await self.run(self._fetchall, sql, parameters)
+
+    async def get_value(self, key: str, default: Any = None) -> Any:
+        """
+        Возвращает значение из хранилища ключ-значение
+
+        :param key: Ключ
+        :param default: Значение, если ключа нет
+
+        :return: Значение, сохраненное через set_value
+        """
+        rows = await self.fetchall("SELECT value FROM kv WHERE key = ?", (key,))
+        return json.loads(rows[0][0]) if rows else default
+
+    async def set_value(self, key: str, value: Any):
+        """Сохраняет JSON-совместимое значение в хранилище ключ-значение"""
+        await self.execute(
+            "INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)",
+            (key, json.dumps(value)),
+        )
+
+    async def close(self):
+        if self._connection is not None:
+            await self.run(lambda connection: connection.close())
+            self._connection = None
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import os
+from typing import Dict, Optional
+
+import discord
+
+from utils import set_voice_status
+
+VOICE_STATUS_DEBOUNCE = float(os.environ.get("VOICE_STATUS_DEBOUNCE", 1))
+VOICE_STATUS_BACKOFF = float(os.environ.get("VOICE_STATUS_BACKOFF", 5))
+VOICE_STATUS_MAX_BACKOFF = float(os.environ.get("VOICE_STATUS_MAX_BACKOFF", 120))
+
+
+class VoiceStatusManager:
+    """
+    Установка статусов голосовых каналов.
+
+    Частые изменения статуса канала объединяются, и отправляется только последнее значение.
+    Статус, который уже установлен, повторно не отправляется, а при 429 отправка откладывается
+    """
+
+    def __init__(self, bot: discord.Bot, debounce: float = VOICE_STATUS_DEBOUNCE):
+        self.bot = bot
+        self.debounce = debounce
+        self.sent = 0
+        self.suppressed = 0
+        self.rate_limited = 0
+        self._applied: Dict[int, Optional[str]] = dict()
+        self._pending: Dict[int, Optional[str]] = dict()
+        self._backoff: Dict[int, float] = dict()
+        self._tasks: Dict[int, asyncio.Task] = dict()
+        self._logger = logging.getLogger("voice_status")
+
+    def set(self, channel_id: int, status: str = None):
+        """
+        Запрашивает установку статуса канала. Вызывается без ожидания, статус будет отправлен позже
+
+        :param channel_id: ID голосового канала
+        :param status: Текст статуса или None, чтобы очистить статус
+        """
+        if channel_id in self._pending:
+            # предыдущее значение так и не было отправлено
+            self.suppressed += 1
+        self._pending[channel_id] = status[:500] if status else None
+        task = self._tasks.get(channel_id)
+        if task is None or task.done():
+            self._tasks[channel_id] = asyncio.create_task(self._flush(channel_id))
+
+    def forget(self, channel_id: int):
+        """Забывает состояние канала, например, когда бот из него вышел"""
+        task = self._tasks.pop(channel_id, None)
+        if task is not None:
+            task.cancel()
+        self._pending.pop(channel_id, None)
+        self._applied.pop(channel_id, None)
+        self._backoff.pop(channel_id, None)
+
+    async def _flush(self, channel_id: int):
+        while channel_id in self._pending:
+            await asyncio.sleep(self.debounce)
+            status = self._pending.pop(channel_id)
+            if channel_id in self._applied and self._applied[channel_id] == status:
+                self.suppressed += 1
+                continue
+            try:
+                await set_voice_status(channel_id, self.bot, status)
+            except discord.HTTPException as e:
+                if e.status != 429:
+                    self._logger.warning(
+                        f"Failed to set voice status of {channel_id}: {e}"
+                    )
+                    continue
+                self.rate_limited += 1
+                delay = min(
+                    self._backoff.get(channel_id, VOICE_STATUS_BACKOFF / 2) * 2,
+                    VOICE_STATUS_MAX_BACKOFF,
+                )
+                self._backoff[channel_id] = delay
+                self._logger.warning(
+                    f"Voice status of {channel_id} is rate limited, retrying in {delay}s"
+                )
+                # более новый статус, запрошенный во время ожидания, важнее
+                self._pending.setdefault(channel_id, status)
+                await asyncio.sleep(delay)
+                continue
+            self.sent += 1
+            self._applied[channel_id] = status
+            self._backoff.pop(channel_id, None)
+        self._tasks.pop(channel_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "sent": self.sent,
+            "suppressed": self.suppressed,
+            "rate_limited": self.rate_limited,
+            "pending": len(self._pending),
+        }
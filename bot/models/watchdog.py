@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import List, Optional
+
+from .metrics import metrics
+
+LOOP_LAG_INTERVAL = float(os.environ.get("LOOP_LAG_INTERVAL", 0.25))
+LOOP_LAG_THRESHOLD = float(os.environ.get("LOOP_LAG_THRESHOLD", 0.5))
+LOOP_LAG_OFFENDERS = int(os.environ.get("LOOP_LAG_OFFENDERS", 10))
+
+_logger = logging.getLogger("watchdog")
+
+metrics.histogram("loop_lag_duration_seconds", "Event loop lag distribution")
+
+
+class LoopStall:
+    """Случай, когда цикл событий был заблокирован дольше порога"""
+
+    __slots__ = ("lag", "happened_at", "task", "stack")
+
+    def __init__(self, lag: float, happened_at: float, task: str, stack: str):
+        self.lag = lag
+        self.happened_at = happened_at
+        self.task = task
+        self.stack = stack
+
+    @property
+    def location(self) -> str:
+        """Последняя строка стека, то есть место, где цикл был заблокирован"""
+        lines = [line for line in self.stack.strip().splitlines() if line.strip()]
+        return lines[-2].strip() if len(lines) >= 2 else "неизвестно"
+
+
+class LoopWatchdog:
+    """
+    Измеряет задержку цикла событий.
+
+    Корутина в цикле отмечается каждые LOOP_LAG_INTERVAL секунд, а отдельный поток следит за отметками.
+    Если отметки нет дольше LOOP_LAG_THRESHOLD, поток снимает стек потока цикла,
+    чтобы было видно, какая задача или обратный вызов его заблокировали
+    """
+
+    def __init__(
+        self,
+        interval: float = LOOP_LAG_INTERVAL,
+        threshold: float = LOOP_LAG_THRESHOLD,
+        offenders: int = LOOP_LAG_OFFENDERS,
+    ):
+        self.interval = interval
+        self.threshold = threshold
+        self.offenders_limit = offenders
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.offenders: List[LoopStall] = list()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = time.monotonic()
+        self._captured: Optional[tuple] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(
+            target=self._watch, name="loop-watchdog", daemon=True
+        )
+        self._thread.start()
+        metrics.gauge(
+            "loop_lag_seconds",
+            "Event loop lag measured by the watchdog",
+            lambda: {(): self.lag},
+        )
+
+    def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._last_beat = now
+            self.lag = max(now - expected, 0.0)
+            self.max_lag = max(self.max_lag, self.lag)
+            metrics.observe("loop_lag_duration_seconds", self.lag)
+            if self.lag >= self.threshold:
+                self._record_stall(self.lag)
+            else:
+                self._captured = None
+
+    def _watch(self):
+        while not self._stopped.wait(self.threshold / 2):
+            # отметка ставится раз в interval, поэтому блокировка длиннее порога видна позже на interval
+            stalled_for = time.monotonic() - self._last_beat - self.interval
+            if stalled_for < self.threshold or self._captured is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            # словарь текущих задач меняется только в потоке цикла, читаем его без изменений
+            task = asyncio.tasks._current_tasks.get(self._loop)
+            self._captured = (
+                task.get_name() if task is not None else "обратный вызов",
+                "".join(traceback.format_stack(frame)),
+            )
+
+    def _record_stall(self, lag: float):
+        self.stalls += 1
+        captured, self._captured = self._captured, None
+        task, stack = captured or ("неизвестно", "")
+        stall = LoopStall(lag, time.time(), task, stack)
+        self.offenders.append(stall)
+        self.offenders.sort(key=lambda item: item.lag, reverse=True)
+        del self.offenders[self.offenders_limit :]
+        _logger.warning(
+            f"Event loop was blocked for {lag:.3f}s by {task}\n{stack}".rstrip()
+        )
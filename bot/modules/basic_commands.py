@@ -1,50 +1,146 @@
-import socket
 import time
 
 import discord
-import psutil
 import wavelink
 
 from bot.models import BasicCog
-from utils import seconds_to_time_string
+from bot.models.breaker import NODE_LOAD_TIMEOUT_MAX
+from bot.views import MessageUpdater
+from utils import seconds_to_time_string, bytes_to_words
 
 
 class BasicCommands(BasicCog):
     @discord.application_command(name="status", description="Показывает статус бота")
     async def _status(self, interaction: discord.Interaction):
-        server_hostname = socket.gethostname()
         discord_gateway = self.bot.latency * 1000
-        ram_free = psutil.virtual_memory().available / 1024 / 1024
-        ram_total = psutil.virtual_memory().total / 1024 / 1024
-        ram_used = ram_total - ram_free
-        cpu_usage = psutil.cpu_percent()
-        la_1, la_5, la_15 = psutil.getloadavg()
+        bot_uptime = seconds_to_time_string(int(self.bot.sampler.bot_uptime))
 
-        server_uptime = seconds_to_time_string(int(time.time() - psutil.boot_time()))
-
-        bot_uptime = "Неизвестно"
+        music = self.bot.get_cog("Music")
+        sessions = len(music.sessions) if music else 0
 
         embed_description = (
             f"Версия: `{self.bot.VERSION}`\n"
             f"Пинг шлюза Discord `{discord_gateway:.2f} мс`\n"
-            f"Время работы бота **{bot_uptime}**"
-        )
-        server_label = (
-            f"Сервер: `{server_hostname}`\n"
-            f"LA1 `{la_1:.2f}`, LA5 `{la_5:.2f}`, LA15 `{la_15:.2f}`\n"
-            f"Загрузка CPU `{cpu_usage:.2f}%`\n"
-            f"Загрузка RAM `{ram_used:.2f} МБ` из `{ram_total:.2f} МБ`\n"
-            f"Свободная RAM `{ram_free:.2f} МБ`\n"
-            f"Время работы **{server_uptime}**"
+            f"Время работы бота **{bot_uptime}**\n"
+            f"Активных музыкальных сессий `{sessions}`"
         )
-
         embed = discord.Embed(
             title="Статус бота",
             description=embed_description,
             color=discord.Color.blurple(),
         )
+
+        host = self.bot.sampler.host
+        if host:
+            la_1, la_5, la_15 = host.load_average
+            server_uptime = seconds_to_time_string(int(time.time() - host.boot_time))
+            server_label = (
+                f"Сервер: `{host.hostname}`\n"
+                f"LA1 `{la_1:.2f}`, LA5 `{la_5:.2f}`, LA15 `{la_15:.2f}`\n"
+                f"Загрузка CPU `{host.cpu_percent:.2f}%`\n"
+                f"Загрузка RAM `{host.ram_used / 1024 / 1024:.2f} МБ` из `{host.ram_total / 1024 / 1024:.2f} МБ`\n"
+                f"Свободная RAM `{host.ram_free / 1024 / 1024:.2f} МБ`\n"
+                f"Память бота `{bytes_to_words(host.process_memory)}`\n"
+                f"Время работы **{server_uptime}**\n"
+                f"Обновлено <t:{int(host.sampled_at)}:R>"
+            )
+        else:
+            server_label = "Статистика еще собирается"
         embed.add_field(name="Сервер", value=server_label, inline=False)
 
+        if self.bot.sampler.cluster:
+            cluster_lines = []
+            for worker in self.bot.sampler.cluster:
+                shards = worker["shards"]
+                state = "не отвечает" if worker["stale"] else "работает"
+                cluster_lines.append(
+                    f"#{worker['cluster_id']} **{state}**, шарды `{shards[0]}-{shards[-1]}`, "
+                    f"серверов `{worker['guilds']}`, плееров `{worker['players']}`, "
+                    f"пинг `{worker['latency'] * 1000:.0f} мс`, память `{bytes_to_words(worker['memory'])}`"
+                )
+            embed.add_field(
+                name=f"Процессы кластера ({len(self.bot.sampler.cluster)})",
+                value="\n".join(cluster_lines)[:1024],
+                inline=False,
+            )
+
+        events = self.bot.gateway_events
+        events_total = sum(events.values())
+        top_events = ", ".join(
+            f"`{name}` {count}" for name, count in events.most_common(3)
+        )
+        gateway_label = (
+            f"Режим интентов **{'экономный' if self.bot.intents_mode == 'lean' else 'полный'}**\n"
+            f"Событий получено `{events_total}` "
+            f"(`{events_total / max(self.bot.sampler.bot_uptime, 1) * 60:.1f}` в минуту)\n"
+            f"Чаще всего: {top_events or 'нет'}\n"
+            f"Пользователей в кэше `{len(self.bot.users)}`"
+        )
+        embed.add_field(name="Шлюз Discord", value=gateway_label, inline=False)
+
+        watchdog = self.bot.watchdog
+        loop_label = (
+            f"Задержка `{watchdog.lag * 1000:.1f} мс`, максимум `{watchdog.max_lag * 1000:.1f} мс`\n"
+            f"Блокировок дольше `{watchdog.threshold * 1000:.0f} мс`: `{watchdog.stalls}`"
+        )
+        if watchdog.offenders:
+            worst = watchdog.offenders[0]
+            loop_label += (
+                f"\nХудшая `{worst.lag * 1000:.0f} мс` в `{worst.task}`\n"
+                f"`{worst.location[:200]}`"
+            )
+        embed.add_field(name="Цикл событий", value=loop_label, inline=False)
+
+        search_stats = self.bot.search_cache.stats()
+        lookups = search_stats["hits"] + search_stats["misses"]
+        hit_rate = search_stats["hits"] / lookups * 100 if lookups else 0
+        search_cache_label = (
+            f"Записей `{search_stats['entries']}`, память `{bytes_to_words(search_stats['memory'])}`\n"
+            f"Попаданий `{search_stats['hits']}`, промахов `{search_stats['misses']}` (`{hit_rate:.1f}%`)\n"
+            f"Вытеснено `{search_stats['evictions']}`, устарело `{search_stats['expirations']}`\n"
+            f"Общих запросов `{search_stats['shared']}`"
+        )
+        autocomplete = self.bot.autocomplete.stats()
+        if autocomplete:
+            search_cache_label += "\nВариантов автодополнения " + ", ".join(
+                f"{provider} `{size}`" for provider, size in autocomplete.items()
+            )
+        embed.add_field(name="Кэш поиска", value=search_cache_label, inline=False)
+
+        auto_label = "\n".join(
+            f"{provider}: побед `{stats['wins']}` из `{stats['requests']}`, "
+            f"таймаутов `{stats['timeouts']}`, ошибок `{stats['errors']}`"
+            + (
+                f", в среднем `{stats['latency'] * 1000:.0f} мс`"
+                if stats["latency"] is not None
+                else ""
+            )
+            for provider, stats in self.bot.search_cache.auto.stats().items()
+        )
+        if auto_label:
+            embed.add_field(
+                name="Поиск по всем источникам", value=auto_label, inline=False
+            )
+
+        updates = MessageUpdater.stats()
+        updates_label = (
+            f"Запрошено `{updates['requested']}`, отправлено `{updates['sent']}`\n"
+            f"Сэкономлено редактирований `{updates['saved']}`, "
+            f"из них без изменений `{updates['skipped']}`\n"
+            f"Ожидают удаления `{len(self.bot.deletions)}`, удалено `{self.bot.deletions.deleted}`, "
+            f"не удалось `{self.bot.deletions.failed}`"
+        )
+        embed.add_field(name="Обновления сообщений", value=updates_label, inline=False)
+
+        voice_status = self.bot.voice_status.stats()
+        voice_status_label = (
+            f"Отправлено `{voice_status['sent']}`, пропущено `{voice_status['suppressed']}`\n"
+            f"Ограничено Discord `{voice_status['rate_limited']}`, в ожидании `{voice_status['pending']}`"
+        )
+        embed.add_field(
+            name="Статусы голосовых каналов", value=voice_status_label, inline=False
+        )
+
         # Ноды LavaLink
 
         node_status_map = {
@@ -52,11 +148,38 @@ class BasicCommands(BasicCog):
             wavelink.NodeStatus.CONNECTING: "Подключается",
             wavelink.NodeStatus.DISCONNECTED: "Отключено",
         }
+        breaker_state_map = {
+            "closed": "Замкнут",
+            "half_open": "Проверка",
+            "open": "Разомкнут",
+        }
 
         if wavelink.Pool.nodes:
-            embed.add_field(name="Ноды LavaLink", value="", inline=False)
+            embed.add_field(
+                name="Ноды LavaLink",
+                value=f"Переносов плееров между нодами `{self.bot.node_pool.failovers}`",
+                inline=False,
+            )
             for index, node in enumerate(wavelink.Pool.nodes.values()):
-                node_stats = await node.fetch_stats()
+                node_stats = self.bot.node_pool.stats.get(node.identifier)
+                breaker = self.bot.node_pool.breaker(node)
+                breaker_label = (
+                    f"Предохранитель **{breaker_state_map[breaker.state]}**, "
+                    f"срабатываний `{breaker.trips}`\n"
+                    f"Таймаут поиска `{breaker.current_timeout('search'):.1f} с`, "
+                    f"загрузки `{breaker.current_timeout('load', NODE_LOAD_TIMEOUT_MAX):.1f} с`"
+                )
+                if node_stats is None:
+                    node_description = (
+                        f"Идентификатор `{node.identifier}`\n"
+                        f"Статус **{node_status_map[node.status]}**\n"
+                        f"{breaker_label}\n"
+                        f"Статистика недоступна"
+                    )
+                    embed.add_field(
+                        name=f"Нода #{index + 1}", value=node_description, inline=True
+                    )
+                    continue
                 if node_stats.frames:
                     node_statistic_frames = (
                         f"Пакетов отправлено `{node_stats.frames.sent}`\n"
@@ -70,6 +193,8 @@ class BasicCommands(BasicCog):
                     f"Статус **{node_status_map[node.status]}**\n"
                     f"Пинг `{node.heartbeat:.2f} мс`\n"
                     f"Плееров подключено `{node_stats.players}` из них играет `{node_stats.playing}`\n"
+                    f"Штраф нагрузки `{self.bot.node_pool.penalty(node):.1f}`\n"
+                    f"{breaker_label}\n"
                     f"\n{node_statistic_frames}"
                 )
                 embed.add_field(
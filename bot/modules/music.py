@@ -1,37 +1,82 @@
 import asyncio
-from typing import Dict
+import functools
+import os
+from typing import Dict, List
 
 import discord
 import wavelink
-from discord.ext import commands, pages, tasks
-
-from bot.models import FununaNun, BasicCog
-from bot.models.errors import MemberNotInVoice, BotNotInVoice
-from bot.views import SearchTrack, CurrentTrack
-from utils import seconds_to_duration, send_temporary_message, set_voice_status
+from discord.ext import commands, pages
+
+from bot.models import FununaNun, BasicCog, GuildSession, FununaPlayer
+from bot.models.errors import MemberNotInVoice, BotNotInVoice, NodeUnavailable
+from bot.models.metrics import metrics
+from bot.views import (
+    SearchTrack,
+    CurrentTrack,
+    MessageUpdater,
+    QueuePages,
+    PlaylistProgress,
+)
+from utils import (
+    count_listeners,
+    respond_or_followup,
+    seconds_to_duration,
+    send_temporary_message,
+)
+
+QUEUE_UPDATE_DEBOUNCE = float(os.environ.get("QUEUE_UPDATE_DEBOUNCE", 1))
+PLAYLIST_CHUNK_SIZE = int(os.environ.get("PLAYLIST_CHUNK_SIZE", 50))
+# пауза между частями плейлиста, за нее успевает обновиться прогресс и сработать отмена
+PLAYLIST_CHUNK_DELAY = float(os.environ.get("PLAYLIST_CHUNK_DELAY", 0.25))
+PLAYLIST_PROGRESS_TIMEOUT = 10
 
 
 class Music(BasicCog):
     def __init__(self, bot: FununaNun):
         super().__init__(bot)
-        self.announce_channels: Dict[int, int] = dict()
-        self.announce_messages: Dict[int, int] = dict()
-        self.announce_deleter.start()
-
-    @tasks.loop(minutes=5)
-    async def announce_deleter(self):
-        """Удаляет записи из announce_channels и announce_messages, если они не используются"""
-        announce_channels = self.announce_channels.copy()
-        announce_messages = self.announce_messages.copy()
-        for guild_id in self.announce_channels.keys():
-            guild = await self.bot.fetch_guild(guild_id)
-            if not guild.voice_client:
-                self._logger.info(f"Deleting announce rows for {guild_id}")
-                announce_channels.pop(guild_id)
-                announce_messages.pop(guild_id)
-
-        self.announce_messages = announce_messages
-        self.announce_channels = announce_channels
+        self.sessions: Dict[int, GuildSession] = dict()
+
+    def _open_session(
+        self, player: wavelink.Player, announce_channel_id: int
+    ) -> GuildSession:
+        """Создает сессию сервера при подключении плеера или обновляет существующую"""
+        session = self.sessions.get(player.guild.id)
+        if session is None:
+            session = self.sessions[player.guild.id] = GuildSession(
+                player.guild.id, announce_channel_id, player
+            )
+        else:
+            session.player = player
+            session.set_announce_channel(announce_channel_id)
+        return session
+
+    def _close_session(self, guild_id: int):
+        session = self.sessions.pop(guild_id, None)
+        if session is not None:
+            self._logger.info(f"Closing session for {guild_id}")
+            session.close()
+
+    def cog_unload(self):
+        for guild_id in list(self.sessions):
+            self._close_session(guild_id)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        self._close_session(guild.id)
+
+    async def _edit_announce(self, session: GuildSession, **fields):
+        """Редактирует сообщение с текущим треком. Если сообщения нет или оно удалено, отправляет новое"""
+        if session.announce_message is not None:
+            try:
+                await session.announce_message.edit(**fields)
+                return
+            except discord.NotFound:
+                self._logger.info(
+                    f"Announce message in {session.guild_id} not found, sending a new one"
+                )
+        channel = self.bot.get_partial_messageable(session.announce_channel_id)
+        message = await channel.send(**fields)
+        session.set_announce_message(self.bot, message.id)
 
     @commands.Cog.listener()
     async def on_voice_state_update(
@@ -41,24 +86,32 @@ class Music(BasicCog):
         after: discord.VoiceState,
     ):
         """Если в канале никого не осталось кроме бота, выйти из канала"""
-        bot_user = member.guild.get_member(self.bot.user.id)
+        if member.id == self.bot.user.id:
+            if before.channel is not None and before.channel != after.channel:
+                # Discord сбрасывает статус канала, из которого вышел бот, и после
+                # возвращения тот же статус нужно отправить снова
+                self.bot.voice_status.forget(before.channel.id)
+            if after.channel is None:
+                self._close_session(member.guild.id)
+            return
+        bot_user = member.guild.me
         # если до этого не было канала или бота нет в голосовом канале
         if before.channel is None or bot_user.voice is None:
             return
         user_voice_channel = bot_user.voice.channel
-        # (если прошлый канал это канал бота) и (если текущий канал другой или None) и (количество участников в
-        # канале == 1), то выйти
+        # (если прошлый канал это канал бота) и (если текущий канал другой или None) и (в канале не осталось
+        # слушателей), то выйти
         if (
             before.channel == user_voice_channel
             and (after.channel is None or after.channel != before.channel)
-            and len(user_voice_channel.members) == 1
+            and count_listeners(user_voice_channel, self.bot.user.id) == 0
         ):
             player: wavelink.Player = member.guild.voice_client
             player.queue.clear()
             player.queue.history.clear()
             player.autoplay = wavelink.AutoPlayMode.disabled
             if player.playing:
-                await player.stop(force=True)
+                await self.bot.node_pool.stop(player)
 
     @commands.Cog.listener()
     async def on_wavelink_inactive_player(self, player: wavelink.Player):
@@ -66,8 +119,19 @@ class Music(BasicCog):
         player.queue.clear()
         player.queue.history.clear()
         player.autoplay = wavelink.AutoPlayMode.disabled
-        await player.set_filters()
+        try:
+            await self.bot.node_pool.set_filters(player)
+        except NodeUnavailable as e:
+            # плеер все равно отключается, фильтры сбросятся вместе с ним
+            self._logger.warning(f"Failed to reset filters of {player.guild.id}: {e}")
+        if player.channel:
+            self.bot.voice_status.forget(player.channel.id)
         await player.disconnect()
+        self._close_session(player.guild.id)
+
+    @commands.Cog.listener()
+    async def on_player_restored(self, player: wavelink.Player):
+        self._open_session(player, player.channel.id)
 
     @commands.Cog.listener()
     async def on_wavelink_node_ready(self, node: wavelink.NodeReadyEventPayload):
@@ -75,50 +139,50 @@ class Music(BasicCog):
 
     @commands.Cog.listener()
     async def on_wavelink_track_start(self, payload: wavelink.TrackStartEventPayload):
-        channel = await self.bot.fetch_channel(
-            self.announce_channels.get(payload.player.guild.id)
-        )
-        if channel is None:
-            self._logger.info("wavelink start: Announce channel not found")
-            return
+        with metrics.timer("track_event_duration_seconds", event="start"):
+            await self._handle_track_start(payload)
 
-        message = await channel.fetch_message(
-            self.announce_messages.get(payload.player.guild.id)
-        )
-        if not message:
+    async def _handle_track_start(self, payload: wavelink.TrackStartEventPayload):
+        session = self.sessions.get(payload.player.guild.id)
+        if session is None:
             self._logger.info("wavelink start: Announce message not found")
             return
 
-        view = CurrentTrack(payload.player)
-        embed = await view.generate_embed()
-        view.message = message
-        await message.edit(embed=embed, view=view)
-        await set_voice_status(
+        view = CurrentTrack(payload.player, self._get_updater(session))
+        view.refresh()
+        if isinstance(payload.player, FununaPlayer):
+            session.create_task(payload.player.prefetch())
+        self.bot.voice_status.set(
             payload.player.channel.id,
-            self.bot,
-            f"{payload.player.current.title} - {payload.player.current.author}"[:100],
+            # к моменту обработки трек мог уже закончиться, поэтому берем трек из события
+            f"{payload.track.title} - {payload.track.author}"[:100],
         )
 
     @commands.Cog.listener()
     async def on_wavelink_track_end(self, payload: wavelink.TrackEndEventPayload):
-        channel = await self.bot.fetch_channel(
-            self.announce_channels.get(payload.player.guild.id)
-        )
-        if channel is None:
-            self._logger.info("wavelink end: Announce channel not found")
-            return
-        message = await channel.fetch_message(
-            self.announce_messages.get(payload.player.guild.id)
-        )
-        if not message:
+        with metrics.timer("track_event_duration_seconds", event="end"):
+            await self._handle_track_end(payload)
+
+    async def _handle_track_end(self, payload: wavelink.TrackEndEventPayload):
+        session = self.sessions.get(payload.player.guild.id)
+        if session is None:
             self._logger.info("wavelink end: Announce message not found")
             return
         if not len(payload.player.queue) and not payload.player.current:
-            embed = discord.Embed(
-                title="Музыка закончилась", color=discord.Color.blurple()
+            self._get_updater(session).request(self._render_finished)
+            self.bot.voice_status.set(payload.player.channel.id)
+
+    def _get_updater(self, session: GuildSession) -> MessageUpdater:
+        if session.updater is None:
+            session.updater = MessageUpdater(
+                functools.partial(self._edit_announce, session)
             )
-            await message.edit(embed=embed, view=None)
-            await set_voice_status(payload.player.channel.id, self.bot)
+        return session.updater
+
+    @staticmethod
+    async def _render_finished() -> dict:
+        embed = discord.Embed(title="Музыка закончилась", color=discord.Color.blurple())
+        return {"embed": embed, "view": None}
 
     async def _get_voice(
         self,
@@ -147,16 +211,18 @@ class Music(BasicCog):
                 if channel.type == discord.ChannelType.text
             ][0]
         elif not announce_channel:
-            announce_channel = voice.channel.id
+            announce_channel = voice.channel
 
         if not voice:
             raise MemberNotInVoice("The user is not in a voice channel")
 
         if not bot_voice:
             if join:
-                await voice.channel.connect(cls=wavelink.Player)
-                self.announce_channels[guild.id] = announce_channel.id
-                return guild.voice_client
+                player = await voice.channel.connect(
+                    cls=self.bot.node_pool.create_player()
+                )
+                self._open_session(player, announce_channel.id)
+                return player
             else:
                 raise BotNotInVoice(
                     "The bot is not in a voice channel and 'join' is set to False"
@@ -164,9 +230,11 @@ class Music(BasicCog):
 
         if voice.channel != bot_voice.channel:
             if join:
-                await voice.channel.connect(cls=wavelink.Player)
-                self.announce_channels[guild.id] = announce_channel.id
-                return guild.voice_client
+                player = await voice.channel.connect(
+                    cls=self.bot.node_pool.create_player()
+                )
+                self._open_session(player, announce_channel.id)
+                return player
             else:
                 raise MemberNotInVoice(
                     "The user and the bot are in different voice channels and 'join' is set to False"
@@ -174,6 +242,14 @@ class Music(BasicCog):
 
         return bot_voice
 
+    async def query_autocomplete(self, ctx: discord.AutocompleteContext):
+        """Варианты запроса /play из недавних запросов и найденных треков"""
+        return await self.bot.autocomplete.suggest(
+            ctx.value or "",
+            ctx.options.get("provider") or "ymsearch",
+            ctx.interaction.user.id,
+        )
+
     @discord.application_command(
         name="play",
         description="Добавить музыку в плейлист",
@@ -183,6 +259,7 @@ class Music(BasicCog):
         description="Запрос",
         input_tupe=discord.SlashCommandOptionType.string,
         required=True,
+        autocomplete=query_autocomplete,
     )
     @discord.option(
         name="auto_play",
@@ -197,6 +274,7 @@ class Music(BasicCog):
         choices=[
             discord.OptionChoice("YouTube", "ytsearch"),
             discord.OptionChoice("Yandex Music", "ymsearch"),
+            discord.OptionChoice("Все источники", "auto"),
         ],
         required=False,
         default="ymsearch",
@@ -211,12 +289,13 @@ class Music(BasicCog):
     ):
         await ctx.response.defer(ephemeral=False, invisible=True)
 
-        tracks = await wavelink.Playable.search(query, source=provider)
+        tracks = await self.bot.search_cache.search(query, provider)
 
         if not tracks:
             embed = discord.Embed(title="Ничего не найдено", color=discord.Color.red())
             await send_temporary_message(interaction=ctx, embed=embed)
             return
+        self.bot.autocomplete.remember(provider, query, tracks)
 
         voice_client = await self._get_voice(
             ctx.user, ctx.guild, announce_channel=ctx.channel
@@ -227,8 +306,24 @@ class Music(BasicCog):
             else wavelink.AutoPlayMode.partial
         )
 
-        if isinstance(tracks, wavelink.Playlist):
-            tracks.track_extras(requester=ctx.user.id)
+        if isinstance(tracks, wavelink.Playlist) and len(tracks) > PLAYLIST_CHUNK_SIZE:
+            extras = self.bot.requesters.extras_for(ctx.user)
+            tracks.tracks[0].extras = extras
+            # первый трек добавляется сразу, чтобы музыка началась, не дожидаясь остальных
+            await voice_client.queue.put_wait(tracks.tracks[0])
+            progress = PlaylistProgress(tracks.name, len(tracks))
+            progress.added = 1
+            message = await ctx.followup.send(**await progress.render(), wait=True)
+            # сессии может не быть, если бот уже в канале, например после перезагрузки модуля
+            self._open_session(voice_client, ctx.channel.id).create_task(
+                self._ingest_playlist(
+                    voice_client, tracks.tracks[1:], extras, progress, message
+                )
+            )
+        elif isinstance(tracks, wavelink.Playlist):
+            extras = self.bot.requesters.extras_for(ctx.user)
+            for track in tracks:
+                track.extras = extras
             await voice_client.queue.put_wait(tracks)
             embed = discord.Embed(
                 title="Плейлист добавлен в очередь",
@@ -237,7 +332,7 @@ class Music(BasicCog):
             )
             await send_temporary_message(ctx, embed)
         elif len(tracks) == 1:
-            tracks[0].extras = {"requester": ctx.user.id}
+            tracks[0].extras = self.bot.requesters.extras_for(ctx.user)
             await voice_client.queue.put_wait(tracks[0])
             embed = discord.Embed(
                 title="Трек добавлен в очередь",
@@ -271,8 +366,44 @@ class Music(BasicCog):
                 colour=discord.Color.blurple(),
             )
             message = await ctx.channel.send(embed=embed)
-            self.announce_messages[ctx.guild.id] = message.id
-            await voice_client.play(await voice_client.queue.get_wait())
+            session = self._open_session(voice_client, ctx.channel.id)
+            session.set_announce_message(self.bot, message.id)
+            await self.bot.node_pool.play(
+                voice_client, await voice_client.queue.get_wait()
+            )
+
+    @staticmethod
+    async def _ingest_playlist(
+        player: wavelink.Player,
+        tracks: List[wavelink.Playable],
+        extras: dict,
+        progress: PlaylistProgress,
+        message: discord.Message,
+    ):
+        """
+        Добавляет треки плейлиста в очередь частями, обновляя сообщение с прогрессом.
+        Сообщение убирается, даже если добавление прервано закрытием сессии или ошибкой
+        """
+        deletions = player.client.deletions
+        guild_id = player.guild.id
+        updater = MessageUpdater(message.edit)
+        try:
+            for start in range(0, len(tracks), PLAYLIST_CHUNK_SIZE):
+                if progress.cancelled:
+                    break
+                chunk = tracks[start : start + PLAYLIST_CHUNK_SIZE]
+                for track in chunk:
+                    track.extras = extras
+                await player.queue.put_wait(chunk)
+                progress.added += len(chunk)
+                updater.request(progress.render)
+                await asyncio.sleep(PLAYLIST_CHUNK_DELAY)
+        finally:
+            progress.stop()
+            updater.request(progress.render)
+            deletions.schedule(
+                PLAYLIST_PROGRESS_TIMEOUT, message.channel.id, message.id, guild_id
+            )
 
     @discord.application_command(
         name="stop",
@@ -285,7 +416,7 @@ class Music(BasicCog):
         voice_client.queue.history.clear()
         voice_client.autoplay = wavelink.AutoPlayMode.disabled
         if voice_client.playing:
-            await voice_client.stop(force=True)
+            await self.bot.node_pool.stop(voice_client)
         embed = discord.Embed(title="Музыка остановлена", color=discord.Color.green())
         await ctx.response.send_message(embed=embed)
 
@@ -304,7 +435,7 @@ class Music(BasicCog):
     async def volume(self, ctx: discord.ApplicationContext, volume: int):
         voice_client = await self._get_voice(ctx.user, ctx.guild, join=False)
         if voice_client.current:
-            await voice_client.set_volume(volume)
+            await self.bot.node_pool.set_volume(voice_client, volume)
             embed = discord.Embed(
                 title="Громкость установлена",
                 description=f"Громкость: {volume}",
@@ -312,7 +443,7 @@ class Music(BasicCog):
             )
         else:
             embed = discord.Embed(title="Музыка не играет", color=discord.Color.red())
-        await ctx.response.send_message(embed=embed, delete_after=5)
+        await respond_or_followup(ctx, embed, timeout=5)
 
     @discord.application_command(
         name="skip",
@@ -323,7 +454,7 @@ class Music(BasicCog):
         await ctx.response.defer(ephemeral=False, invisible=True)
         voice_client = await self._get_voice(ctx.user, ctx.guild, join=False)
         if voice_client.playing:
-            await voice_client.skip(force=True)
+            await self.bot.node_pool.skip(voice_client)
             embed = discord.Embed(title="Музыка пропущена", color=discord.Color.green())
         else:
             embed = discord.Embed(title="Музыка закончилась", color=discord.Color.red())
@@ -363,7 +494,7 @@ class Music(BasicCog):
             )
         else:
             embed = discord.Embed(title="Плейлист пуст", color=discord.Color.red())
-        await ctx.response.send_message(embed=embed, delete_after=5)
+        await respond_or_followup(ctx, embed, timeout=5)
 
     @discord.application_command(
         name="queue",
@@ -373,7 +504,7 @@ class Music(BasicCog):
     async def queue(self, ctx: discord.ApplicationContext):
         voice_client = await self._get_voice(ctx.user, ctx.guild, join=False)
         if len(voice_client.queue) >= 1:
-            queue_pages = generate_queue_pages(voice_client)
+            queue_pages = QueuePages(voice_client)
             default_buttons = [
                 pages.PaginatorButton(
                     "first",
@@ -415,69 +546,41 @@ class Music(BasicCog):
                 use_default_buttons=False,
             )
             await paginator.respond(interaction=ctx.interaction)
-            previous_tracks = None
-            while not paginator.is_finished():
-                current_tracks = voice_client.queue.copy()
-                # Check if the queue or the current song has changed
-                if current_tracks != previous_tracks:
-                    queue_pages = generate_queue_pages(voice_client)
-                    try:
-                        if len(voice_client.queue) >= 1:
-                            await paginator.update(
-                                pages=queue_pages,
-                                custom_buttons=default_buttons,
-                                use_default_buttons=False,
-                            )
-                        else:
-                            embed = discord.Embed(
-                                title="Очередь пуста", color=discord.Color.red()
-                            )
-                            await paginator.update(
-                                pages=[embed],
-                                custom_buttons=default_buttons,
-                                use_default_buttons=False,
-                            )
-                    except:
-                        paginator.stop()
-                    previous_tracks = current_tracks
-                await asyncio.sleep(5)
+            await self._follow_queue(paginator, queue_pages)
         else:
             embed = discord.Embed(title="Очередь пуста", color=discord.Color.red())
             await ctx.response.send_message(embed=embed)
 
-
-def generate_queue_pages(voice_client: wavelink.Player):
-    queue_pages = []
-    tracks = voice_client.queue
-    for i in range(0, len(tracks), 5):
-        page = tracks[i : i + 5]
-        if voice_client.current:
-            description = (
-                f"**Сейчас играет**\n"
-                f"Название: **{voice_client.current.title}**\n"
-                f"Автор: **{voice_client.current.author}**\n"
-                f"Продолжительность: **{seconds_to_duration(voice_client.current.length // 1000)}**"
-            )
-        else:
-            description = "Сейчас ничего не играет"
-        embed = discord.Embed(
-            title="Очередь треков",
-            description=description,
-            color=discord.Color.blurple(),
-        )
-        embed.set_image(
-            url="https://assets.shandy-dev.ru/playlist_fununa-nun_banner.webp"
-        )
-        embed.set_footer(text=f"Всего треков в очереди: {len(tracks)}")
-        for index, track in enumerate(page):
-            embed.add_field(
-                name=f"Трек {voice_client.queue.index(track) + 1}",
-                value=f"Название: **{track.title}**\nАвтор: **{track.author}**\nПродолжительность: **{seconds_to_duration(track.length // 1000)}**",
-                inline=False,
-            )
-        queue_pages.append(embed)
-
-    return queue_pages
+    @staticmethod
+    async def _follow_queue(paginator: pages.Paginator, queue_pages: QueuePages):
+        """Обновляет пагинатор очереди при изменении очереди, пока пагинатор не закрыт"""
+        queue = queue_pages.player.queue
+        finished = asyncio.create_task(paginator.wait())
+        try:
+            while not paginator.is_finished():
+                changed = asyncio.create_task(
+                    queue.wait_for_change(queue_pages.version)
+                )
+                await asyncio.wait(
+                    (changed, finished), return_when=asyncio.FIRST_COMPLETED
+                )
+                if finished.done():
+                    changed.cancel()
+                    break
+                # даем пачке изменений (например, добавлению плейлиста) завершиться
+                await asyncio.sleep(QUEUE_UPDATE_DEBOUNCE)
+                if not queue_pages.refresh():
+                    continue
+                paginator.page_count = len(queue_pages) - 1
+                paginator.current_page = min(
+                    paginator.current_page, paginator.page_count
+                )
+                try:
+                    await paginator.goto_page(paginator.current_page)
+                except discord.HTTPException:
+                    paginator.stop()
+        finally:
+            finished.cancel()
 
 
 class CloseButton(pages.PaginatorButton):
@@ -489,6 +592,7 @@ class CloseButton(pages.PaginatorButton):
     async def callback(self, interaction: discord.Interaction):
         await interaction.response.defer()
         await interaction.delete_original_response()
+        self.paginator.stop()
 
 
 def setup(bot):
@@ -1,3 +1,6 @@
 from .traceback import TracebackShowButton
+from .message_updater import MessageUpdater
 from .search_track import SearchTrack
 from .current_track import CurrentTrack
+from .queue_pages import QueuePages
+from .playlist_progress import PlaylistProgress
@@ -3,13 +3,16 @@ import asyncio
 import discord.ui
 import wavelink
 
+from bot.models.requesters import Requester
+from bot.views.message_updater import MessageUpdater
 from utils import seconds_to_duration
 
 
 class CurrentTrack(discord.ui.View):
-    def __init__(self, player: wavelink.Player):
+    def __init__(self, player: wavelink.Player, updater: MessageUpdater = None):
         super().__init__(timeout=None)
         self.player = player
+        self.updater = updater
         self.setup_buttons()
         self.embed = None
 
@@ -55,14 +58,9 @@ class CurrentTrack(discord.ui.View):
                 button.row = i
                 self.add_item(button)
 
-    async def update_buttons(self):
-        self.clear_items()
-        self.setup_buttons()
-        await self.message.edit(view=self)
-
     async def generate_embed(self):
+        i = 0
         while not self.player.current:
-            i = 0
             await asyncio.sleep(0.1)
             i += 1
             if i == 10:
@@ -72,24 +70,20 @@ class CurrentTrack(discord.ui.View):
             description=f"{self.player.current.title}\nАвтор: {self.player.current.author}",
             color=discord.Color.green(),
         )
-        if (
-            hasattr(self.player.current.extras, "requester")
-            and self.player.current.extras.requester
-        ):
-            requester = await self.player.client.fetch_user(
-                self.player.current.extras.requester
+        extras = dict(self.player.current.extras)
+        # информация о пользователе сохраняется в extras при добавлении трека
+        requester = Requester.from_extras(extras)
+        if requester is None:
+            requester_id = extras.get("requester") or getattr(
+                self.player.current, "requester", None
             )
-        elif (
-            hasattr(self.player.current, "requester") and self.player.current.requester
-        ):
-            requester = await self.player.client.fetch_user(
-                self.player.current.requester
-            )
-        else:
-            requester = None
+            if requester_id:
+                requester = await self.player.client.requesters.resolve(
+                    self.player.guild, requester_id
+                )
         if requester:
             embed.set_author(
-                name=f"Запросил {requester.name}", icon_url=requester.display_avatar.url
+                name=f"Запросил {requester.name}", icon_url=requester.avatar_url
             )
         embed.add_field(
             value=f"Продолжительность: {seconds_to_duration(self.player.current.length // 1000)}",
@@ -109,15 +103,25 @@ class CurrentTrack(discord.ui.View):
 
         return embed
 
-    async def update_embed(self):
+    async def render(self) -> dict:
+        """Собирает актуальные эмбед и кнопки для редактирования сообщения"""
         self.embed = await self.generate_embed()
-        await self.message.edit(embed=self.embed, view=self)
+        self.clear_items()
+        self.setup_buttons()
+        return {"embed": self.embed, "view": self}
+
+    def refresh(self):
+        """Запрашивает обновление сообщения, частые запросы объединяются в одно редактирование"""
+        if self.updater is None:
+            self.updater = MessageUpdater(self.message.edit)
+        self.updater.request(self.render)
 
 
 class PreviousTrackButton(discord.ui.Button):
     def __init__(self, player: wavelink.Player, disabled: bool):
         super().__init__(
             style=discord.ButtonStyle.primary,
+            custom_id="current_track:previous",
             emoji="⏪",
             disabled=disabled,
         )
@@ -131,9 +135,8 @@ class PreviousTrackButton(discord.ui.Button):
             previous_track = self.player.queue.history[history_track_index - 1]
             self.player.queue.put_at(0, current_track)
             self.player.queue.put_at(0, previous_track)
-            await self.player.skip()
-            await self.view.update_embed()
-            await self.view.update_buttons()
+            await self.player.client.node_pool.skip(self.player, force=False)
+            self.view.refresh()
             embed = discord.Embed(title="Предыдущий трек", color=discord.Color.green())
             return await interaction.followup.send(
                 embed=embed, ephemeral=True, delete_after=0.1
@@ -151,6 +154,7 @@ class NextTrackButton(discord.ui.Button):
     def __init__(self, player: wavelink.Player, disabled):
         super().__init__(
             style=discord.ButtonStyle.primary,
+            custom_id="current_track:next",
             emoji="⏩",
             disabled=disabled,
         )
@@ -159,9 +163,8 @@ class NextTrackButton(discord.ui.Button):
     async def callback(self, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True, invisible=True)
         try:
-            await self.player.skip(force=True)
-            await self.view.update_embed()
-            await self.view.update_buttons()
+            await self.player.client.node_pool.skip(self.player)
+            self.view.refresh()
             embed = discord.Embed(title="Следующий трек", color=discord.Color.green())
             return await interaction.followup.send(
                 embed=embed, ephemeral=True, delete_after=0.1
@@ -170,8 +173,7 @@ class NextTrackButton(discord.ui.Button):
             embed = discord.Embed(
                 title="Нет следующего трека", color=discord.Color.green()
             )
-            await self.view.update_embed()
-            await self.view.update_buttons()
+            self.view.refresh()
             return await interaction.followup.send(
                 embed=embed, ephemeral=True, delete_after=0.1
             )
@@ -183,28 +185,33 @@ class PlayPauseButton(discord.ui.Button):
         if self.player.paused:
             super().__init__(
                 style=discord.ButtonStyle.primary,
+                custom_id="current_track:play_pause",
                 emoji="▶",
             )
         else:
             super().__init__(
                 style=discord.ButtonStyle.primary,
+                custom_id="current_track:play_pause",
                 emoji="⏸",
             )
 
     async def callback(self, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True, invisible=True)
         if self.player.paused:
-            await self.player.pause(not self.player.paused)
+            await self.player.client.node_pool.pause(
+                self.player, not self.player.paused
+            )
             embed = discord.Embed(
                 title="Музыка возобновлена", color=discord.Color.green()
             )
         else:
-            await self.player.pause(not self.player.paused)
+            await self.player.client.node_pool.pause(
+                self.player, not self.player.paused
+            )
             embed = discord.Embed(
                 title="Музыка приостановлена", color=discord.Color.green()
             )
-        await self.view.update_buttons()
-        await self.view.update_embed()
+        self.view.refresh()
         return await interaction.followup.send(
             embed=embed, ephemeral=True, delete_after=0.1
         )
@@ -215,6 +222,7 @@ class ShuffleButton(discord.ui.Button):
         self.player = player
         super().__init__(
             style=discord.ButtonStyle.primary,
+            custom_id="current_track:shuffle",
             emoji="🔀",
         )
 
@@ -231,6 +239,7 @@ class BackwardButton(discord.ui.Button):
     def __init__(self, player: wavelink.Player):
         super().__init__(
             style=discord.ButtonStyle.primary,
+            custom_id="current_track:backward",
             emoji="↪",
         )
         self.player = player
@@ -246,9 +255,11 @@ class BackwardButton(discord.ui.Button):
             )
         current_position = self.player.position
         if current_position > 10 * 1000:
-            await self.player.seek(current_position - (10 * 1000))
+            await self.player.client.node_pool.seek(
+                self.player, current_position - (10 * 1000)
+            )
         else:
-            await self.player.seek(0)
+            await self.player.client.node_pool.seek(self.player, 0)
         embed = discord.Embed(
             title="Трек перемотан на 10 секунд назад", color=discord.Color.green()
         )
@@ -261,6 +272,7 @@ class ForwardButton(discord.ui.Button):
     def __init__(self, player: wavelink.Player):
         super().__init__(
             style=discord.ButtonStyle.primary,
+            custom_id="current_track:forward",
             emoji="↩",
         )
         self.player = player
@@ -275,7 +287,9 @@ class ForwardButton(discord.ui.Button):
                 embed=embed, ephemeral=True, delete_after=0.1
             )
         current_position = self.player.position
-        await self.player.seek(current_position + (10 * 1000))
+        await self.player.client.node_pool.seek(
+            self.player, current_position + (10 * 1000)
+        )
         embed = discord.Embed(
             title="Трек перемотан на 10 секунд вперед", color=discord.Color.green()
         )
@@ -288,6 +302,7 @@ class VolumeUpButton(discord.ui.Button):
     def __init__(self, player: wavelink.Player):
         super().__init__(
             style=discord.ButtonStyle.primary,
+            custom_id="current_track:volume_up",
             emoji="🔊",
         )
         self.player = player
@@ -295,14 +310,16 @@ class VolumeUpButton(discord.ui.Button):
     async def callback(self, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True, invisible=True)
         if self.player.volume >= 990:
-            await self.player.set_volume(1000)
+            await self.player.client.node_pool.set_volume(self.player, 1000)
             embed = discord.Embed(
                 title="Максимальная громкость установлена", color=discord.Color.red()
             )
             return await interaction.followup.send(
                 embed=embed, ephemeral=True, delete_after=0.1
             )
-        await self.player.set_volume(self.player.volume + 10)
+        await self.player.client.node_pool.set_volume(
+            self.player, self.player.volume + 10
+        )
         embed = discord.Embed(
             title=f"Громкость увеличена до {self.player.volume}",
             color=discord.Color.green(),
@@ -316,6 +333,7 @@ class VolumeDownButton(discord.ui.Button):
     def __init__(self, player: wavelink.Player):
         super().__init__(
             style=discord.ButtonStyle.primary,
+            custom_id="current_track:volume_down",
             emoji="🔉",
         )
         self.player = player
@@ -323,12 +341,14 @@ class VolumeDownButton(discord.ui.Button):
     async def callback(self, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True, invisible=True)
         if self.player.volume <= 10:
-            await self.player.set_volume(0)
+            await self.player.client.node_pool.set_volume(self.player, 0)
             embed = discord.Embed(title="Звук выключен", color=discord.Color.green())
             return await interaction.followup.send(
                 embed=embed, ephemeral=True, delete_after=0.1
             )
-        await self.player.set_volume(self.player.volume - 10)
+        await self.player.client.node_pool.set_volume(
+            self.player, self.player.volume - 10
+        )
         embed = discord.Embed(
             title=f"Громкость уменьшена до {self.player.volume}",
             color=discord.Color.green(),
@@ -342,6 +362,7 @@ class EqualizerPresetButton(discord.ui.Button):
     def __init__(self, player: wavelink.Player):
         super().__init__(
             style=discord.ButtonStyle.primary,
+            custom_id="current_track:equalizer",
             emoji="🎶",
         )
         self.player = player
@@ -435,7 +456,7 @@ class EqualizerPresetDropdown(discord.ui.Select):
         if preset.low_pass:
             filters.low_pass.set(smoothing=preset.low_pass)
 
-        await self.player.set_filters(filters, seek=True)
+        await self.player.client.node_pool.set_filters(self.player, filters, seek=True)
         embed = discord.Embed(
             title=f"Пресет {preset.name} {preset.emoji} установлен",
             color=discord.Color.green(),
@@ -0,0 +1,92 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Awaitable, Callable, Dict, Optional
+
+import discord
+
+MESSAGE_UPDATE_WINDOW = float(os.environ.get("MESSAGE_UPDATE_WINDOW", 0.5))
+
+_logger = logging.getLogger("views.message_updater")
+
+
+def _fingerprint(fields: dict) -> str:
+    """Строка, по которой сравниваются два состояния сообщения"""
+    embed = fields.get("embed")
+    view = fields.get("view")
+    payload = {
+        "embed": embed.to_dict() if embed else None,
+        "components": view.to_components() if view else [],
+    }
+    return json.dumps(payload, sort_keys=True, default=str)
+
+
+class MessageUpdater:
+    """
+    Планировщик обновлений одного сообщения.
+
+    Все запросы на обновление в пределах окна объединяются в одно редактирование с последним состоянием,
+    а редактирование, не меняющее сообщение, пропускается
+    """
+
+    requested = 0
+    sent = 0
+    skipped = 0
+
+    def __init__(
+        self,
+        edit: Callable[..., Awaitable],
+        window: float = MESSAGE_UPDATE_WINDOW,
+    ):
+        self._edit = edit
+        self._window = window
+        self._render: Optional[Callable[[], Awaitable[dict]]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._last_fingerprint: Optional[str] = None
+
+    def request(self, render: Callable[[], Awaitable[dict]]):
+        """
+        Запрашивает обновление сообщения. Вызывается без ожидания, само редактирование выполнится позже
+
+        :param render: Корутина-функция, возвращающая аргументы для message.edit
+        """
+        MessageUpdater.requested += 1
+        self._render = render
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush())
+
+    async def _flush(self):
+        while self._render is not None:
+            await asyncio.sleep(self._window)
+            render, self._render = self._render, None
+            try:
+                fields = await render()
+                fingerprint = _fingerprint(fields)
+                if fingerprint == self._last_fingerprint:
+                    MessageUpdater.skipped += 1
+                    continue
+                await self._edit(**fields)
+            except discord.HTTPException as e:
+                _logger.warning(f"Failed to update message: {e}")
+                self._last_fingerprint = None
+                continue
+            except Exception:
+                _logger.exception("Failed to render message update")
+                continue
+            MessageUpdater.sent += 1
+            self._last_fingerprint = fingerprint
+
+    def cancel(self):
+        if self._task is not None:
+            self._task.cancel()
+        self._render = None
+
+    @classmethod
+    def stats(cls) -> Dict[str, int]:
+        return {
+            "requested": cls.requested,
+            "sent": cls.sent,
+            "skipped": cls.skipped,
+            "saved": cls.requested - cls.sent,
+        }
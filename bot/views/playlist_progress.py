@@ -0,0 +1,54 @@
+import discord
+
+
+class PlaylistProgress(discord.ui.View):
+    """Прогресс добавления большого плейлиста в очередь с кнопкой отмены"""
+
+    def __init__(self, name: str, total: int):
+        super().__init__(timeout=None)
+        self.name = name
+        self.total = total
+        self.added = 0
+        self.cancelled = False
+
+    async def render(self) -> dict:
+        if self.cancelled:
+            embed = discord.Embed(
+                title="Добавление плейлиста отменено",
+                description=f"**{self.name}**\nДобавлено {self.added} из {self.total} треков",
+                color=discord.Color.red(),
+            )
+            return {"embed": embed, "view": None}
+        if self.added >= self.total:
+            embed = discord.Embed(
+                title="Плейлист добавлен в очередь",
+                description=f"**{self.name}**\nДобавлено {self.added} треков",
+                color=discord.Color.green(),
+            )
+            return {"embed": embed, "view": None}
+        if self.is_finished():
+            # сессия закрылась или добавление упало
+            embed = discord.Embed(
+                title="Добавление плейлиста прервано",
+                description=f"**{self.name}**\nДобавлено {self.added} из {self.total} треков",
+                color=discord.Color.red(),
+            )
+            return {"embed": embed, "view": None}
+        embed = discord.Embed(
+            title="Плейлист добавляется в очередь",
+            description=f"**{self.name}**\nДобавлено {self.added} из {self.total} треков",
+            color=discord.Color.blurple(),
+        )
+        return {"embed": embed, "view": self}
+
+    @discord.ui.button(
+        label="Отменить",
+        style=discord.ButtonStyle.red,
+        custom_id="playlist_progress:cancel",
+    )
+    async def cancel_button(
+        self, button: discord.ui.Button, interaction: discord.Interaction
+    ):
+        await interaction.response.defer()
+        self.cancelled = True
+        self.stop()
@@ -0,0 +1,112 @@
+import math
+import os
+from collections import OrderedDict
+from collections.abc import Sequence
+from typing import Optional
+
+import discord
+import wavelink
+
+from utils import seconds_to_duration
+
+QUEUE_PAGE_SIZE = 5
+QUEUE_PAGE_CACHE = int(os.environ.get("QUEUE_PAGE_CACHE", 8))
+QUEUE_BANNER_URL = "https://assets.shandy-dev.ru/playlist_fununa-nun_banner.webp"
+
+
+class QueuePages(Sequence):
+    """
+    Ленивый источник страниц для пагинатора очереди.
+
+    Страница отрисовывается только когда к ней переходят, последние отрисованные страницы хранятся в LRU.
+    При изменении очереди сбрасываются только страницы, начиная с первой измененной позиции,
+    у остальных обновляются лишь заголовок и подпись
+    """
+
+    def __init__(
+        self,
+        player: wavelink.Player,
+        page_size: int = QUEUE_PAGE_SIZE,
+        cache_size: int = QUEUE_PAGE_CACHE,
+    ):
+        self.player = player
+        self.page_size = page_size
+        self.cache_size = cache_size
+        # версия очереди и текущий трек, для которых отрисованы страницы
+        self.version: int = player.queue.version
+        self._current: Optional[wavelink.Playable] = player.current
+        self._rendered: OrderedDict[int, discord.Embed] = OrderedDict()
+
+    def __len__(self) -> int:
+        return max(math.ceil(len(self.player.queue) / self.page_size), 1)
+
+    def __getitem__(self, number):
+        if isinstance(number, slice):
+            return [self[index] for index in range(*number.indices(len(self)))]
+        if number < 0:
+            number += len(self)
+        if not 0 <= number < len(self):
+            raise IndexError("queue page index out of range")
+
+        embed = self._rendered.get(number)
+        if embed is not None:
+            self._rendered.move_to_end(number)
+            return embed
+        embed = self._render_page(number)
+        self._rendered[number] = embed
+        if len(self._rendered) > self.cache_size:
+            self._rendered.popitem(last=False)
+        return embed
+
+    def _describe_current(self) -> str:
+        current = self.player.current
+        if not current:
+            return "Сейчас ничего не играет"
+        return (
+            f"**Сейчас играет**\n"
+            f"Название: **{current.title}**\n"
+            f"Автор: **{current.author}**\n"
+            f"Продолжительность: **{seconds_to_duration(current.length // 1000)}**"
+        )
+
+    def _decorate(self, embed: discord.Embed):
+        embed.description = self._describe_current()
+        embed.set_footer(text=f"Всего треков в очереди: {len(self.player.queue)}")
+
+    def _render_page(self, number: int) -> discord.Embed:
+        queue = self.player.queue
+        if not queue:
+            return discord.Embed(title="Очередь пуста", color=discord.Color.red())
+
+        embed = discord.Embed(title="Очередь треков", color=discord.Color.blurple())
+        embed.set_image(url=QUEUE_BANNER_URL)
+        self._decorate(embed)
+        offset = number * self.page_size
+        for index, track in enumerate(queue[offset : offset + self.page_size]):
+            embed.add_field(
+                name=f"Трек {offset + index + 1}",
+                value=f"Название: **{track.title}**\nАвтор: **{track.author}**\nПродолжительность: **{seconds_to_duration(track.length // 1000)}**",
+                inline=False,
+            )
+        return embed
+
+    def refresh(self) -> bool:
+        """
+        Сбрасывает страницы, затронутые изменениями очереди
+
+        :return: True, если страницы изменились
+        """
+        queue = self.player.queue
+        current_changed = self.player.current is not self._current
+        if self.version == queue.version and not current_changed:
+            return False
+
+        first_page = queue.changed_from(self.version) // self.page_size
+        for number in [number for number in self._rendered if number >= first_page]:
+            del self._rendered[number]
+        for embed in self._rendered.values():
+            self._decorate(embed)
+
+        self.version = queue.version
+        self._current = self.player.current
+        return True
@@ -51,11 +51,13 @@ class SearchButton(discord.ui.Button):
 
     async def callback(self, interaction: discord.ApplicationContext) -> None:
         await interaction.response.defer(ephemeral=True)
-        self.track.extras = {"requester": interaction.user.id}
+        self.track.extras = self.player.client.requesters.extras_for(interaction.user)
         await self.player.queue.put_wait(self.track)
         embed = discord.Embed(
             title="Трек добавлен в очередь", color=discord.Color.green()
         )
         await send_temporary_message(interaction, embed)
         if not self.player.current:
-            await self.player.play(await self.player.queue.get_wait())
+            await self.player.client.node_pool.play(
+                self.player, await self.player.queue.get_wait()
+            )
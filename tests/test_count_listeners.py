@@ -0,0 +1,111 @@
+import unittest
+
+import discord
+
+from utils import count_listeners
+
+BOT_ID = 1000
+GUILD_ID = 2000
+CHANNEL_ID = 2001
+
+
+def _user(user_id: int, bot: bool = False) -> dict:
+    return {
+        "id": str(user_id),
+        "username": f"user{user_id}",
+        "discriminator": "0",
+        "avatar": None,
+        "bot": bot,
+    }
+
+
+def _voice_state(user_id: int) -> dict:
+    return {
+        "user_id": str(user_id),
+        "channel_id": str(CHANNEL_ID),
+        "session_id": f"session-{user_id}",
+        "deaf": False,
+        "mute": False,
+        "self_deaf": False,
+        "self_mute": False,
+        "self_video": False,
+        "suppress": False,
+        "request_to_speak_timestamp": None,
+    }
+
+
+def _guild(members: list, voice_user_ids: list) -> discord.Guild:
+    """Сервер в том виде, в котором он приходит без intent участников"""
+    client = discord.Client(intents=discord.Intents(guilds=True, voice_states=True))
+    state = client._connection
+    state.user = discord.ClientUser(state=state, data=_user(BOT_ID, bot=True))
+    return discord.Guild(
+        state=state,
+        data={
+            "id": str(GUILD_ID),
+            "name": "Сервер",
+            "owner_id": "1",
+            "roles": [],
+            "emojis": [],
+            "stickers": [],
+            "features": [],
+            "channels": [
+                {
+                    "id": str(CHANNEL_ID),
+                    "type": 2,
+                    "name": "Голосовой",
+                    "position": 0,
+                    "bitrate": 64000,
+                    "user_limit": 0,
+                    "permission_overwrites": [],
+                }
+            ],
+            "members": [
+                {
+                    "user": user,
+                    "roles": [],
+                    "joined_at": None,
+                    "deaf": False,
+                    "mute": False,
+                }
+                for user in members
+            ],
+            "voice_states": [_voice_state(user_id) for user_id in voice_user_ids],
+        },
+    )
+
+
+class CountListenersTest(unittest.TestCase):
+    def test_uncached_members_are_listeners(self):
+        guild = _guild([_user(BOT_ID, bot=True)], [BOT_ID, 1, 2])
+        channel = guild.get_channel(CHANNEL_ID)
+        # в кэше только бот, поэтому members не видит слушателей
+        self.assertEqual([member.id for member in channel.members], [BOT_ID])
+        self.assertEqual(len(channel.voice_states), 3)
+        self.assertEqual(count_listeners(channel, BOT_ID), 2)
+
+    def test_only_bot_in_channel(self):
+        guild = _guild([_user(BOT_ID, bot=True)], [BOT_ID])
+        self.assertEqual(count_listeners(guild.get_channel(CHANNEL_ID), BOT_ID), 0)
+
+    def test_cached_bots_are_not_listeners(self):
+        guild = _guild([_user(BOT_ID, bot=True)], [BOT_ID, 3])
+        # другой бот в кэше, например после взаимодействия
+        guild._add_member(
+            discord.Member(
+                data={"user": _user(3, bot=True), "roles": []},
+                guild=guild,
+                state=guild._state,
+            )
+        )
+        self.assertEqual(count_listeners(guild.get_channel(CHANNEL_ID), BOT_ID), 0)
+
+    def test_empty_member_cache(self):
+        guild = _guild([], [1])
+        channel = guild.get_channel(CHANNEL_ID)
+        self.assertEqual(channel.members, [])
+        self.assertEqual(count_listeners(channel, BOT_ID), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
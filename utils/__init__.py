@@ -2,3 +2,4 @@ from .time import *
 from .discord import *
 from .words import *
 from .units import *
+from .cache import *
@@ -0,0 +1,113 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+__all__ = ("TTLCache",)
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    LRU-кэш с ограничением по времени жизни записей, количеству записей и занимаемой памяти.
+
+    Размер записи оценивается функцией ``sizeof``; если она не задана, каждая запись считается размером 1.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: float = 600,
+        max_memory: Optional[int] = None,
+        sizeof: Callable[[Any], int] = None,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_memory = max_memory
+        self._sizeof = sizeof or (lambda value: 1)
+        # key -> (expires_at, size, value)
+        self._data: "OrderedDict[Hashable, Tuple[float, int, Any]]" = OrderedDict()
+        self.memory = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING, count=False) is not _MISSING
+
+    def get(self, key: Hashable, default: Any = None, count: bool = True) -> Any:
+        """
+        Возвращает значение по ключу и переносит запись в конец очереди вытеснения
+
+        :param key: Ключ
+        :param default: Значение, если ключа нет или запись устарела
+        :param count: Учитывать ли обращение в статистике попаданий и промахов
+
+        :return: Значение из кэша или default
+        """
+        entry = self._data.get(key)
+        if entry is not None and entry[0] < time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            entry = None
+        if entry is None:
+            if count:
+                self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        if count:
+            self.hits += 1
+        return entry[2]
+
+    def set(self, key: Hashable, value: Any, ttl: float = None):
+        """
+        Кладет значение в кэш, вытесняя самые старые записи при превышении лимитов
+
+        :param key: Ключ
+        :param value: Значение
+        :param ttl: Время жизни записи в секундах, по умолчанию ttl кэша
+        """
+        size = self._sizeof(value)
+        if self.max_memory is not None and size > self.max_memory:
+            return
+        if key in self._data:
+            self._remove(key)
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires_at, size, value)
+        self.memory += size
+        while len(self._data) > self.maxsize or (
+            self.max_memory is not None and self.memory > self.max_memory
+        ):
+            oldest = next(iter(self._data))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        self._remove(key)
+        return entry[2]
+
+    def clear(self):
+        self._data.clear()
+        self.memory = 0
+
+    def _remove(self, key: Hashable):
+        _, size, _ = self._data.pop(key)
+        self.memory -= size
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики кэша для вывода в статусе"""
+        return {
+            "entries": len(self._data),
+            "memory": self.memory,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
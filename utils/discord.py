@@ -1,15 +1,68 @@
-import asyncio
-
 import discord
 from discord import Route
 
 
+def schedule_deletion(
+    interaction: discord.Interaction,
+    timeout: float,
+    message: discord.Message = None,
+):
+    """
+    Планирует удаление сообщения, отправленного в ответ на взаимодействие, не дожидаясь его
+
+    :param interaction: Взаимодействие или контекст команды
+    :param timeout: Через сколько секунд удалить сообщение
+    :param message: Сообщение, без него удаляется первоначальный ответ на взаимодействие
+    """
+    interaction = getattr(interaction, "interaction", interaction)
+    deletions = getattr(interaction.client, "deletions", None)
+    if deletions is None:
+        # клиент без планировщика удалений
+        if message is not None:
+            interaction.client.loop.create_task(message.delete(delay=timeout))
+        else:
+            interaction.client.loop.create_task(
+                interaction.delete_original_response(delay=timeout)
+            )
+        return
+    deletions.schedule(
+        timeout,
+        message.channel.id if message is not None else interaction.channel_id,
+        message.id if message is not None else None,
+        interaction.guild_id,
+        interaction=interaction,
+    )
+
+
+def count_listeners(channel: discord.VoiceChannel, bot_id: int) -> int:
+    """
+    Считает слушателей в голосовом канале по голосовым состояниям.
+
+    Без intent участников кэш не содержит тех, кто зашел в канал до запуска бота,
+    и channel.members неполон, а голосовые состояния приходят всегда
+
+    :param channel: Голосовой канал
+    :param bot_id: Идентификатор бота, который не считается слушателем
+
+    :return: Количество пользователей в канале, кроме ботов
+    """
+    listeners = 0
+    for user_id in channel.voice_states:
+        if user_id == bot_id:
+            continue
+        # о пользователях не из кэша неизвестно, боты ли они, поэтому они считаются слушателями
+        member = channel.guild.get_member(user_id)
+        if member is not None and member.bot:
+            continue
+        listeners += 1
+    return listeners
+
+
 async def send_temporary_message(
     interaction: discord.ApplicationContext, embed: discord.Embed, timeout: float = 5
 ):
     message = await interaction.followup.send(embed=embed, wait=True)
-    await asyncio.sleep(timeout)
-    await message.delete()
+    schedule_deletion(interaction, timeout, message)
 
 
 async def respond_or_followup(
@@ -26,15 +79,14 @@ async def respond_or_followup(
             ephemeral=ephemeral,
             wait=True,
         )
-        await asyncio.sleep(timeout)
-        await message.delete()
+        schedule_deletion(interaction, timeout, message)
     else:
         await interaction.response.send_message(
             embed=embed,
             view=view,
             ephemeral=ephemeral,
-            delete_after=timeout,
         )
+        schedule_deletion(interaction, timeout)
 
 
 async def set_voice_status(channel_id: int, bot: discord.Bot, status: str = None):